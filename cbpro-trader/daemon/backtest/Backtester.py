@@ -0,0 +1,141 @@
+import talib
+import numpy as np
+from strategy import Strategy
+
+# Both sides of a round trip pay this fee, as assumed by calculate_bep and
+# calculate_sell_point in IndicatorSubsystem
+FEE = 0.005
+
+
+class Backtester:
+    # Replays a Period's candles through the rules of a strategy.Strategy, the
+    # same ones TradeEngine.determine_trades trades on. Indicators are
+    # computed in one TA-Lib pass and the rules evaluated over whole arrays.
+    # Only entering and exiting depend on the open position, so the
+    # simulation jumps from signal to signal instead of stepping through
+    # every candle.
+    def __init__(self, backtest_period, fiat_balance=1000.0, fee=FEE, strategy=None):
+        self.period = backtest_period
+        self.fiat_balance = fiat_balance
+        self.fee = fee
+        self.strategy = strategy if strategy is not None else Strategy()
+
+    def calculate_indicators(self):
+        # Every candle's value of the indicators IndicatorSubsystem keeps up to
+        # date, as one array each
+        closes = self.period.get_closing_prices()
+        volumes = self.period.get_volumes()
+        sma = talib.SMA(closes, timeperiod=9)
+        bband_upper_1, bband_middle_1, bband_lower_1 = talib.BBANDS(closes, timeperiod=20, nbdevup=1, nbdevdn=1, matype=0)
+        bband_upper_2, bband_middle_2, bband_lower_2 = talib.BBANDS(closes, timeperiod=20, nbdevup=2, nbdevdn=2, matype=0)
+        vol_macd, vol_macd_sig, vol_macd_hist = talib.MACD(volumes, fastperiod=50, slowperiod=200, signalperiod=14)
+        stochrsi_fastk, stochrsi_fastd = talib.STOCHRSI(closes, timeperiod=14, fastk_period=3, fastd_period=3, fastd_matype=0)
+        return {
+            'close': closes,
+            'total_periods': np.arange(1, len(closes) + 1, dtype=float),
+            'sma': sma,
+            'sma_trend': np.concatenate(([np.nan], np.diff(sma))),
+            'avg_volume': talib.SMA(volumes, timeperiod=15),
+            'bband_upper_1': bband_upper_1,
+            'bband_lower_1': bband_lower_1,
+            'bband_upper_2': bband_upper_2,
+            'bband_lower_2': bband_lower_2,
+            'vol_macd': vol_macd,
+            'vol_macd_sig': vol_macd_sig,
+            'vol_macd_hist': vol_macd_hist,
+            'stochrsi_fastk': stochrsi_fastk,
+            'stochrsi_fastd': stochrsi_fastd,
+            # bep() in IndicatorSubsystem reduces to close / (1 - fee)^2 for any balance
+            'bep': closes / (1 - self.fee) ** 2,
+        }
+
+    def calculate_signals(self, indicators):
+        # Buy signal of every candle. Nothing was bought yet when looking for
+        # an entry, so the values depending on the last purchase are NaN
+        missing = set(self.strategy.names) - set(indicators) - {'sell_point', 'last_buy_price'}
+        if missing:
+            raise ValueError("Backtester can't calculate %s" % ", ".join(sorted(missing)))
+        values = dict(indicators, sell_point=np.nan, last_buy_price=np.nan)
+        return np.broadcast_to(self.strategy.buy.evaluate(values), indicators['close'].shape)
+
+    def sell_point(self, entry_price):
+        # calculate_sell_point: cost including the taker fee over the coins
+        # bought, less the fee of selling them
+        return entry_price * (1 + self.fee) / (1 - self.fee)
+
+    def find_exit(self, entry_idx, entry_price, indicators, buy):
+        # First candle after entry where the sell rule fires and the buy rule
+        # doesn't, with sell_point and last_buy_price of this purchase.
+        # Searched in growing chunks so long holds don't rescan the whole
+        # remaining history.
+        close = indicators['close']
+        start = entry_idx + 1
+        chunk = 256
+        while start < len(close):
+            end = min(start + chunk, len(close))
+            values = {name: series[start:end] for name, series in indicators.items()}
+            values['last_buy_price'] = entry_price
+            values['sell_point'] = self.sell_point(entry_price)
+            sell = ~buy[start:end] & self.strategy.sell.evaluate(values)
+            hits = np.flatnonzero(sell)
+            if len(hits):
+                return start + hits[0]
+            start = end
+            chunk *= 4
+        return None
+
+    def run(self):
+        indicators = self.calculate_indicators()
+        close = indicators['close']
+        times = self.period.candlesticks.times
+        buy = self.calculate_signals(indicators)
+        buy_indices = np.flatnonzero(buy)
+
+        fiat = self.fiat_balance
+        trades = []
+        equity = np.full(len(close), fiat)
+        position_idx = 0
+        while True:
+            next_buy = np.searchsorted(buy_indices, position_idx)
+            if next_buy >= len(buy_indices):
+                break
+            entry_idx = buy_indices[next_buy]
+            entry_price = close[entry_idx]
+            coins = fiat * (1 - self.fee) / entry_price
+            exit_idx = self.find_exit(entry_idx, entry_price, indicators, buy)
+            hold_end = exit_idx if exit_idx is not None else len(close)
+            # Marked to market, net of the fee a market sell would pay
+            equity[entry_idx:hold_end] = coins * close[entry_idx:hold_end] * (1 - self.fee)
+            if exit_idx is None:
+                trades.append({'entry_time': int(times[entry_idx]), 'entry_price': float(entry_price),
+                               'exit_time': None, 'exit_price': None, 'pnl': None})
+                fiat = coins * close[-1] * (1 - self.fee)
+                break
+            exit_price = close[exit_idx]
+            new_fiat = coins * exit_price * (1 - self.fee)
+            trades.append({'entry_time': int(times[entry_idx]), 'entry_price': float(entry_price),
+                           'exit_time': int(times[exit_idx]), 'exit_price': float(exit_price),
+                           'pnl': new_fiat - fiat})
+            fiat = new_fiat
+            equity[exit_idx:] = fiat
+            position_idx = exit_idx + 1
+
+        return self.report(trades, equity, close)
+
+    def report(self, trades, equity, close):
+        closed_trades = [trade for trade in trades if trade['pnl'] is not None]
+        final_equity = float(equity[-1]) if len(equity) else self.fiat_balance
+        peaks = np.maximum.accumulate(equity) if len(equity) else equity
+        drawdowns = (peaks - equity) / peaks if len(equity) else equity
+        return {
+            'candles': len(close),
+            'trades': len(trades),
+            'winning_trades': sum(1 for trade in closed_trades if trade['pnl'] > 0),
+            'losing_trades': sum(1 for trade in closed_trades if trade['pnl'] <= 0),
+            'starting_balance': self.fiat_balance,
+            'final_balance': final_equity,
+            'return_pct': (final_equity / self.fiat_balance - 1) * 100,
+            'buy_and_hold_pct': (close[-1] / close[0] - 1) * 100 if len(close) else 0.0,
+            'max_drawdown_pct': float(drawdowns.max()) * 100 if len(equity) else 0.0,
+            'trade_log': trades,
+        }
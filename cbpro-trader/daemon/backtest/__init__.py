@@ -0,0 +1,2 @@
+from .Backtester import Backtester
+from .loaders import load_candles_csv, load_indicator_log_csv, load_journal_candles, load_period
\ No newline at end of file
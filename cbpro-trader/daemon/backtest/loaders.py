@@ -0,0 +1,76 @@
+import csv
+import datetime
+import numpy as np
+import period
+import storage
+
+# Column order of CBPRO historic rates, also used by CandleBuffer
+CANDLE_COLUMNS = ('time', 'low', 'high', 'open', 'close', 'volume')
+# Offsets for the zone names MongoConnection.get_time writes
+TIMEZONE_OFFSETS = {'PDT': -7, 'PST': -8, 'UTC': 0, 'GMT': 0}
+
+
+def load_candles_csv(path):
+    # OHLCV candles, either with a header naming the columns or headerless in
+    # CBPRO historic rates order (time, low, high, open, close, volume)
+    with open(path) as csv_file:
+        first_line = csv_file.readline()
+    has_header = any(character.isalpha() for character in first_line)
+    data = np.genfromtxt(path, delimiter=',', skip_header=1 if has_header else 0, dtype='f8', ndmin=2)
+    if has_header:
+        header = [name.strip().lower() for name in first_line.split(',')]
+        if 'time' not in header and 'timestamp' in header:
+            header[header.index('timestamp')] = 'time'
+        columns = [header.index(name) for name in CANDLE_COLUMNS]
+    else:
+        columns = range(len(CANDLE_COLUMNS))
+    data = data[np.argsort(data[:, columns[0]], kind='stable')]
+    return {name: data[:, column] for name, column in zip(CANDLE_COLUMNS, columns)}
+
+
+def load_journal_candles(directory, product, period_name, start_day=None, end_day=None):
+    # Closed candles of a period from a storage.TradeJournal directory,
+    # days given as YYYY-MM-DD
+    candles = storage.JournalReader(directory).read_candles(product, period_name, start_day, end_day)
+    return {name: candles[name].astype('f8') for name in CANDLE_COLUMNS}
+
+
+def parse_log_time(log_time):
+    # Times written by MongoConnection.get_time, e.g. 04/30/2021 20:14:34 PDT
+    date, zone = log_time.rsplit(' ', 1)
+    parsed = datetime.datetime.strptime(date, '%m/%d/%Y %H:%M:%S')
+    offset = datetime.timezone(datetime.timedelta(hours=TIMEZONE_OFFSETS.get(zone, 0)))
+    return parsed.replace(tzinfo=offset).timestamp()
+
+
+def load_indicator_log_csv(path, period_size=60):
+    # Rebuilds candles from the close prices in an indicator_log export such as
+    # test_logs/4-30-21-test.csv. These exports carry no volume.
+    with open(path) as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    times = np.array([parse_log_time(row['time']) for row in rows])
+    closes = np.array([float(row['close']) for row in rows])
+    order = np.argsort(times, kind='stable')
+    return resample_prices(times[order], closes[order], period_size)
+
+
+def resample_prices(times, prices, period_size):
+    buckets = (times // period_size).astype('i8') * period_size
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)]
+    return {
+        'time': buckets[starts].astype('f8'),
+        'low': np.minimum.reduceat(prices, starts),
+        'high': np.maximum.reduceat(prices, starts),
+        'open': prices[starts],
+        'close': prices[ends - 1],
+        'volume': np.zeros(len(starts)),
+    }
+
+
+def load_period(candles, period_size=60, name='Backtest', product='BTC-USD'):
+    # Period backed by the given candles, without fetching any history
+    backtest_period = period.Period(period_size=period_size, name=name, product=product,
+                                    initialize=False, max_candles=max(len(candles['time']), 1))
+    backtest_period.candlesticks.load(*(candles[column] for column in CANDLE_COLUMNS))
+    return backtest_period
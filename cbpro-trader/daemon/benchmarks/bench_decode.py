@@ -0,0 +1,120 @@
+#
+# bench_decode.py
+#
+# Feeds the same match/heartbeat stream through N periods, before and after
+# the decoding stage. Before: each message is a dict, a Trade is built and the
+# time parsed with dateutil inside every Period, as the daemon used to do.
+# After: the websocket decodes each message once and every Period consumes the
+# decoded event. Both sides run the real Period and Candlestick code.
+#
+# Run from the daemon directory: python3 benchmarks/bench_decode.py
+
+import os
+import sys
+import time
+import random
+import datetime
+import dateutil.parser
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import period
+import trade
+
+PERIOD_SIZES = (60, 300, 900, 1800, 3600, 7200, 14400, 21600, 43200, 86400, 180, 600)
+
+
+class LegacyTrade:
+    # Trade as it was before decoding, parsed again by every Period
+    def __init__(self, msg):
+        self.seq = int(msg.get('sequence'))
+        self.trade_id = int(msg.get('trade_id'))
+        self.time = dateutil.parser.parse(msg.get('time'))
+        self.epoch = self.time.timestamp()
+        self.price = float(msg.get('price'))
+        self.volume = float(msg.get('size'))
+
+
+class LegacyPeriod(period.Period):
+    def process_heartbeat(self, msg):
+        isotime = dateutil.parser.parse(msg.get('time'))
+        if isotime - self.cur_candlestick_start > datetime.timedelta(seconds=self.period_size):
+            self.close_candlestick()
+            self.new_candlestick(self.cur_candlestick.time + datetime.timedelta(seconds=self.period_size))
+
+    def process_trade(self, msg):
+        if msg.get('product_id') == self.product:
+            cur_trade = LegacyTrade(msg)
+            isotime = dateutil.parser.parse(msg.get('time')).replace(microsecond=0)
+            if isotime < self.cur_candlestick.time:
+                prev_stick = period.Candlestick(existing_candlestick=self.candlesticks.pop())
+                prev_stick.add_trade(cur_trade)
+                self.add_stick(prev_stick)
+            else:
+                if isotime > self.cur_candlestick.time + datetime.timedelta(seconds=self.period_size):
+                    self.close_candlestick()
+                    self.new_candlestick(self.cur_candlestick.time + datetime.timedelta(seconds=self.period_size))
+                self.cur_candlestick.add_trade(cur_trade)
+                self.cur_candlestick.print_stick(self.name)
+
+
+def make_messages(count):
+    messages = []
+    for i in range(count):
+        stamp = "2021-04-30T%02d:%02d:%02d.%06dZ" % (i // 3600, (i // 60) % 60, i % 60, random.randint(0, 999999))
+        if i % 20 == 0:
+            messages.append({'type': 'heartbeat', 'sequence': i, 'last_trade_id': i,
+                             'product_id': 'BTC-USD', 'time': stamp})
+        else:
+            messages.append({'type': 'match', 'trade_id': i, 'sequence': i, 'side': 'buy',
+                             'size': '0.01', 'price': '%.2f' % (58000 + random.random() * 100),
+                             'product_id': 'BTC-USD', 'time': stamp})
+    return messages
+
+
+def make_periods(period_class, num_periods):
+    periods = []
+    start = datetime.datetime(2021, 4, 30, tzinfo=pytz.utc)
+    for period_size in PERIOD_SIZES[:num_periods]:
+        new_period = period_class(period_size=period_size, name='BTC%d' % period_size, initialize=False)
+        new_period.cur_candlestick = period.Candlestick(isotime=start, prev_close=58000.0)
+        new_period.cur_candlestick_start = start
+        new_period.cur_candlestick_epoch = start.timestamp()
+        periods.append(new_period)
+    return periods
+
+
+def legacy(messages, periods):
+    for msg in messages:
+        for cur_period in periods:
+            if msg['type'] == 'match':
+                cur_period.process_trade(msg)
+            else:
+                cur_period.process_heartbeat(msg)
+
+
+def decoded(messages, periods):
+    for msg in messages:
+        event = trade.decode_message(msg)
+        for cur_period in periods:
+            if event.type == 'match':
+                cur_period.process_trade(event)
+            else:
+                cur_period.process_heartbeat(event)
+
+
+def run(name, func, messages, periods):
+    start = time.perf_counter()
+    func(messages, periods)
+    elapsed = time.perf_counter() - start
+    rate = len(messages) / elapsed
+    print("%-8s periods=%-3d %10.0f msgs/sec" % (name, len(periods), rate))
+    return rate
+
+
+if __name__ == '__main__':
+    messages = make_messages(20000)
+    for num_periods in (1, 4, 12):
+        before = run('before', legacy, messages, make_periods(LegacyPeriod, num_periods))
+        after = run('after', decoded, messages, make_periods(period.Period, num_periods))
+        print("speedup x%.1f" % (after / before))
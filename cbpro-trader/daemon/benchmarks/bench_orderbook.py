@@ -0,0 +1,149 @@
+#
+# bench_orderbook.py
+#
+# Replays a full channel feed through the order book, before and after the
+# tick based book. Before: cbpro.OrderBook, a SortedDict of Decimal prices
+# holding lists of order dicts, as OrderBookCustom used to extend. After: the
+# current OrderBookCustom. Reports messages/s and the memory held by one book.
+#
+# Run from the daemon directory:
+#   python3 benchmarks/bench_orderbook.py [feed.jsonl]
+# feed.jsonl holds one full channel message per line for a single product,
+# the first line being a level 3 REST snapshot ({"sequence", "bids", "asks"}).
+# Without it a synthetic feed is generated.
+
+import os
+import sys
+import json
+import time
+import random
+import tracemalloc
+import cbpro
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import engine
+
+NUM_MESSAGES = 200000
+NUM_ORDERS = 5000
+
+
+class SnapshotClient:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def get_product_order_book(self, product_id, level):
+        return self.snapshot
+
+
+class LegacyBook(cbpro.OrderBook):
+    def process_message(self, msg):
+        self.on_message(msg)
+
+
+def synthetic_feed(num_messages, num_orders, seed=1):
+    # Orders around a 10000.00 mid price, opened, cancelled, changed and
+    # matched oldest first at the best level, as the exchange does
+    rng = random.Random(seed)
+    levels = {'buy': {}, 'sell': {}}
+    next_id = [0]
+
+    def new_order(side):
+        next_id[0] += 1
+        offset = int(rng.expovariate(0.05)) + 1
+        tick = 1000000 - offset if side == 'buy' else 1000000 + offset
+        order = ['o%d' % next_id[0], '%.2f' % (tick / 100), round(rng.uniform(0.001, 2.0), 8)]
+        levels[side].setdefault(tick, []).append(order)
+        return order
+
+    snapshot = {'sequence': 0, 'bids': [], 'asks': []}
+    for idx in range(num_orders):
+        side = 'buy' if idx % 2 else 'sell'
+        order_id, price, size = new_order(side)
+        snapshot['bids' if side == 'buy' else 'asks'].append([price, '%.8f' % size, order_id])
+    messages = []
+    sequence = 0
+    while len(messages) < num_messages:
+        side = rng.choice(('buy', 'sell'))
+        action = rng.random()
+        sequence += 1
+        if action < 0.4 or not levels[side]:
+            order_id, price, size = new_order(side)
+            messages.append({'type': 'open', 'sequence': sequence, 'order_id': order_id, 'side': side,
+                             'price': price, 'remaining_size': '%.8f' % size})
+            continue
+        if action < 0.55:
+            tick = max(levels[side]) if side == 'buy' else min(levels[side])
+            order = levels[side][tick][0]
+            matched = round(min(order[2], rng.uniform(0.001, 1.0)), 8)
+            messages.append({'type': 'match', 'sequence': sequence, 'maker_order_id': order[0], 'side': side,
+                             'price': order[1], 'size': '%.8f' % matched})
+            order[2] = round(order[2] - matched, 8)
+            if order[2] > 0:
+                continue
+            sequence += 1
+        else:
+            tick = rng.choice(list(levels[side]))
+            order = rng.choice(levels[side][tick])
+            if action < 0.65:
+                order[2] = round(order[2] / 2, 8)
+                messages.append({'type': 'change', 'sequence': sequence, 'order_id': order[0], 'side': side,
+                                 'price': order[1], 'new_size': '%.8f' % order[2]})
+                continue
+        levels[side][tick].remove(order)
+        if not levels[side][tick]:
+            del levels[side][tick]
+        messages.append({'type': 'done', 'sequence': sequence, 'order_id': order[0], 'side': side,
+                         'price': order[1], 'remaining_size': '%.8f' % order[2]})
+    return snapshot, messages
+
+
+def load_feed(path):
+    with open(path) as feed:
+        snapshot = json.loads(feed.readline())
+        return snapshot, [json.loads(line) for line in feed if line.strip()]
+
+
+def replay(make_book, snapshot, messages):
+    book = make_book(SnapshotClient(snapshot))
+    # Builds the book from the snapshot
+    book.process_message({'type': 'received', 'sequence': snapshot['sequence']})
+    start = time.perf_counter()
+    for msg in messages:
+        book.process_message(msg)
+    elapsed = time.perf_counter() - start
+    return book, elapsed
+
+
+def book_memory(make_book, snapshot, messages):
+    tracemalloc.start()
+    book, elapsed = replay(make_book, snapshot, messages)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return book, size
+
+
+def main():
+    if len(sys.argv) > 1:
+        snapshot, messages = load_feed(sys.argv[1])
+    else:
+        snapshot, messages = synthetic_feed(NUM_MESSAGES, NUM_ORDERS)
+    books = (('cbpro.OrderBook', lambda client: LegacyBook(product_id='BTC-USD')),
+             ('OrderBookCustom', lambda client: engine.OrderBookCustom(product_id='BTC-USD', auth_client=client,
+                                                                       tick_size='0.01')))
+    print("%d messages, %d orders in snapshot" % (len(messages), len(snapshot['bids']) + len(snapshot['asks'])))
+    results = []
+    for name, make_book in books:
+        def make(client, make_book=make_book):
+            book = make_book(client)
+            book._client = client
+            return book
+        book, elapsed = replay(make, snapshot, messages)
+        book, size = book_memory(make, snapshot, messages)
+        results.append((book.get_bid(), book.get_ask()))
+        print("%-16s %10.0f msgs/s %8.1f MB per book" % (name, len(messages) / elapsed, size / 1e6))
+    # Both books end on the same prices
+    assert len(set(results)) == 1, results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#
+# bench_replay.py
+#
+# End to end throughput of the daemon: replays a recorded feed through
+# CBProTrader at max speed, offline, and reports messages/s with the time
+# spent per message building candles (process_trade, process_heartbeat),
+# updating books (process_message) and recalculating indicators.
+#
+# Run from the daemon directory:
+#   python3 benchmarks/bench_replay.py [recording_dir [config.yml]]
+# recording_dir holds segments written with record_feed in config.yml.
+# Without it a synthetic BTC-USD/ETH-USD match feed is recorded to a temporary
+# directory. The config defaults to the periods of config.yml.sample.
+
+import os
+import sys
+import time
+import random
+import datetime
+import tempfile
+import importlib.util
+import yaml
+from unittest import mock
+
+DAEMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, DAEMON_DIR)
+import engine
+
+NUM_TRADES = 100000
+
+
+def record_synthetic_feed(directory, num_trades, seed=1):
+    # Matches every 50ms alternating between products, a heartbeat per
+    # product every second
+    rng = random.Random(seed)
+    recorder = engine.FeedRecorder(directory)
+    start = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+    prices = {'BTC-USD': 50000.0, 'ETH-USD': 3000.0}
+    for idx in range(1, num_trades + 1):
+        now = start + datetime.timedelta(milliseconds=idx * 50)
+        product_id = 'BTC-USD' if idx % 2 else 'ETH-USD'
+        prices[product_id] = round(prices[product_id] * (1 + rng.gauss(0, 0.0005)), 2)
+        iso = now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        recorder.clock = now.timestamp
+        recorder.record({'type': 'match', 'trade_id': idx, 'sequence': idx, 'maker_order_id': 'm',
+                         'taker_order_id': 't', 'side': rng.choice(('buy', 'sell')),
+                         'size': '%.8f' % rng.uniform(0.001, 1), 'price': '%.2f' % prices[product_id],
+                         'product_id': product_id, 'time': iso})
+        if idx % 20 == 0:
+            for heartbeat_product in prices:
+                recorder.record({'type': 'heartbeat', 'last_trade_id': idx, 'product_id': heartbeat_product,
+                                 'sequence': idx, 'time': iso})
+    recorder.close()
+    return recorder.messages
+
+
+def load_config(path, recording):
+    with open(path) as ymlfile:
+        config = yaml.load(ymlfile, Loader=yaml.Loader)
+    # Offline, quiet and instrumented
+    config.setdefault('mongo', None)
+    config.update({'replay_feed': recording, 'replay_speed': 0, 'frontend': 'none', 'logging': False,
+                   'live': False, 'metrics': True, 'metrics_interval': 3600, 'record_feed': None})
+    return config
+
+
+def main():
+    config_path = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else os.path.join(DAEMON_DIR, 'config.yml.sample')
+    if len(sys.argv) > 1:
+        recording = sys.argv[1]
+        messages = sum(1 for _ in engine.read_recording(recording))
+    else:
+        recording = tempfile.mkdtemp(prefix='feed-')
+        messages = record_synthetic_feed(recording, NUM_TRADES)
+    config = load_config(config_path, os.path.abspath(recording))
+    if len(sys.argv) <= 1:
+        config['periods'] = [cur_period for cur_period in config['periods'] if cur_period['product'] in ('BTC-USD', 'ETH-USD')]
+
+    spec = importlib.util.spec_from_file_location('cbpro_trader', os.path.join(DAEMON_DIR, 'cbpro-trader.py'))
+    trader_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(trader_module)
+    # error.log goes to a scratch directory, Mongo logging is not part of what is measured
+    os.chdir(tempfile.mkdtemp(prefix='bench-'))
+    with mock.patch('storage.MongoConnection'):
+        trader = trader_module.CBProTrader(config)
+    trader.logger.setLevel('WARNING')
+
+    start = time.perf_counter()
+    trader.start()
+    elapsed = time.perf_counter() - start
+
+    print("%d messages in %.1fs, %.0f msgs/s" % (messages, elapsed, messages / elapsed))
+    for stage, summary in sorted(trader.metrics.snapshot()['stages'].items()):
+        # Lag is exchange time to handling, meaningless for a replay
+        if summary['count'] and stage != 'lag':
+            print("%-24s count: %8d p50: %6dus p99: %6dus max: %8dus" %
+                  (stage, summary['count'], summary['p50'], summary['p99'], summary['max']))
+
+
+if __name__ == '__main__':
+    main()
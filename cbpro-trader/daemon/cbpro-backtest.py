@@ -0,0 +1,60 @@
+#
+# cbpro-backtest.py
+#
+# Replays recorded candles through the trading rules and prints a PnL report
+
+import argparse
+import datetime
+import yaml
+import backtest
+import strategy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the trading rules on recorded data")
+    parser.add_argument('path', help="CSV of OHLCV candles, an indicator_log export with --indicator-log "
+                                     "or a journal directory with --journal")
+    parser.add_argument('--indicator-log', action='store_true', help="Rebuild candles from an indicator_log export")
+    parser.add_argument('--journal', metavar='PERIOD', help="Load the closed candles of this period from a journal")
+    parser.add_argument('--product', default='BTC-USD', help="Product of the journaled period")
+    parser.add_argument('--start', help="First journal day, YYYY-MM-DD")
+    parser.add_argument('--end', help="Last journal day, YYYY-MM-DD")
+    parser.add_argument('--length', type=int, default=1, help="Period length in minutes")
+    parser.add_argument('--balance', type=float, default=1000.0, help="Starting fiat balance")
+    parser.add_argument('--trades', action='store_true', help="Print every trade")
+    parser.add_argument('--config', help="Trade on the strategy rules of this config.yml instead of the defaults")
+    args = parser.parse_args()
+
+    period_size = 60 * args.length
+    if args.journal:
+        candles = backtest.load_journal_candles(args.path, args.product, args.journal, args.start, args.end)
+    elif args.indicator_log:
+        candles = backtest.load_indicator_log_csv(args.path, period_size=period_size)
+    else:
+        candles = backtest.load_candles_csv(args.path)
+    backtest_period = backtest.load_period(candles, period_size=period_size)
+    strategy_config = None
+    if args.config:
+        with open(args.config, 'r') as ymlfile:
+            strategy_config = yaml.load(ymlfile, Loader=yaml.Loader).get('strategy')
+    rules = strategy.Strategy.from_config(strategy_config)
+    report = backtest.Backtester(backtest_period, fiat_balance=args.balance, strategy=rules).run()
+
+    print("Candles:          %d" % report['candles'])
+    print("Trades:           %d (%d won, %d lost)" % (report['trades'], report['winning_trades'], report['losing_trades']))
+    print("Final balance:    %.2f (%.2f%%)" % (report['final_balance'], report['return_pct']))
+    print("Buy and hold:     %.2f%%" % report['buy_and_hold_pct'])
+    print("Max drawdown:     %.2f%%" % report['max_drawdown_pct'])
+    if args.trades:
+        for trade in report['trade_log']:
+            entry_time = datetime.datetime.utcfromtimestamp(trade['entry_time'])
+            if trade['exit_time'] is None:
+                print("%s BUY %.2f, still open" % (entry_time, trade['entry_price']))
+            else:
+                print("%s BUY %.2f -> %s SELL %.2f PnL %.2f" %
+                      (entry_time, trade['entry_price'], datetime.datetime.utcfromtimestamp(trade['exit_time']),
+                       trade['exit_price'], trade['pnl']))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,19 @@
 # Main program for interacting with Coinbase Pro websocket and managing trade data
 
 import cbpro
+import signal
+import asyncio
 import period
 import indicators
 import storage
+import strategy
 import engine
 import yaml
 import queue
 import time
 import interface
+import metrics
+import logs
 import logging
 import datetime
 import threading
@@ -20,23 +25,52 @@ from decimal import Decimal
 from websocket import WebSocketConnectionClosedException
 
 class CBProTrader(object):
-    def __init__(self):
-        with open("config.yml", 'r') as ymlfile:
-            self.config = yaml.load(ymlfile, Loader=yaml.Loader)
+    def __init__(self, config=None):
+        if config is None:
+            with open("config.yml", 'r') as ymlfile:
+                config = yaml.load(ymlfile, Loader=yaml.Loader)
+        self.config = config
 
+        # debug.log and error.log are written from a queue, off the trading thread
+        self.log_subsystem = logs.LogSubsystem(self.config)
         self.logger = logging.getLogger('trader-logger')
-        self.logger.setLevel(logging.DEBUG)
-        if self.config['logging']:
-            self.logger.addHandler(logging.FileHandler("debug.log"))
-        if self.config['frontend'] == 'debug':
-            self.logger.addHandler(logging.StreamHandler())
         self.error_logger = logging.getLogger('error-logger')
-        self.error_logger.addHandler(logging.FileHandler("error.log"))
 
         self.mc = storage.MongoConnection(self.config['mongo'])
+        self.metrics = metrics.MetricsSubsystem(enabled=self.config.get('metrics', False),
+                                                summary_interval=self.config.get('metrics_interval', 60))
+        self.metrics.add_source('mongo', self.mc.writer.get_stats)
+        self.metrics.add_source('logs', self.log_subsystem.get_stats)
+        # Closed candles, indicators and decisions as columnar files, see storage.JournalReader
+        self.journal = None
+        self.message_time = 0
+        if self.config.get('journal'):
+            # Replays are journaled at the recorded time
+            clock = (lambda: self.message_time) if self.config.get('replay_feed') else time.time
+            self.journal = storage.TradeJournal(self.config['journal'], clock=clock)
+            self.metrics.add_source('journal', self.journal.get_stats)
+
+        # Buy and sell rules, compiled at startup so invalid ones fail before trading
+        self.strategy = strategy.Strategy.from_config(self.config.get('strategy'))
 
         self.initializing = False
         self.web_interface = None
+        self.shard_pool = None
+        self.candle_cache = None
+        # Shared by every REST client so rate limits hold across re-initializations
+        self.rest_session = engine.RestSession()
+        self.product_registry = None
+        self.trade_engine = None
+        # Recording to replay instead of connecting to the exchange, see engine.FeedReplay
+        self.replay_feed = self.config.get('replay_feed')
+        # 'threads', or 'asyncio' to run the feed, orders and web API on one event loop. Replays use threads
+        self.runtime = 'threads' if self.replay_feed else self.config.get('runtime', 'threads')
+        self.feed_recorder = None
+        if self.config.get('record_feed'):
+            self.feed_recorder = engine.FeedRecorder(self.config['record_feed'],
+                                                     segment_size=self.config.get('record_segment_mb', 64) * 1024 * 1024)
+        self.async_rest_client = None
+        self.async_feed = None
         self.init_engine_and_indicators()
 
     def init_interface(self):
@@ -48,12 +82,16 @@ class CBProTrader(object):
                 curses_enable = True
             else:
                 curses_enable = False
-            self.interface = interface.cursesDisplay(enable=curses_enable)
+            self.interface = interface.cursesDisplay(enable=curses_enable,
+                                                     refresh_rate=self.config.get('curses_refresh_rate', 10))
 
             if self.config['frontend'] == 'web':
-                self.web_interface = interface.web(self.indicator_subsys, self.trade_engine, self.config, self.init_engine_and_indicators)
-                self.server_thread = threading.Thread(target=self.web_interface.start, daemon=True)
-                self.server_thread.start()
+                self.web_interface = interface.web(self.indicator_subsys, self.trade_engine, self.config, self.init_engine_and_indicators,
+                                                   metrics=self.metrics)
+                if self.runtime != 'asyncio':
+                    # The asyncio runtime serves it from its loop, see run_async
+                    self.server_thread = threading.Thread(target=self.web_interface.start, daemon=True)
+                    self.server_thread.start()
 
     def init_engine_and_indicators(self):
         self.initializing = True
@@ -61,6 +99,11 @@ class CBProTrader(object):
             self.cbpro_websocket.close()
         except:
             pass
+        if self.shard_pool is not None:
+            self.shard_pool.close()
+            self.shard_pool = None
+        # Number of worker processes to spread products over, 0 to run everything in this process
+        shards = self.config.get('shards', 0)
         # Periods to update indicators for
         self.indicator_period_list = []
         # Periods to actively trade on (typically 1 per product)
@@ -68,20 +111,45 @@ class CBProTrader(object):
         # List of products that we are actually monitoring
         self.product_list = set()
         fiat_currency = self.config['fiat']
+        # Channels subscribed to, see engine.FEED_PROFILES
+        self.feed_profile = engine.get_feed_profile(self.config.get('feed', 'full'))
+        self.metrics.sequence_field = self.feed_profile['sequence_field']
         if self.config['sandbox']:
             api_url = "https://api-public.sandbox.pro.coinbase.com"
         else:
             api_url = "https://api.pro.coinbase.com"
-        auth_client = cbpro.AuthenticatedClient(self.config['key'], self.config['secret'], self.config['passphrase'], api_url=api_url)
+        # Every product a period reads, including both legs of meta periods
+        feed_products = sorted(set(product_id for cur_period in self.config['periods']
+                                   for product_id in engine.get_period_product_ids(cur_period, fiat_currency)))
+        if self.replay_feed:
+            auth_client = engine.OfflineClient.from_recording(self.replay_feed, feed_products,
+                                                              self.config.get('replay_balances', {fiat_currency: 1000}))
+        else:
+            auth_client = cbpro.AuthenticatedClient(self.config['key'], self.config['secret'], self.config['passphrase'], api_url=api_url)
+            auth_client.session = self.rest_session
+        if self.product_registry is None:
+            self.product_registry = engine.ProductRegistry(auth_client, path=None if self.replay_feed else self.config.get('product_cache'),
+                                                           ttl=self.config.get('product_cache_ttl', 3600)).load()
+            self.product_registry.start_refresh()
+        else:
+            self.product_registry.auth_client = auth_client
 
-        for cur_period in self.config['periods']:
-            self.logger.debug("INITIALIZING %s", cur_period['name'])
-            if cur_period.get('meta'):
-                new_period = period.MetaPeriod(period_size=(60 * cur_period['length']), fiat=fiat_currency,
-                                            product=cur_period['product'], name=cur_period['name'], cbpro_client=auth_client)
-            else:
-                new_period = period.Period(period_size=(60 * cur_period['length']),
-                                        product=cur_period['product'], name=cur_period['name'], cbpro_client=auth_client)
+        max_candles = self.config.get('max_candles', 1000)
+        # Kept across re-initializations so a reconnect only fetches the missing candles.
+        # Not used by replays, their history ends where the recording starts
+        if self.config.get('candle_cache') and self.candle_cache is None and not self.replay_feed:
+            self.candle_cache = period.CandleCache(self.config['candle_cache'])
+        if shards:
+            # Mirrors of the periods owned by the shard workers, filled from their snapshots
+            new_periods = [period.Period(period_size=(60 * cur_period['length']), product=cur_period['product'],
+                                         name=cur_period['name'], initialize=False, max_candles=max_candles)
+                           for cur_period in self.config['periods']]
+        else:
+            self.logger.debug("INITIALIZING %s", ", ".join(cur_period['name'] for cur_period in self.config['periods']))
+            new_periods = period.create_periods(self.config['periods'], fiat=fiat_currency, cbpro_client=auth_client,
+                                                max_candles=max_candles, candle_cache=self.candle_cache,
+                                                aggregate=self.config.get('aggregate_periods', False))
+        for cur_period, new_period in zip(self.config['periods'], new_periods):
             self.indicator_period_list.append(new_period)
             self.product_list.add(cur_period['product'])
             if cur_period['trade']:
@@ -89,58 +157,250 @@ class CBProTrader(object):
                     self.trade_period_list[cur_period['product']] = []
                 self.trade_period_list[cur_period['product']].append(new_period)
         max_slippage = Decimal(str(self.config['max_slippage']))
-        self.trade_engine = engine.TradeEngine(auth_client, product_list=self.product_list, fiat=fiat_currency, is_live=self.config['live'], max_slippage=max_slippage, mongo_connection=self.mc)
-        self.cbpro_websocket = engine.TradeAndHeartbeatWebsocket(fiat=fiat_currency, sandbox=self.config['sandbox'])
-        self.cbpro_websocket.start()
+        if self.trade_engine is not None:
+            # Stops the balance reconcile thread of the engine being replaced
+            self.trade_engine.balance_ledger.close()
+        engine_options = dict(product_list=self.product_list, fiat=fiat_currency, is_live=self.config['live'], max_slippage=max_slippage, mongo_connection=self.mc,
+                              product_registry=self.product_registry, feed=self.config.get('feed', 'full'),
+                              balance_reconcile_interval=self.config.get('balance_reconcile_interval', 30),
+                              journal=self.journal, strategy=self.strategy)
+        if self.runtime == 'asyncio':
+            if self.async_rest_client is None:
+                self.async_rest_client = engine.AsyncRestClient(self.config['key'], self.config['secret'], self.config['passphrase'], api_url=api_url)
+            self.trade_engine = engine.AsyncTradeEngine(auth_client, rest_client=self.async_rest_client, **engine_options)
+        else:
+            self.trade_engine = engine.TradeEngine(auth_client, **engine_options)
+        if shards:
+            for product in self.trade_engine.products:
+                product.order_book = engine.OrderBookSnapshot(product_id=product.product_id)
+        feed_options = dict(fiat=fiat_currency, sandbox=self.config['sandbox'], products=feed_products,
+                            channels=self.feed_profile['channels'], key=self.config['key'],
+                            secret=self.config['secret'], passphrase=self.config['passphrase'],
+                            recorder=self.feed_recorder)
+        if self.replay_feed:
+            self.cbpro_websocket = engine.FeedReplay(self.replay_feed, speed=self.config.get('replay_speed', 0),
+                                                     products=feed_products)
+            self.cbpro_websocket.start()
+        elif self.runtime == 'asyncio':
+            # Connected by run_async
+            self.cbpro_websocket = None
+            self.async_feed = engine.AsyncFeed(**feed_options)
+        else:
+            self.cbpro_websocket = engine.TradeAndHeartbeatWebsocket(**feed_options)
+            self.cbpro_websocket.start()
         self.indicator_period_list[0].verbose_heartbeat = True
-        self.indicator_subsys = indicators.IndicatorSubsystem(self.indicator_period_list, self.mc)
-        self.last_indicator_update = time.time()
+        self.indicator_subsys = indicators.IndicatorSubsystem(self.indicator_period_list, self.mc,
+                                                              incremental=self.config.get('incremental_indicators', False))
+        self.last_indicator_update = 0 if self.replay_feed else time.time()
+        self.init_dispatch()
+        if shards:
+            self.init_shards(shards)
 
         self.init_interface()
         self.initializing = False
 
+    def init_dispatch(self):
+        order_books = {product.product_id: product.order_book for product in self.trade_engine.products}
+        self.dispatch, self.product_periods = engine.build_dispatch(order_books, self.indicator_period_list,
+                                                                    timed=self.metrics.timed,
+                                                                    book_message_types=self.feed_profile['book_message_types'])
+        # Traded products that depend on each product's periods
+        self.product_trade_periods = engine.get_product_trade_periods(self.product_periods, self.trade_period_list)
+        self.recalculate_indicators = self.metrics.timed('recalculate_indicators', self.indicator_subsys.recalculate_indicators)
+        self.determine_product_trades = self.metrics.timed('determine_trades', self.trade_engine.determine_trades)
+
+    def init_shards(self, shards):
+        self.shard_pool = engine.ShardPool(shards, self.config, product_registry=self.product_registry)
+        self.periods_by_name = {cur_period.name: cur_period for cur_period in self.indicator_period_list}
+        self.trade_periods_by_name = {}
+        for product_id, period_list in self.trade_period_list.items():
+            for cur_period in period_list:
+                self.trade_periods_by_name.setdefault(cur_period.name, {})[product_id] = period_list
+        self.apply_shard_snapshots(self.shard_pool.start())
+
+    def apply_shard_snapshots(self, snapshots):
+        trade_periods = {}
+        for snapshot in snapshots:
+            if snapshot[0] == 'period':
+                name, reset, closed_sticks, cur_stick, period_indicators = snapshot[1:]
+                cur_period = self.periods_by_name[name]
+                if reset:
+                    cur_period.candlesticks.clear()
+                cur_period.candlesticks.extend(closed_sticks)
+                cur_period.cur_candlestick = period.Candlestick(existing_candlestick=cur_stick)
+                cur_period.cur_candlestick_start = cur_period.cur_candlestick.time
+                self.indicator_subsys.current_indicators[name].update(period_indicators)
+                if 'close' in period_indicators:
+                    self.indicator_subsys.calculate_bep(name, [period_indicators['close']])
+                trade_periods.update(self.trade_periods_by_name.get(name, {}))
+            elif snapshot[0] == 'book':
+                product = self.trade_engine.get_product_by_product_id(snapshot[1])
+                if product is not None:
+                    product.order_book.update(*snapshot[2:])
+        return trade_periods
+
+    def determine_trades(self, trade_periods):
+        for product_id, period_list in trade_periods.items():
+            if all(len(self.indicator_subsys.current_indicators[cur_period.name]) > 0 for cur_period in period_list):
+                self.determine_product_trades(product_id, period_list, self.indicator_subsys.current_indicators)
+
+    def update_interfaces(self, msg):
+        self.interface.update(self.trade_engine, self.indicator_subsys.current_indicators,
+                              self.indicator_period_list, msg)
+        if self.web_interface is not None:
+            self.web_interface.publish(self.indicator_period_list)
+
+    def handle_message(self, msg, queue_size=0):
+        if engine.is_user_message(msg):
+            # Our own orders and fills, from the user channel
+            self.trade_engine.process_user_message(msg)
+            self.update_interfaces(msg)
+            return
+        if self.replay_feed:
+            self.message_time = getattr(msg, 'timestamp', self.message_time)
+        if self.metrics.enabled:
+            self.metrics.message_received(msg, queue_size)
+            self.metrics.maybe_log_summary()
+        msg_type = msg.get('type')
+        product_id = msg.get('product_id')
+        if self.shard_pool is not None:
+            # Workers own books, candles and indicators, only trade decisions happen here
+            self.shard_pool.route(msg)
+            self.determine_trades(self.apply_shard_snapshots(self.shard_pool.poll()))
+            if msg_type == "heartbeat":
+                self.trade_engine.print_amounts()
+                self.journal_periods(self.indicator_period_list)
+            self.update_interfaces(msg)
+            return
+        for handler in self.dispatch.get((product_id, msg_type), ()):
+            handler(msg)
+        if msg_type == "match":
+            if self.indicator_subsys.incremental:
+                # Incremental indicators are cheap enough to re-evaluate on every trade
+                for cur_period in self.product_periods.get(product_id, ()):
+                    self.recalculate_indicators(cur_period)
+                self.journal_periods(self.product_periods.get(product_id, ()))
+                self.determine_trades(self.product_trade_periods.get(product_id, {}))
+            elif self.get_time(msg) - self.last_indicator_update >= 1.0:
+                for cur_period in self.indicator_period_list:
+                    self.recalculate_indicators(cur_period)
+                self.journal_periods(self.indicator_period_list)
+                for product_id, period_list in self.trade_period_list.items():
+                    self.determine_product_trades(product_id, period_list, self.indicator_subsys.current_indicators)
+                self.last_indicator_update = self.get_time(msg)
+        elif msg_type == "heartbeat":
+            self.determine_trades(self.product_trade_periods.get(product_id, {}))
+            self.trade_engine.print_amounts()
+        self.update_interfaces(msg)
+
+    def journal_periods(self, period_list):
+        if self.journal is not None:
+            for cur_period in period_list:
+                self.journal.record_candles(cur_period)
+                self.journal.record_indicators(cur_period.product, cur_period.name,
+                                               self.indicator_subsys.current_indicators[cur_period.name])
+
+    def get_time(self, msg):
+        # Replays go by the recorded time so results do not depend on the replay speed
+        if self.replay_feed:
+            return msg.timestamp
+        return time.time()
+
+    def close(self):
+        self.trade_engine.close(exit=True)
+        self.cbpro_websocket.close()
+        if self.feed_recorder is not None:
+            self.feed_recorder.close()
+        if self.shard_pool is not None:
+            self.shard_pool.close()
+        self.interface.close()
+        self.mc.close()
+        if self.journal is not None:
+            self.journal.close()
+        self.log_subsystem.close()
+
+    def reinitialize_periods(self):
+        # Period data cannot be trusted after a disconnect
+        if self.shard_pool is not None:
+            self.shard_pool.close()
+            self.init_shards(self.config['shards'])
+        else:
+            for cur_period in self.indicator_period_list:
+                # Rolled up periods are re-initialized by their base period
+                if cur_period.base_period is None:
+                    cur_period.initialize()
+
     def start(self):
+        if self.runtime == 'asyncio':
+            engine.run_loop(self.run_async())
+            return
         while(True):
             if not self.initializing:
                 try:
                     if self.cbpro_websocket.error:
                         raise self.cbpro_websocket.error
                     msg = self.cbpro_websocket.websocket_queue.get(timeout=15)
-                    for product in self.trade_engine.products:
-                        product.order_book.process_message(msg)
-                    if msg.get('type') == "match":
-                        for cur_period in self.indicator_period_list:
-                            cur_period.process_trade(msg)
-                        if time.time() - self.last_indicator_update >= 1.0:
-                            for cur_period in self.indicator_period_list:
-                                self.indicator_subsys.recalculate_indicators(cur_period)
-                            for product_id, period_list in self.trade_period_list.items():
-                                self.trade_engine.determine_trades(product_id, period_list, self.indicator_subsys.current_indicators)
-                            self.last_indicator_update = time.time()
-                    elif msg.get('type') == "heartbeat":
-                        for cur_period in self.indicator_period_list:
-                            cur_period.process_heartbeat(msg)
-                        for product_id, period_list in self.trade_period_list.items():
-                            if len(self.indicator_subsys.current_indicators[cur_period.name]) > 0:
-                                self.trade_engine.determine_trades(product_id, period_list, self.indicator_subsys.current_indicators)
-                        self.trade_engine.print_amounts()
-                    self.interface.update(self.trade_engine, self.indicator_subsys.current_indicators,
-                                    self.indicator_period_list, msg)
-                except KeyboardInterrupt:
-                    self.trade_engine.close(exit=True)
-                    self.cbpro_websocket.close()
-                    self.interface.close()
+                    if isinstance(msg, engine.ReplayFinished):
+                        raise msg
+                    self.handle_message(msg, self.cbpro_websocket.websocket_queue.qsize())
+                except (KeyboardInterrupt, engine.ReplayFinished) as e:
+                    self.logger.debug("-- Stopping: %r ---", e)
+                    self.close()
                     break
                 except Exception as e:
                     self.error_logger.exception(datetime.datetime.now())
                     self.trade_engine.close()
                     self.cbpro_websocket.close()
                     self.cbpro_websocket.error = None
-                    # Period data cannot be trusted. Re-initialize
-                    for cur_period in self.indicator_period_list:
-                        cur_period.initialize()
+                    self.metrics.reset_sequences()
+                    self.reinitialize_periods()
                     time.sleep(10)
                     self.cbpro_websocket.start()
+                    self.trade_engine.reconcile_orders()
+
+    async def run_async(self):
+        # Messages are handled as they arrive on the loop, order workflows and
+        # web requests run as tasks between them. Cancelling this coroutine
+        # (Ctrl-C, SIGTERM) stops them all and cancels open orders before exit.
+        loop = asyncio.get_event_loop()
+        loop.add_signal_handler(signal.SIGTERM, engine.current_task().cancel)
+        async_web = None
+        try:
+            if self.web_interface is not None:
+                async_web = interface.AsyncWeb(self.web_interface)
+                await async_web.start()
+            self.trade_engine.start()
+            while True:
+                try:
+                    async for msg in self.async_feed.messages():
+                        self.handle_message(msg)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.error_logger.exception(datetime.datetime.now())
+                    self.trade_engine.close()
+                    self.metrics.reset_sequences()
+                    # Fetches history through the blocking client, off the loop
+                    await loop.run_in_executor(None, self.reinitialize_periods)
+                    await asyncio.sleep(10)
+                    await self.trade_engine.reconcile_orders_async()
+        finally:
+            await self.trade_engine.aclose(exit=True)
+            await self.async_feed.close()
+            await self.async_rest_client.close()
+            if self.feed_recorder is not None:
+                self.feed_recorder.close()
+            if async_web is not None:
+                await async_web.close()
+            if self.shard_pool is not None:
+                self.shard_pool.close()
+            self.interface.close()
+            self.mc.close()
+            if self.journal is not None:
+                self.journal.close()
+            self.log_subsystem.close()
 
-cbprotrader = CBProTrader()
-cbprotrader.start()
\ No newline at end of file
+if __name__ == '__main__':
+    # Guarded so shard worker processes can import this module safely
+    cbprotrader = CBProTrader()
+    cbprotrader.start()
\ No newline at end of file
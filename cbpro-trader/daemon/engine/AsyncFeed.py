@@ -0,0 +1,69 @@
+import json
+import time
+import logging
+import aiohttp
+import trade
+from cbpro.cbpro_auth import get_auth_headers
+
+
+class AsyncFeed:
+    # Websocket feed for the asyncio runtime, subscribed like
+    # TradeAndHeartbeatWebsocket. messages() yields decoded messages until
+    # the connection closes, then raises ConnectionError.
+    def __init__(self, fiat='USD', sandbox=False, products=None, channels=None, key=None, secret=None,
+                 passphrase=None, url=None, heartbeat=30, recorder=None):
+        self.logger = logging.getLogger('trader-logger')
+        if products is None:
+            products = ["BTC-" + fiat, "ETH-" + fiat]
+        self.products = list(products)
+        self.channels = list(channels) if channels is not None else ['full', 'heartbeat']
+        self.key = key
+        self.secret = secret
+        self.passphrase = passphrase
+        if key:
+            # Our own order events, signed with the API key
+            self.channels.append('user')
+        if url is None:
+            if sandbox:
+                url = "wss://ws-feed-public.sandbox.pro.coinbase.com"
+            else:
+                url = "wss://ws-feed.pro.coinbase.com"
+        self.url = url
+        self.heartbeat = heartbeat
+        self.recorder = recorder
+        self.session = None
+
+    def subscribe_message(self):
+        sub_params = {'type': 'subscribe', 'product_ids': self.products, 'channels': self.channels}
+        if self.key:
+            timestamp = str(time.time())
+            auth_headers = get_auth_headers(timestamp, timestamp + 'GET' + '/users/self/verify', self.key,
+                                            self.secret, self.passphrase)
+            sub_params['signature'] = auth_headers['CB-ACCESS-SIGN']
+            sub_params['key'] = auth_headers['CB-ACCESS-KEY']
+            sub_params['passphrase'] = auth_headers['CB-ACCESS-PASSPHRASE']
+            sub_params['timestamp'] = auth_headers['CB-ACCESS-TIMESTAMP']
+        return sub_params
+
+    async def messages(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        async with self.session.ws_connect(self.url, heartbeat=self.heartbeat) as ws:
+            self.logger.debug("-- CBPRO Websocket Opened ---")
+            await ws.send_str(json.dumps(self.subscribe_message()))
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    msg = json.loads(message.data)
+                    if self.recorder is not None:
+                        self.recorder.record(msg)
+                    # Decode once here so consumers never re-parse timestamps or prices
+                    yield trade.decode_message(msg)
+                elif message.type == aiohttp.WSMsgType.ERROR:
+                    raise ws.exception()
+        self.logger.debug("-- CBPRO Websocket Closed ---")
+        raise ConnectionError("Websocket closed")
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
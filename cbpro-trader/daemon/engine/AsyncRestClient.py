@@ -0,0 +1,174 @@
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from urllib.parse import urlencode
+from cbpro.cbpro_auth import get_auth_headers
+from .TokenBucket import TokenBucket
+from .RestSession import RestSession
+
+
+class AsyncRestClient:
+    # The AuthenticatedClient calls the trader makes, for the asyncio runtime.
+    # Works like RestSession: a keep-alive connection pool, a token bucket per
+    # rate limit class, retries when rate limited, identical GETs in flight
+    # shared and cached for cache_ttl seconds, any write clearing the cache.
+    # Responses are the parsed JSON, error messages included, as with cbpro.
+    public_endpoints = RestSession.public_endpoints
+
+    def __init__(self, key='', b64secret='', passphrase='', api_url='https://api.pro.coinbase.com',
+                 public_rate=3, public_burst=6, private_rate=5, private_burst=10, cache_ttl=0.5,
+                 pool_size=10, max_retries=3, retry_wait=1.0, max_cache_entries=256):
+        self.logger = logging.getLogger('trader-logger')
+        self.key = key
+        self.b64secret = b64secret
+        self.passphrase = passphrase
+        self.url = api_url.rstrip('/')
+        self.public_bucket = TokenBucket(public_rate, public_burst)
+        self.private_bucket = TokenBucket(private_rate, private_burst)
+        self.cache_ttl = cache_ttl
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_wait = retry_wait
+        self.max_cache_entries = max_cache_entries
+        # Created in the running loop on first use
+        self.session = None
+        self.cache = {}
+        self.in_flight = {}
+        # Bumped by every write so GETs sent before it are not cached
+        self.generation = 0
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def get_bucket(self, path):
+        if path.startswith(self.public_endpoints):
+            return self.public_bucket
+        return self.private_bucket
+
+    def auth_headers(self, method, path, body):
+        if not self.key:
+            return {'Content-Type': 'Application/JSON'}
+        timestamp = str(time.time())
+        return get_auth_headers(timestamp, timestamp + method + path + body, self.key, self.b64secret, self.passphrase)
+
+    async def send(self, method, endpoint, params=None, data=None):
+        path = endpoint + ('?' + urlencode(params) if params else '')
+        body = json.dumps(data) if data is not None else ''
+        bucket = self.get_bucket(endpoint)
+        for attempt in range(self.max_retries + 1):
+            wait = bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            # Signed per attempt, the timestamp must be recent
+            async with self.get_session().request(method, self.url + path, data=body or None,
+                                                  headers=self.auth_headers(method, path, body)) as response:
+                if response.status != 429 or attempt == self.max_retries:
+                    return await response.json(content_type=None), response.headers.get('cb-after')
+            self.logger.debug("Rate limited on %s, retrying", path)
+            await asyncio.sleep(self.retry_wait * (attempt + 1))
+
+    async def request(self, method, endpoint, params=None, data=None):
+        if method != 'GET':
+            result = await self.send(method, endpoint, params, data)
+            self.cache = {}
+            self.generation += 1
+            return result
+
+        key = (endpoint, tuple(sorted((name, str(value)) for name, value in (params or {}).items())))
+        cached = self.cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            return cached[1]
+        call = self.in_flight.get(key)
+        if call is not None:
+            # Shielded so a cancelled waiter does not cancel the shared request
+            return await asyncio.shield(call)
+
+        call = self.in_flight[key] = asyncio.ensure_future(self.send(method, endpoint, params))
+        generation = self.generation
+        try:
+            result = await asyncio.shield(call)
+        finally:
+            del self.in_flight[key]
+        if generation == self.generation:
+            if len(self.cache) >= self.max_cache_entries:
+                now = time.monotonic()
+                self.cache = {cache_key: entry for cache_key, entry in self.cache.items()
+                              if now - entry[0] < self.cache_ttl}
+            self.cache[key] = (time.monotonic(), result)
+        return result
+
+    async def get(self, endpoint, params=None):
+        return (await self.request('GET', endpoint, params))[0]
+
+    async def get_paginated(self, endpoint, params=None, limit=None):
+        params = dict(params or {})
+        results = []
+        while True:
+            page, after = await self.request('GET', endpoint, params)
+            if not isinstance(page, list):
+                # Error message, returned as is like cbpro does
+                return page
+            results += page
+            if not after or not page or (limit is not None and len(results) >= limit):
+                return results[:limit] if limit is not None else results
+            params['after'] = after
+
+    async def post(self, endpoint, data):
+        return (await self.request('POST', endpoint, data=data))[0]
+
+    async def delete(self, endpoint, params=None):
+        return (await self.request('DELETE', endpoint, params))[0]
+
+    async def get_products(self):
+        return await self.get('/products')
+
+    async def get_accounts(self):
+        return await self.get('/accounts')
+
+    async def get_orders(self, product_id=None, status=None):
+        params = {}
+        if product_id:
+            params['product_id'] = product_id
+        if status:
+            params['status'] = status
+        return await self.get_paginated('/orders', params)
+
+    async def get_order(self, order_id):
+        return await self.get('/orders/' + order_id)
+
+    async def get_fills(self, product_id=None, order_id=None, limit=None):
+        params = {}
+        if product_id:
+            params['product_id'] = product_id
+        if order_id:
+            params['order_id'] = order_id
+        return await self.get_paginated('/fills', params, limit)
+
+    async def place_limit_order(self, product_id, side, price, size, post_only=None):
+        data = {'product_id': product_id, 'side': side, 'type': 'limit', 'price': price, 'size': size}
+        if post_only is not None:
+            data['post_only'] = post_only
+        return await self.post('/orders', data)
+
+    async def place_market_order(self, product_id, side, size=None, funds=None):
+        data = {'product_id': product_id, 'side': side, 'type': 'market'}
+        if size is not None:
+            data['size'] = size
+        if funds is not None:
+            data['funds'] = funds
+        return await self.post('/orders', data)
+
+    async def cancel_order(self, order_id):
+        return await self.delete('/orders/' + order_id)
+
+    async def cancel_all(self, product_id=None):
+        return await self.delete('/orders', {'product_id': product_id} if product_id else None)
@@ -0,0 +1,252 @@
+import asyncio
+import datetime
+from decimal import Decimal
+from .TradeEngine import TradeEngine
+
+# asyncio.current_task and asyncio.all_tasks are Python 3.7+, the Docker image runs 3.6
+current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+
+
+def run_loop(coro):
+    # asyncio.run for Python 3.6. Ctrl-C cancels the coroutine and waits for
+    # it to clean up, tasks left over are cancelled before the loop closes
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    main = asyncio.ensure_future(coro)
+    try:
+        try:
+            return loop.run_until_complete(main)
+        except KeyboardInterrupt:
+            main.cancel()
+            loop.run_until_complete(asyncio.gather(main, return_exceptions=True))
+    finally:
+        pending = [task for task in all_tasks(loop) if not task.done()]
+        if pending:
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class AsyncTradeEngine(TradeEngine):
+    # TradeEngine for the asyncio runtime. Orders are placed through an
+    # AsyncRestClient and each product's order workflow is a task, cancelled
+    # when the signal changes rather than checking the flags in a loop.
+    # Cancelled workflows cancel their remaining orders on the way out.
+    # Everything here runs on the event loop thread.
+    def __init__(self, auth_client, mongo_connection, rest_client=None, **kwargs):
+        self.rest_client = rest_client
+        # product_id -> (side, task) of the running order workflow
+        self.order_tasks = {}
+        self.tasks = set()
+        # Futures of workflows waiting for order events
+        self.waiters = []
+        super(AsyncTradeEngine, self).__init__(auth_client, mongo_connection, **kwargs)
+        self.order_tracker.listeners.append(self.order_event)
+
+    def start_balance_reconcile(self):
+        # Replaced by the reconcile task started by start()
+        pass
+
+    def start(self):
+        # Called from the running loop
+        self.spawn(self.reconcile_loop())
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.error_logger.error(datetime.datetime.now(), exc_info=task.exception())
+
+    def order_event(self):
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(True)
+
+    async def wait_for_update(self, timeout):
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=timeout)
+        finally:
+            self.waiters.remove(waiter)
+        return waiter.done()
+
+    async def reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.balance_ledger.reconcile_interval)
+            await self.reconcile_balances_async()
+
+    async def reconcile_balances_async(self):
+        try:
+            self.balance_ledger.set_accounts(await self.rest_client.get_accounts())
+        except Exception:
+            self.error_logger.exception(datetime.datetime.now())
+
+    async def reconcile_orders_async(self):
+        # At startup and after reconnects, user channel messages may have been missed
+        try:
+            orders = await self.rest_client.get_orders()
+            fills = []
+            for product_id in self.order_tracker.product_ids:
+                product_fills = await self.rest_client.get_fills(product_id=product_id, limit=5)
+                if isinstance(product_fills, list):
+                    fills += product_fills
+            if isinstance(orders, list):
+                self.order_tracker.set_state(orders, fills)
+        except Exception:
+            self.error_logger.exception(datetime.datetime.now())
+
+    def start_buy(self, product, amount):
+        self.start_order(product, 'buy', amount)
+
+    def start_sell(self, product, amount):
+        self.start_order(product, 'sell', amount)
+
+    def start_order(self, product, side, amount):
+        running = self.order_tasks.get(product.product_id)
+        if running is not None and not running[1].done():
+            if running[0] == side:
+                return
+            running[1].cancel()
+        if self.market_orders:
+            coro = self.market_order(product, side, amount)
+        elif product.order_book.is_ready():
+            coro = self.chase_order(product, side)
+        else:
+            # Tried again on the next trade decision
+            return
+        self.order_tasks[product.product_id] = (side, self.spawn(coro))
+
+    def stop_orders(self, product):
+        running = self.order_tasks.pop(product.product_id, None)
+        if running is not None:
+            running[1].cancel()
+
+    async def market_order(self, product, side, amount):
+        if side == 'buy':
+            ret = await self.rest_client.place_market_order(product.product_id, side, funds=str(amount))
+        else:
+            ret = await self.rest_client.place_market_order(product.product_id, side, size=str(amount))
+        self.logger.debug(ret)
+        self.order_tracker.add_order(ret)
+
+    def get_limit_price(self, product, side):
+        # Just inside the spread on our side of the book
+        if side == 'buy':
+            return product.order_book.get_ask() - Decimal(product.quote_increment)
+        return product.order_book.get_bid() + Decimal(product.quote_increment)
+
+    def get_available(self, product, side):
+        if side == 'buy':
+            return self.get_quoted_currency_from_product_id(product.product_id)
+        return self.get_base_currency_from_product_id(product.product_id)
+
+    def get_order_size(self, product, side, price, partial):
+        available = self.get_available(product, side)
+        if side == 'buy':
+            size = self.round_coin(available * Decimal(partial) / price)
+            if size < Decimal(product.min_size):
+                size = self.round_coin(available / price)
+        else:
+            size = self.round_coin(available * Decimal(partial))
+            if size < Decimal(product.min_size):
+                size = available
+        return size
+
+    async def place_limit(self, product, side, partial='1.0'):
+        price = self.get_limit_price(product, side)
+        size = self.get_order_size(product, side, price, partial)
+        if size < Decimal(product.min_size):
+            return {'status': 'done'}
+        self.logger.debug("Placing %s... Price: %.8f Size: %.8f", side, price, size)
+        ret = await self.rest_client.place_limit_order(product.product_id, side, price=str(price), size=str(size),
+                                                       post_only=True)
+        self.order_tracker.add_order(ret)
+        return ret
+
+    def has_slipped(self, side, price, starting_price):
+        if side == 'buy':
+            slippage = (price / starting_price - Decimal('1.0')) * Decimal('100.0')
+        else:
+            slippage = (Decimal('1') - price / starting_price) * Decimal('100.0')
+        return slippage > self.max_slippage
+
+    def is_behind(self, side, order_price, price):
+        if side == 'buy':
+            return Decimal(order_price) < price
+        return Decimal(order_price) > price
+
+    async def chase_order(self, product, side):
+        # buy() and sell() as a task: limit orders following the best price
+        # until the balance is used up, switching to a market order once the
+        # price has moved more than max_slippage
+        product.order_in_progress = True
+        try:
+            starting_price = self.get_limit_price(product, side)
+            ret = await self.place_limit(product, side, partial='0.5')
+            order_price = ret.get('price')
+            while self.get_available(product, side) >= Decimal(product.min_size) or len(product.open_orders) > 0:
+                if not product.order_book.is_ready():
+                    await self.wait_for_update(0.1)
+                    continue
+                price = self.get_limit_price(product, side)
+                if self.has_slipped(side, price, starting_price):
+                    await self.rest_client.cancel_all(product_id=product.product_id)
+                    await self.market_order(product, side, self.get_available(product, side))
+                    return
+                if ret.get('status') == 'rejected' or ret.get('status') == 'done' or ret.get('message') == 'NotFound':
+                    ret = await self.place_limit(product, side, partial='0.5')
+                    order_price = ret.get('price')
+                elif not order_price or self.is_behind(side, order_price, price):
+                    if len(product.open_orders) > 0:
+                        ret = await self.place_limit(product, side, partial='1.0')
+                    else:
+                        ret = await self.place_limit(product, side, partial='0.5')
+                    for order in product.open_orders:
+                        if order.get('id') != ret.get('id'):
+                            await self.rest_client.cancel_order(order.get('id'))
+                    order_price = ret.get('price')
+                if ret.get('id'):
+                    ret = self.order_tracker.get_order(ret.get('id')) or ret
+                # Wakes up on order events, and often enough to follow the price
+                await self.wait_for_update(0.1)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.error_logger.exception(datetime.datetime.now())
+        finally:
+            product.order_in_progress = False
+            try:
+                await self.rest_client.cancel_all(product_id=product.product_id)
+            except Exception:
+                self.error_logger.exception(datetime.datetime.now())
+
+    def close(self, exit=False):
+        for product in self.products:
+            product.buy_flag = False
+            product.sell_flag = False
+        for side, task in self.order_tasks.values():
+            task.cancel()
+        self.order_tasks = {}
+
+    async def aclose(self, exit=False):
+        # Cancels every workflow and waits for them to clean up, then any
+        # order still left
+        self.close(exit)
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self.rest_client.cancel_all()
+        except Exception:
+            self.error_logger.exception(datetime.datetime.now())
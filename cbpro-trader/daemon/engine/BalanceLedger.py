@@ -0,0 +1,127 @@
+import logging
+import datetime
+import threading
+from decimal import Decimal, ROUND_DOWN
+
+
+class BalanceLedger:
+    # Balance and hold per currency, updated from our order and fill events on
+    # the user channel so trade decisions never wait on get_accounts. A
+    # background thread reconciles with get_accounts every reconcile_interval
+    # seconds, correcting fees and orders placed before the ledger started.
+    def __init__(self, auth_client, reconcile_interval=30):
+        self.error_logger = logging.getLogger('error-logger')
+        self.auth_client = auth_client
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.Lock()
+        # currency -> [balance, hold]
+        self.accounts = {}
+        # order id -> [product_id, side, held currency, amount still held, limit price]
+        self.order_holds = {}
+        # currency -> available, rounded down. Replaced on every change
+        self.available = {}
+        self.reconcile_thread = None
+        self.stop_reconcile = threading.Event()
+
+    def reconcile(self):
+        return self.set_accounts(self.auth_client.get_accounts())
+
+    def set_accounts(self, ret):
+        if not isinstance(ret, list):
+            # May be rate limited, keep the current balances until the next reconcile
+            return False
+        with self.lock:
+            self.accounts = {account['currency']: [Decimal(account.get('balance') or account.get('available')),
+                                                   Decimal(account.get('hold') or '0')]
+                             for account in ret}
+            self.update_available()
+        return True
+
+    def start(self):
+        if self.reconcile_thread is None:
+            self.reconcile_thread = threading.Thread(target=self.reconcile_loop, name='balance_reconcile', daemon=True)
+            self.reconcile_thread.start()
+
+    def reconcile_loop(self):
+        while not self.stop_reconcile.wait(self.reconcile_interval):
+            try:
+                self.reconcile()
+            except Exception:
+                self.error_logger.exception(datetime.datetime.now())
+
+    def close(self):
+        self.stop_reconcile.set()
+
+    def update_available(self):
+        self.available = {currency: (balance - hold).quantize(Decimal('.00000001'), rounding=ROUND_DOWN)
+                          for currency, (balance, hold) in self.accounts.items()}
+
+    def get_available(self, currency):
+        return self.available.get(currency, Decimal('0'))
+
+    def get_account(self, currency):
+        return self.accounts.setdefault(currency, [Decimal('0'), Decimal('0')])
+
+    def release(self, order_hold, amount):
+        amount = min(amount, order_hold[3])
+        order_hold[3] -= amount
+        self.get_account(order_hold[2])[1] -= amount
+
+    def process_message(self, msg):
+        msg_type = msg.get('type')
+        with self.lock:
+            if msg_type == 'received':
+                self.hold_order(msg)
+            elif msg_type == 'match':
+                self.apply_match(msg)
+            elif msg_type == 'done':
+                order_hold = self.order_holds.pop(msg.get('order_id'), None)
+                if order_hold is None:
+                    return
+                self.release(order_hold, order_hold[3])
+            else:
+                return
+            self.update_available()
+
+    def hold_order(self, msg):
+        product_id, side = msg.get('product_id'), msg.get('side')
+        base, quote = product_id.split('-')
+        price = Decimal(msg['price']) if msg.get('price') else None
+        if side == 'buy':
+            if price is not None and msg.get('size'):
+                amount = price * Decimal(msg['size'])
+            elif msg.get('funds'):
+                amount = Decimal(msg['funds'])
+            else:
+                return
+            currency = quote
+        elif msg.get('size'):
+            amount = Decimal(msg['size'])
+            currency = base
+        else:
+            return
+        self.order_holds[msg.get('order_id')] = [product_id, side, currency, amount, price]
+        self.get_account(currency)[1] += amount
+
+    def apply_match(self, msg):
+        # Only orders received since the ledger started are known here
+        if msg.get('maker_order_id') in self.order_holds:
+            order_id, fee_rate = msg.get('maker_order_id'), msg.get('maker_fee_rate')
+        elif msg.get('taker_order_id') in self.order_holds:
+            order_id, fee_rate = msg.get('taker_order_id'), msg.get('taker_fee_rate')
+        else:
+            return
+        order_hold = self.order_holds[order_id]
+        product_id, side, currency, held, limit_price = order_hold
+        base, quote = product_id.split('-')
+        size = Decimal(msg.get('size'))
+        funds = Decimal(msg.get('price')) * size
+        fee = funds * Decimal(fee_rate or '0')
+        if side == 'buy':
+            self.get_account(base)[0] += size
+            self.get_account(quote)[0] -= funds + fee
+            self.release(order_hold, limit_price * size if limit_price is not None else funds + fee)
+        else:
+            self.get_account(base)[0] -= size
+            self.get_account(quote)[0] += funds - fee
+            self.release(order_hold, size)
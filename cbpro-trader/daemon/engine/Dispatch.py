@@ -0,0 +1,54 @@
+# Messages types that update an order book on the full channel
+BOOK_MESSAGE_TYPES = ('received', 'open', 'done', 'match', 'change', 'activate')
+
+# Websocket channels, order book message types and the field counted for
+# sequence gaps per feed profile. 'ticker' keeps only the best bid and ask,
+# 'level2' an aggregated book and 'full' the order by order book. Only the
+# full channel sequence is gapless, the others check trade ids of matches.
+FEED_PROFILES = {
+    'ticker': {'channels': ['matches', 'heartbeat', 'ticker'], 'book_message_types': ('ticker', 'match'),
+               'sequence_field': 'trade_id'},
+    'level2': {'channels': ['matches', 'heartbeat', 'level2'], 'book_message_types': ('snapshot', 'l2update', 'match'),
+               'sequence_field': 'trade_id'},
+    'full': {'channels': ['full', 'heartbeat'], 'book_message_types': BOOK_MESSAGE_TYPES,
+             'sequence_field': 'sequence'},
+}
+
+
+def get_feed_profile(name):
+    if name not in FEED_PROFILES:
+        raise ValueError("Unknown feed profile '%s', expected one of %s" % (name, ", ".join(FEED_PROFILES)))
+    return FEED_PROFILES[name]
+
+
+def untimed(stage, func):
+    return func
+
+
+def build_dispatch(order_books, period_list, timed=untimed, book_message_types=BOOK_MESSAGE_TYPES):
+    # Routes each (product_id, message type) only to the order books and
+    # periods consuming that product instead of broadcasting every message.
+    # Returns the dispatch table and the periods fed by each product. Periods
+    # rolled up from a base period are updated by it and get no messages.
+    dispatch = {}
+    for product_id, order_book in order_books.items():
+        process_message = timed('process_message', order_book.process_message)
+        for msg_type in book_message_types:
+            dispatch.setdefault((product_id, msg_type), []).append(process_message)
+    product_periods = {}
+    for cur_period in period_list:
+        for product_id in cur_period.get_product_ids():
+            if getattr(cur_period, 'base_period', None) is None:
+                dispatch.setdefault((product_id, 'match'), []).append(timed('process_trade', cur_period.process_trade))
+                dispatch.setdefault((product_id, 'heartbeat'), []).append(
+                    timed('process_heartbeat', cur_period.process_heartbeat))
+            product_periods.setdefault(product_id, []).append(cur_period)
+    return dispatch, product_periods
+
+
+def get_product_trade_periods(product_periods, trade_period_list):
+    # For each product, the traded products with a period fed by it
+    return {product_id: {trade_product_id: trade_periods
+                         for trade_product_id, trade_periods in trade_period_list.items()
+                         if any(cur_period in period_list for cur_period in trade_periods)}
+            for product_id, period_list in product_periods.items()}
@@ -0,0 +1,81 @@
+import os
+import gzip
+import json
+import glob
+import time
+import struct
+import threading
+
+# Receive time and payload length ahead of every recorded message
+RECORD_HEADER = struct.Struct('>dI')
+
+
+def segment_paths(directory):
+    # Oldest first, the names sort by start time
+    return sorted(glob.glob(os.path.join(directory, 'feed-*.seg.gz')))
+
+
+def read_segment(path):
+    # (receive time, message) pairs. A segment cut short by a crash ends at
+    # its last complete record.
+    with gzip.open(path, 'rb') as segment:
+        while True:
+            try:
+                header = segment.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                received, length = RECORD_HEADER.unpack(header)
+                payload = segment.read(length)
+            except EOFError:
+                return
+            if len(payload) < length:
+                return
+            yield received, json.loads(payload)
+
+
+def read_recording(directory):
+    for path in segment_paths(directory):
+        for record in read_segment(path):
+            yield record
+
+
+class FeedRecorder:
+    # Websocket messages as received, appended to gzip compressed segment
+    # files in directory for FeedReplay. A new segment is started every
+    # segment_size bytes of messages, so finished segments can be moved or
+    # pruned while recording.
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, clock=time.time):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segment_bytes = 0
+        self.segments = 0
+        self.messages = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def open_segment(self):
+        self.segments += 1
+        name = 'feed-%s-%06d.seg.gz' % (time.strftime('%Y%m%dT%H%M%S', time.gmtime(self.clock())), self.segments)
+        self.segment = gzip.open(os.path.join(self.directory, name), 'wb', compresslevel=6)
+        self.segment_bytes = 0
+
+    def record(self, msg):
+        payload = json.dumps(msg, separators=(',', ':')).encode()
+        with self.lock:
+            if self.segment is None:
+                self.open_segment()
+            self.segment.write(RECORD_HEADER.pack(self.clock(), len(payload)))
+            self.segment.write(payload)
+            self.segment_bytes += RECORD_HEADER.size + len(payload)
+            self.messages += 1
+            if self.segment_bytes >= self.segment_size:
+                self.segment.close()
+                self.segment = None
+
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
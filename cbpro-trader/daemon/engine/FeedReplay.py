@@ -0,0 +1,114 @@
+import time
+import queue
+import logging
+import threading
+import trade
+from trade.isotime import parse_iso_time
+from .FeedRecorder import read_recording
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+def describe_recording(directory, max_messages=100000):
+    # Exchange time of the first message, and the first price and sequence
+    # of every product, from the start of a recording
+    start_time = None
+    prices = {}
+    sequences = {}
+    for idx, (received, msg) in enumerate(read_recording(directory)):
+        if idx >= max_messages:
+            break
+        product_id = msg.get('product_id')
+        if start_time is None and msg.get('time'):
+            start_time = parse_iso_time(msg['time'])[0]
+        if product_id is None:
+            continue
+        if msg.get('price') and msg.get('type') in ('match', 'ticker'):
+            prices.setdefault(product_id, msg['price'])
+        if msg.get('sequence') is not None and msg.get('type') != 'heartbeat':
+            sequences.setdefault(product_id, int(msg['sequence']))
+    return start_time, prices, sequences
+
+
+class FeedReplay:
+    # Stands in for TradeAndHeartbeatWebsocket, filling websocket_queue from
+    # a FeedRecorder directory. speed 1 replays at the recorded pace, N N
+    # times faster and 0 as fast as the queue is drained. A ReplayFinished
+    # is queued after the last message. Restarting after close(), as the
+    # daemon does after an error, resumes where the replay stopped.
+    def __init__(self, directory, speed=0, products=None, max_queue=10000, clock=time.monotonic, sleep=time.sleep):
+        self.logger = logging.getLogger('trader-logger')
+        self.directory = directory
+        self.speed = speed
+        self.products = set(products) if products is not None else None
+        self.clock = clock
+        self.sleep = sleep
+        # Bounded so a max speed replay does not load the whole recording
+        self.websocket_queue = queue.Queue(maxsize=max_queue)
+        self.error = None
+        self.stop = True
+        self.thread = None
+        self.messages = 0
+        # Recorded messages still to replay, and the one being put on the queue
+        self.source = None
+        self.pending = None
+
+    def start(self):
+        self.stop = False
+        self.error = None
+        if self.source is None:
+            self.source = self.records()
+        self.thread = threading.Thread(target=self.run, name='feed_replay', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stop = True
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def records(self):
+        for received, msg in read_recording(self.directory):
+            # Messages of products not subscribed to are skipped, as the exchange would
+            if self.products is None or msg.get('product_id') in self.products or msg.get('product_id') is None:
+                yield received, msg
+
+    def run(self):
+        self.logger.debug("-- Replaying %s ---", self.directory)
+        try:
+            first_received = start = None
+            while True:
+                if self.pending is None:
+                    self.pending = next(self.source, None)
+                    if self.pending is None:
+                        break
+                if self.stop:
+                    return
+                received, msg = self.pending
+                if self.speed:
+                    if first_received is None:
+                        first_received, start = received, self.clock()
+                    wait = (received - first_received) / self.speed - (self.clock() - start)
+                    if wait > 0:
+                        self.sleep(wait)
+                if not self.put(trade.decode_message(msg)):
+                    return
+                self.pending = None
+            self.put(ReplayFinished("Replayed %d messages from %s" % (self.messages, self.directory)))
+        except Exception as e:
+            # A restart resumes after the message that failed, or finishes
+            # the replay if reading the recording did
+            self.pending = None
+            self.error = e
+
+    def put(self, msg):
+        # False when stopped before msg could be queued
+        while not self.stop:
+            try:
+                self.websocket_queue.put(msg, timeout=0.1)
+                self.messages += 1
+                return True
+            except queue.Full:
+                pass
+        return False
@@ -0,0 +1,70 @@
+import itertools
+from .FeedReplay import describe_recording
+
+
+class OfflineClient:
+    # Stands in for cbpro.AuthenticatedClient while replaying a recording, so
+    # TradeEngine and the periods start without the exchange. Orders are
+    # accepted and never filled. History is flat at each product's first
+    # recorded price and ends with the candle before the recording starts,
+    # the same on every call, so re-initializing mid-replay works and
+    # refreshes never overwrite candles built from replayed trades.
+    def __init__(self, products=(), balances=None, start_time=0, prices=None, sequences=None,
+                 quote_increment='0.01', base_min_size='0.001'):
+        self.products = list(products)
+        self.balances = dict(balances or {})
+        self.start_time = start_time
+        self.prices = dict(prices or {})
+        self.sequences = dict(sequences or {})
+        self.quote_increment = quote_increment
+        self.base_min_size = base_min_size
+        self.order_ids = itertools.count(1)
+        self.orders = []
+
+    @classmethod
+    def from_recording(cls, directory, products, balances=None):
+        start_time, prices, sequences = describe_recording(directory)
+        return cls(products, balances, start_time or 0, prices, sequences)
+
+    def get_products(self):
+        return [{'id': product_id, 'base_currency': product_id.split('-')[0],
+                 'quote_currency': product_id.split('-')[1], 'quote_increment': self.quote_increment,
+                 'base_min_size': self.base_min_size} for product_id in self.products]
+
+    def get_accounts(self):
+        return [{'currency': currency, 'balance': str(balance), 'hold': '0', 'available': str(balance)}
+                for currency, balance in self.balances.items()]
+
+    def get_orders(self, product_id=None, status=None):
+        return iter([])
+
+    def get_fills(self, product_id=None, order_id=None):
+        return iter([])
+
+    def get_product_order_book(self, product_id, level=1):
+        # Books fill up from the replayed messages
+        return {'sequence': self.sequences.get(product_id, 1) - 1, 'bids': [], 'asks': []}
+
+    def get_product_historic_rates(self, product_id, start=None, end=None, granularity=None):
+        price = float(self.prices.get(product_id, 1.0))
+        last = self.start_time - self.start_time % granularity - granularity
+        # Newest first, [time, low, high, open, close, volume]
+        return [[last - idx * granularity, price, price, price, price, 0.0] for idx in range(200)]
+
+    def place_order(self, product_id, side, order_type, **params):
+        order = dict(params, id='offline-%d' % next(self.order_ids), product_id=product_id, side=side,
+                     type=order_type, status='pending', filled_size='0')
+        self.orders.append(order)
+        return order
+
+    def place_limit_order(self, product_id, side, price, size, **params):
+        return self.place_order(product_id, side, 'limit', price=price, size=size, **params)
+
+    def place_market_order(self, product_id, side, size=None, funds=None, **params):
+        return self.place_order(product_id, side, 'market', size=size, funds=funds, **params)
+
+    def cancel_order(self, order_id):
+        return [order_id]
+
+    def cancel_all(self, product_id=None):
+        return []
@@ -1,28 +1,246 @@
 import cbpro
-import time
+import bisect
 import logging
+import threading
+import numpy as np
+import trade
+from decimal import Decimal
 
-class OrderBookCustom(cbpro.OrderBook):
-    def __init__(self, product_id='BTC-USD', auth_client=None):
+
+class BookSide(object):
+    # Price levels of one side, keyed by integer ticks. ticks is kept sorted
+    # ascending so the best level is at one end and top N levels are a slice.
+    def __init__(self, descending=False):
+        self.descending = descending
+        self.ticks = []
+        # tick -> [size, number of orders]
+        self.levels = {}
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def best(self):
+        if not self.ticks:
+            return None
+        return self.ticks[-1] if self.descending else self.ticks[0]
+
+    def add(self, tick, size, orders=1):
+        level = self.levels.get(tick)
+        if level is None:
+            self.levels[tick] = [size, orders]
+            bisect.insort(self.ticks, tick)
+        else:
+            level[0] += size
+            level[1] += orders
+
+    def reduce(self, tick, size, orders=1):
+        level = self.levels.get(tick)
+        if level is None:
+            return
+        level[0] -= size
+        level[1] -= orders
+        if level[1] <= 0:
+            self.remove(tick)
+
+    def set(self, tick, size):
+        if size > 0:
+            if tick in self.levels:
+                self.levels[tick][0] = size
+            else:
+                self.add(tick, size)
+        elif tick in self.levels:
+            self.remove(tick)
+
+    def remove(self, tick):
+        del self.levels[tick]
+        del self.ticks[bisect.bisect_left(self.ticks, tick)]
+
+    def top(self, num_levels):
+        ticks = self.ticks[-num_levels:][::-1] if self.descending else self.ticks[:num_levels]
+        sizes = np.fromiter((self.levels[tick][0] for tick in ticks), dtype=np.float64, count=len(ticks))
+        return np.array(ticks, dtype=np.float64), sizes
+
+
+class OrderBookCustom(object):
+    # Order book fed by the dispatch table. Builds from the full channel
+    # (L3, resynced from a REST snapshot on start and sequence gaps) or the
+    # level2 channel (snapshot and l2update messages), or keeps only the best
+    # prices of the ticker channel, depending on feed. Prices are integer
+    # multiples of tick_size, the product's quote_increment when known.
+    def __init__(self, product_id='BTC-USD', auth_client=None, tick_size='0.00000001', feed='full'):
         self.logger = logging.getLogger('trader-logger')
         self.error_logger = logging.getLogger('error-logger')
-        super(OrderBookCustom, self).__init__(product_id=product_id)
-        if auth_client is not None:
-            self._client = auth_client
+        self.product_id = product_id
+        self.feed = feed
+        self._client = auth_client if auth_client is not None else cbpro.PublicClient()
+        self.tick_size = Decimal(tick_size)
+        self.tick_float = float(self.tick_size)
+        self.ready = threading.Event()
+        self._current_ticker = None
+        self.best_bid = None
+        self.best_ask = None
+        self.clear()
 
-    def is_ready(self):
-        try:
-            super(OrderBookCustom, self).get_ask()
-        except (ValueError, AttributeError):
+    def clear(self):
+        # Readers wait until the book is rebuilt, best prices keep their last
+        # values for readers that got past the wait already
+        self.ready.clear()
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide()
+        # order id -> (side, tick, remaining size), full channel only
+        self.orders = {}
+        self._sequence = -1
+
+    def to_tick(self, price):
+        return int(round(float(price) / self.tick_float))
+
+    def to_price(self, tick):
+        return self.tick_size * tick
+
+    def get_side(self, side):
+        return self.bids if side == 'buy' else self.asks
+
+    def reset_book(self):
+        self.clear()
+        res = self._client.get_product_order_book(product_id=self.product_id, level=3)
+        for side, orders in (('buy', res['bids']), ('sell', res['asks'])):
+            for price, size, order_id in orders:
+                self.add({'order_id': order_id, 'side': side, 'price': price, 'size': size})
+        self._sequence = res['sequence']
+        self.update_best()
+
+    def process_message(self, msg):
+        # Decoded trade and heartbeat events carry the original message
+        if isinstance(msg, (trade.Trade, trade.Heartbeat)):
+            msg = msg.raw
+        msg_type = msg.get('type')
+        if msg_type == 'match' and self.feed != 'full':
+            # Matches channel, no order ids to apply to the book
+            self._current_ticker = msg
+            return
+        elif msg_type == 'ticker':
+            self._current_ticker = msg
+            if msg.get('best_bid') and msg.get('best_ask'):
+                self.best_bid = self.to_tick(msg['best_bid'])
+                self.best_ask = self.to_tick(msg['best_ask'])
+                self.ready.set()
+            return
+        elif msg_type == 'snapshot':
+            self.load_level2(msg)
+        elif msg_type == 'l2update':
+            for side, price, size in msg.get('changes'):
+                self.get_side(side).set(self.to_tick(price), float(size))
+        else:
+            if not self.process_full_message(msg):
+                return
+        self.update_best()
+
+    def process_full_message(self, msg):
+        sequence = msg.get('sequence', -1)
+        if self._sequence == -1:
+            self.reset_book()
+            return False
+        if sequence <= self._sequence:
+            # Older than the snapshot the book was built from
             return False
+        elif sequence > self._sequence + 1:
+            self.logger.debug("Messages missing for %s (%d - %d), resetting book",
+                              self.product_id, self._sequence, sequence)
+            self.reset_book()
+            return False
+
+        msg_type = msg['type']
+        if msg_type == 'open':
+            self.add(msg)
+        elif msg_type == 'done':
+            self.remove(msg.get('order_id'))
+        elif msg_type == 'match':
+            self.match(msg)
+            self._current_ticker = msg
+        elif msg_type == 'change':
+            self.change(msg)
+        self._sequence = sequence
         return True
 
+    def load_level2(self, msg):
+        self.clear()
+        for price, size in msg.get('bids'):
+            self.bids.set(self.to_tick(price), float(size))
+        for price, size in msg.get('asks'):
+            self.asks.set(self.to_tick(price), float(size))
+
+    def add(self, order):
+        tick = self.to_tick(order['price'])
+        size = float(order.get('size') or order.get('remaining_size'))
+        order_id = order.get('order_id') or order.get('id')
+        self.orders[order_id] = (order['side'], tick, size)
+        self.get_side(order['side']).add(tick, size)
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            side, tick, size = order
+            self.get_side(side).reduce(tick, size)
+
+    def match(self, msg):
+        maker_order_id = msg.get('maker_order_id')
+        order = self.orders.get(maker_order_id)
+        if order is None:
+            return
+        side, tick, size = order
+        matched = float(msg['size'])
+        if matched >= size:
+            self.remove(maker_order_id)
+        else:
+            self.orders[maker_order_id] = (side, tick, size - matched)
+            self.get_side(side).reduce(tick, matched, orders=0)
+
+    def change(self, msg):
+        order = self.orders.get(msg.get('order_id'))
+        if order is None or msg.get('new_size') is None:
+            return
+        side, tick, size = order
+        new_size = float(msg['new_size'])
+        self.orders[msg['order_id']] = (side, tick, new_size)
+        self.get_side(side).add(tick, new_size - size, orders=0)
+
+    def update_best(self):
+        # Kept as plain attributes so other threads read them without locking
+        best_bid = self.bids.best()
+        best_ask = self.asks.best()
+        if best_bid is not None and best_ask is not None:
+            self.best_bid = best_bid
+            self.best_ask = best_ask
+            self.ready.set()
+
+    def is_ready(self):
+        return self.ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
     def get_ask(self):
-        while not self.is_ready():
-            time.sleep(0.01)
-        return super(OrderBookCustom, self).get_ask()
+        self.ready.wait()
+        return self.to_price(self.best_ask)
 
     def get_bid(self):
-        while not self.is_ready():
-            time.sleep(0.01)
-        return super(OrderBookCustom, self).get_bid()
\ No newline at end of file
+        self.ready.wait()
+        return self.to_price(self.best_bid)
+
+    def get_current_ticker(self):
+        return self._current_ticker
+
+    def get_depth(self, num_levels=10):
+        # (bid prices, bid sizes, ask prices, ask sizes) of the best levels
+        bid_ticks, bid_sizes = self.bids.top(num_levels)
+        ask_ticks, ask_sizes = self.asks.top(num_levels)
+        return bid_ticks * self.tick_float, bid_sizes, ask_ticks * self.tick_float, ask_sizes
+
+    def get_imbalance(self, num_levels=10):
+        # From -1 (only asks) to 1 (only bids) over the best levels
+        bid_ticks, bid_sizes = self.bids.top(num_levels)
+        ask_ticks, ask_sizes = self.asks.top(num_levels)
+        total = bid_sizes.sum() + ask_sizes.sum()
+        if total <= 0:
+            return 0.0
+        return float((bid_sizes.sum() - ask_sizes.sum()) / total)
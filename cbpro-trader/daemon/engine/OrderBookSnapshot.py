@@ -0,0 +1,36 @@
+import threading
+
+
+class OrderBookSnapshot(object):
+    # Read-only stand-in for OrderBookCustom when the book itself is
+    # maintained by a shard worker process and only best prices are sent back
+    def __init__(self, product_id='BTC-USD'):
+        self.product_id = product_id
+        self.bid = None
+        self.ask = None
+        self.ticker = None
+        self.ready = threading.Event()
+
+    def update(self, bid, ask, ticker):
+        self.bid = bid
+        self.ask = ask
+        self.ticker = ticker
+        if bid is not None and ask is not None:
+            self.ready.set()
+
+    def process_message(self, msg):
+        pass
+
+    def is_ready(self):
+        return self.ready.is_set()
+
+    def get_ask(self):
+        self.ready.wait()
+        return self.ask
+
+    def get_bid(self):
+        self.ready.wait()
+        return self.bid
+
+    def get_current_ticker(self):
+        return self.ticker
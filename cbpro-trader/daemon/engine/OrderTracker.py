@@ -0,0 +1,163 @@
+import threading
+import itertools
+from collections import OrderedDict, deque
+from decimal import Decimal
+
+# Message types of the authenticated user channel
+USER_MESSAGE_TYPES = ('received', 'open', 'match', 'change', 'done')
+
+
+def is_user_message(msg):
+    # The user channel tags messages about our own orders with our profile
+    return msg.get('profile_id') is not None
+
+
+class OrderTracker:
+    # Open orders by id and product and a ledger of recent fills, kept up to
+    # date from user channel messages. REST is only used by reconcile(), at
+    # startup and after reconnects when messages may have been missed.
+    max_done_orders = 100
+
+    def __init__(self, auth_client, product_ids=(), max_fills=100):
+        self.auth_client = auth_client
+        self.product_ids = list(product_ids)
+        self.lock = threading.Lock()
+        # Notified on every change, order threads wait on it instead of polling
+        self.changed = threading.Condition(self.lock)
+        self.orders = {}
+        self.product_orders = {}
+        # Last state of orders that are no longer open, for get_order()
+        self.done_orders = OrderedDict()
+        # Newest first
+        self.fills = deque(maxlen=max_fills)
+        self.fill_ids = set()
+        self.all_open_orders = []
+        # Called with the lock held after every change, from the thread
+        # that processed the message
+        self.listeners = []
+
+    def reconcile(self):
+        orders = list(self.auth_client.get_orders())
+        fills = []
+        for product_id in self.product_ids:
+            fills += list(itertools.islice(self.auth_client.get_fills(product_id=product_id), 5))
+        self.set_state(orders, fills)
+
+    def set_state(self, orders, fills):
+        with self.changed:
+            self.orders = {}
+            self.product_orders = {}
+            for order in orders:
+                self.set_order(order)
+            for fill in sorted(fills, key=lambda fill: fill['created_at']):
+                self.add_fill(fill)
+            self.update_views()
+            self.notify()
+
+    def notify(self):
+        self.changed.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def set_order(self, order):
+        self.orders[order['id']] = order
+        self.product_orders.setdefault(order.get('product_id'), {})[order['id']] = order
+
+    def finish_order(self, order_id, status='done', reason=None):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return
+        self.product_orders.get(order.get('product_id'), {}).pop(order_id, None)
+        order = dict(order, status=status, done_reason=reason)
+        self.done_orders[order_id] = order
+        while len(self.done_orders) > self.max_done_orders:
+            self.done_orders.popitem(last=False)
+
+    def add_fill(self, fill):
+        if fill.get('trade_id') in self.fill_ids:
+            return
+        if len(self.fills) == self.fills.maxlen:
+            self.fill_ids.discard(self.fills[-1].get('trade_id'))
+        self.fills.appendleft(fill)
+        self.fill_ids.add(fill.get('trade_id'))
+
+    def update_views(self):
+        # New lists rather than changed ones, other threads may be iterating
+        self.all_open_orders = list(self.orders.values())
+
+    def add_order(self, order):
+        # Response of a REST order placement, ahead of its received message
+        if order.get('id') is None or order.get('status') not in ('pending', 'open'):
+            return
+        with self.changed:
+            if order['id'] not in self.orders and order['id'] not in self.done_orders:
+                self.set_order(dict(order))
+                self.update_views()
+                self.notify()
+
+    def process_message(self, msg):
+        msg_type = msg.get('type')
+        with self.changed:
+            if msg_type == 'received':
+                order_id = msg.get('order_id')
+                if order_id not in self.done_orders:
+                    self.set_order(dict(self.orders.get(order_id, {}), id=order_id,
+                                        product_id=msg.get('product_id'), side=msg.get('side'),
+                                        price=msg.get('price'), size=msg.get('size'), funds=msg.get('funds'),
+                                        type=msg.get('order_type'), created_at=msg.get('time'),
+                                        filled_size=self.orders.get(order_id, {}).get('filled_size', '0'),
+                                        status='pending'))
+            elif msg_type == 'open':
+                order = self.orders.get(msg.get('order_id'))
+                if order is not None:
+                    self.set_order(dict(order, status='open', price=msg.get('price', order.get('price'))))
+            elif msg_type == 'change':
+                order = self.orders.get(msg.get('order_id'))
+                if order is not None and msg.get('new_size') is not None:
+                    self.set_order(dict(order, size=msg['new_size']))
+            elif msg_type == 'match':
+                self.process_match(msg)
+            elif msg_type == 'done':
+                self.finish_order(msg.get('order_id'), reason=msg.get('reason'))
+            else:
+                return
+            self.update_views()
+            self.notify()
+
+    def process_match(self, msg):
+        maker_order_id = msg.get('maker_order_id')
+        if maker_order_id in self.orders or maker_order_id in self.done_orders or \
+                (msg.get('maker_profile_id') is not None and msg.get('maker_profile_id') == msg.get('profile_id')):
+            order_id, liquidity, side = msg.get('maker_order_id'), 'M', msg.get('side')
+        else:
+            # The taker is on the opposite side of the resting order
+            order_id, liquidity = msg.get('taker_order_id'), 'T'
+            side = 'sell' if msg.get('side') == 'buy' else 'buy'
+        price = Decimal(msg.get('price'))
+        size = Decimal(msg.get('size'))
+        fee_rate = Decimal(msg.get('maker_fee_rate' if liquidity == 'M' else 'taker_fee_rate') or '0')
+        self.add_fill({'trade_id': msg.get('trade_id'), 'product_id': msg.get('product_id'), 'order_id': order_id,
+                       'side': side, 'price': msg.get('price'), 'size': msg.get('size'),
+                       'fee': str(price * size * fee_rate), 'usd_volume': str(price * size),
+                       'liquidity': liquidity, 'created_at': msg.get('time')})
+        order = self.orders.get(order_id)
+        if order is not None:
+            filled_size = Decimal(order.get('filled_size') or '0') + size
+            self.set_order(dict(order, filled_size=str(filled_size)))
+
+    def get_order(self, order_id):
+        # Current state of an order, None if no message about it arrived yet
+        with self.lock:
+            return self.orders.get(order_id) or self.done_orders.get(order_id)
+
+    def get_open_orders(self, product_id):
+        with self.lock:
+            return list(self.product_orders.get(product_id, {}).values())
+
+    def get_recent_fills(self, limit=5):
+        with self.lock:
+            return list(itertools.islice(self.fills, limit))
+
+    def wait_for_update(self, timeout):
+        with self.changed:
+            return self.changed.wait(timeout)
@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+
+
+class ProductRegistry:
+    # Product metadata from a single get_products() call, indexed by id.
+    # Saved to path so restarts within ttl seconds skip the request, and
+    # refreshed in the background once it is older than that.
+    def __init__(self, auth_client, path=None, ttl=3600, retry_wait=3):
+        self.logger = logging.getLogger('trader-logger')
+        self.error_logger = logging.getLogger('error-logger')
+        self.auth_client = auth_client
+        self.path = path
+        self.ttl = ttl
+        self.retry_wait = retry_wait
+        self.products = {}
+        self.updated = 0
+        self.refresh_thread = None
+        self.stop_refresh = threading.Event()
+
+    def load(self):
+        if self.path is not None and os.path.exists(self.path) and time.time() - os.path.getmtime(self.path) < self.ttl:
+            try:
+                with open(self.path) as products_file:
+                    self.set_products(json.load(products_file), os.path.getmtime(self.path))
+                return self
+            except ValueError:
+                self.error_logger.exception(datetime.datetime.now())
+        self.refresh()
+        return self
+
+    def fetch(self):
+        cbpro_products = self.auth_client.get_products()
+        while not isinstance(cbpro_products, list):
+            # May be rate limited
+            time.sleep(self.retry_wait)
+            cbpro_products = self.auth_client.get_products()
+        return cbpro_products
+
+    def refresh(self):
+        cbpro_products = self.fetch()
+        self.set_products(cbpro_products, time.time())
+        if self.path is not None:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as products_file:
+                json.dump(cbpro_products, products_file)
+            os.replace(tmp_path, self.path)
+
+    def set_products(self, cbpro_products, updated):
+        # Replaced in one assignment so readers never see a partial index
+        self.products = {cbpro_product.get('id'): cbpro_product for cbpro_product in cbpro_products}
+        self.updated = updated
+
+    def get(self, product_id):
+        return self.products.get(product_id)
+
+    def product_ids(self):
+        return list(self.products)
+
+    def start_refresh(self):
+        if self.refresh_thread is None:
+            self.refresh_thread = threading.Thread(target=self.refresh_loop, name='product_refresh', daemon=True)
+            self.refresh_thread.start()
+
+    def refresh_loop(self):
+        while not self.stop_refresh.wait(max(self.updated + self.ttl - time.time(), 1)):
+            try:
+                self.refresh()
+            except Exception:
+                self.error_logger.exception(datetime.datetime.now())
+
+    def close(self):
+        self.stop_refresh.set()
@@ -0,0 +1,101 @@
+import time
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from .TokenBucket import TokenBucket
+
+
+class InFlightRequest:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class RestSession(requests.Session):
+    # Session shared by every cbpro client call. Requests go through a token
+    # bucket per rate limit class and are retried when rate limited anyway.
+    # Identical GETs made at the same time share one request and responses
+    # are reused for cache_ttl seconds. Any other method clears the cache, as
+    # it may change orders or balances.
+    public_endpoints = ('/products', '/currencies', '/time')
+
+    def __init__(self, public_rate=3, public_burst=6, private_rate=5, private_burst=10, cache_ttl=0.5,
+                 pool_size=10, max_retries=3, retry_wait=1.0, max_cache_entries=256):
+        super(RestSession, self).__init__()
+        self.logger = logging.getLogger('trader-logger')
+        self.public_bucket = TokenBucket(public_rate, public_burst)
+        self.private_bucket = TokenBucket(private_rate, private_burst)
+        self.cache_ttl = cache_ttl
+        self.max_retries = max_retries
+        self.retry_wait = retry_wait
+        self.max_cache_entries = max_cache_entries
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.in_flight = {}
+        # Bumped by every write so GETs sent before it are not cached
+        self.generation = 0
+        # Keep-alive connections for the order, fill and balance threads
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def get_bucket(self, url):
+        path = urlsplit(url).path
+        if path.startswith(self.public_endpoints):
+            return self.public_bucket
+        return self.private_bucket
+
+    def send_limited(self, method, url, **kwargs):
+        bucket = self.get_bucket(url)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            response = super(RestSession, self).request(method, url, **kwargs)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            self.logger.debug("Rate limited on %s, retrying", url)
+            time.sleep(self.retry_wait * (attempt + 1))
+
+    def request(self, method, url, params=None, **kwargs):
+        if method.upper() != 'GET':
+            response = self.send_limited(method, url, params=params, **kwargs)
+            with self.lock:
+                self.cache = {}
+                self.generation += 1
+            return response
+
+        key = (url, tuple(sorted((name, str(value)) for name, value in (params or {}).items())))
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+                return cached[1]
+            call = self.in_flight.get(key)
+            owner = call is None
+            if owner:
+                call = self.in_flight[key] = InFlightRequest()
+                generation = self.generation
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.response
+
+        try:
+            # params may be changed by the caller afterwards (pagination)
+            call.response = self.send_limited(method, url, params=dict(params or {}), **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if call.response is not None and call.response.ok and generation == self.generation:
+                    if len(self.cache) >= self.max_cache_entries:
+                        now = time.monotonic()
+                        self.cache = {cache_key: entry for cache_key, entry in self.cache.items()
+                                      if now - entry[0] < self.cache_ttl}
+                    self.cache[key] = (time.monotonic(), call.response)
+            call.done.set()
+        return call.response
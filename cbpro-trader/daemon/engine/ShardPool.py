@@ -0,0 +1,243 @@
+import time
+import queue
+import logging
+import datetime
+import multiprocessing
+from .Dispatch import build_dispatch, get_feed_profile
+
+
+def get_period_product_ids(period_config, fiat='USD'):
+    product_id = period_config['product']
+    if period_config.get('meta'):
+        base, quoted = product_id.split('-')
+        return [base + '-' + fiat, quoted + '-' + fiat]
+    return [product_id]
+
+
+def partition_products(period_configs, num_shards, fiat='USD'):
+    # Products read by the same period (both legs of a meta period) must be
+    # handled by the same worker, so group them before balancing the groups
+    groups = []
+    for period_config in period_configs:
+        product_ids = set(get_period_product_ids(period_config, fiat))
+        merged = [group for group in groups if group & product_ids]
+        for group in merged:
+            groups.remove(group)
+            product_ids |= group
+        groups.append(product_ids)
+
+    shards = [set() for _ in range(num_shards)]
+    for group in sorted(groups, key=lambda group: (-len(group), sorted(group))):
+        min(shards, key=len).update(group)
+    return [shard for shard in shards if shard]
+
+
+def period_snapshot(cur_period, indicators, sent_state):
+    # Only closed candles the coordinator has not seen are included. The whole
+    # history is resent if it was rewritten since the last snapshot.
+    candlesticks = cur_period.candlesticks
+    last_sent = sent_state.get(cur_period.name)
+    reset = last_sent is None or last_sent[0] != candlesticks.revision
+    if reset:
+        new_candles = len(candlesticks)
+    else:
+        new_candles = min(candlesticks.appended - last_sent[1], len(candlesticks))
+    sent_state[cur_period.name] = (candlesticks.revision, candlesticks.appended)
+    return ('period', cur_period.name, reset,
+            [candlesticks[idx] for idx in range(-new_candles, 0)],
+            cur_period.cur_candlestick.to_list(),
+            {name: value for name, value in indicators.items() if not callable(value)})
+
+
+def book_snapshot(order_book):
+    if not order_book.is_ready():
+        return None
+    ticker = order_book.get_current_ticker()
+    return ('book', order_book.product_id, order_book.get_bid(), order_book.get_ask(),
+            {'price': ticker.get('price')} if ticker else None)
+
+
+def run_shard(shard_id, book_tick_sizes, period_configs, config, inbox, outbox):
+    # Worker process entry point. Owns the order books, periods and indicator
+    # state for its products and reports compact snapshots to the coordinator.
+    # book_tick_sizes maps the products to keep books for to their
+    # quote_increment, None for the OrderBookCustom default.
+    import cbpro
+    import period
+    import indicators
+    from .OrderBookCustom import OrderBookCustom
+
+    # Spawned workers start without the coordinator's logging setup
+    logger = logging.getLogger('trader-logger')
+    logger.setLevel(logging.DEBUG)
+    if config.get('logging'):
+        logger.addHandler(logging.FileHandler("debug-shard-%d.log" % shard_id))
+    error_logger = logging.getLogger('error-logger')
+    error_logger.addHandler(logging.FileHandler("error-shard-%d.log" % shard_id))
+    public_client = cbpro.PublicClient()
+    max_candles = config.get('max_candles', 1000)
+    candle_cache = period.CandleCache(config['candle_cache']) if config.get('candle_cache') else None
+
+    period_list = period.create_periods(period_configs, fiat=config['fiat'], cbpro_client=public_client,
+                                        max_candles=max_candles, candle_cache=candle_cache,
+                                        aggregate=config.get('aggregate_periods', False))
+    indicator_subsys = indicators.IndicatorSubsystem(period_list, None,
+                                                     incremental=config.get('incremental_indicators', False))
+
+    feed = config.get('feed', 'full')
+    order_books = {}
+    for product_id, tick_size in book_tick_sizes.items():
+        if tick_size is not None:
+            order_books[product_id] = OrderBookCustom(product_id=product_id, tick_size=tick_size, feed=feed)
+        else:
+            order_books[product_id] = OrderBookCustom(product_id=product_id, feed=feed)
+    dispatch, product_periods = build_dispatch(order_books, period_list,
+                                               book_message_types=get_feed_profile(feed)['book_message_types'])
+
+    def recalculate_and_send(cur_period):
+        try:
+            indicator_subsys.recalculate_indicators(cur_period)
+        except Exception:
+            error_logger.exception(datetime.datetime.now())
+            return
+        outbox.put(period_snapshot(cur_period, indicator_subsys.current_indicators[cur_period.name], sent_state))
+
+    sent_state = {}
+    pending_periods = set()
+    for cur_period in period_list:
+        recalculate_and_send(cur_period)
+    outbox.put(('ready', shard_id))
+
+    last_books = {}
+    last_indicator_update = 0
+    while True:
+        # Drain whatever is queued so bursts produce one snapshot per period
+        batch = [inbox.get()]
+        try:
+            while len(batch) < 500:
+                batch.append(inbox.get_nowait())
+        except queue.Empty:
+            pass
+
+        touched_books = set()
+        stop = False
+        for msg in batch:
+            if msg is None:
+                stop = True
+                break
+            msg_type = msg.get('type')
+            product_id = msg.get('product_id')
+            try:
+                for handler in dispatch.get((product_id, msg_type), ()):
+                    handler(msg)
+            except Exception:
+                error_logger.exception(datetime.datetime.now())
+                continue
+            if product_id in order_books:
+                touched_books.add(product_id)
+            if msg_type in ('match', 'heartbeat'):
+                pending_periods.update(product_periods.get(product_id, ()))
+        if stop:
+            break
+
+        if indicator_subsys.incremental or time.time() - last_indicator_update >= 1.0:
+            for cur_period in pending_periods:
+                recalculate_and_send(cur_period)
+            pending_periods.clear()
+            last_indicator_update = time.time()
+        for product_id in touched_books:
+            snapshot = book_snapshot(order_books[product_id])
+            if snapshot is not None and snapshot[2:4] != last_books.get(product_id):
+                last_books[product_id] = snapshot[2:4]
+                outbox.put(snapshot)
+    logger.debug("Shard %d stopped", shard_id)
+
+
+class ShardPool(object):
+    def __init__(self, num_shards, config, start_timeout=600, product_registry=None):
+        self.logger = logging.getLogger('trader-logger')
+        self.error_logger = logging.getLogger('error-logger')
+        # Seconds to wait for every worker to load its history
+        self.start_timeout = start_timeout
+        fiat = config['fiat']
+        self.shards = partition_products(config['periods'], num_shards, fiat=fiat)
+        self.shard_of = {}
+        for shard_id, product_ids in enumerate(self.shards):
+            for product_id in product_ids:
+                self.shard_of[product_id] = shard_id
+
+        # Workers are spawned rather than forked, the coordinator runs threads
+        context = multiprocessing.get_context('spawn')
+        self.inboxes = [context.Queue() for _ in self.shards]
+        self.outbox = context.Queue()
+        self.processes = []
+        for shard_id, product_ids in enumerate(self.shards):
+            period_configs = [period_config for period_config in config['periods']
+                              if set(get_period_product_ids(period_config, fiat)) <= product_ids]
+            # Books are only kept for real products, meta periods just need the trades
+            book_product_ids = sorted({period_config['product'] for period_config in period_configs
+                                       if not period_config.get('meta')})
+            # Ticks of the product like Product's books, see ProductRegistry
+            book_tick_sizes = {}
+            for product_id in book_product_ids:
+                cbpro_product = product_registry.get(product_id) if product_registry is not None else None
+                book_tick_sizes[product_id] = cbpro_product.get('quote_increment') if cbpro_product is not None else None
+            process = context.Process(target=run_shard, name='shard-%d' % shard_id, daemon=True,
+                                      args=(shard_id, book_tick_sizes, period_configs, config,
+                                            self.inboxes[shard_id], self.outbox))
+            self.processes.append(process)
+
+    def start(self):
+        # Blocks until every worker has loaded its history and sent a first snapshot
+        for process in self.processes:
+            process.start()
+        snapshots = []
+        ready = 0
+        deadline = time.time() + self.start_timeout
+        while ready < len(self.processes):
+            try:
+                snapshot = self.outbox.get(timeout=1)
+            except queue.Empty:
+                self.check_workers()
+                if time.time() > deadline:
+                    self.close()
+                    raise RuntimeError("Shard workers not ready after %d seconds" % self.start_timeout)
+                continue
+            if snapshot[0] == 'ready':
+                self.logger.debug("Shard %d ready", snapshot[1])
+                ready += 1
+            else:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def check_workers(self):
+        # A dead worker would silently stop updating its products
+        for shard_id, process in enumerate(self.processes):
+            if not process.is_alive():
+                self.close()
+                raise RuntimeError("Shard %d exited with code %s" % (shard_id, process.exitcode))
+
+    def route(self, msg):
+        # Every message for a product goes to the same worker, which keeps the
+        # per-product sequence order intact
+        shard_id = self.shard_of.get(msg.get('product_id'))
+        if shard_id is not None:
+            self.inboxes[shard_id].put(msg)
+
+    def poll(self):
+        self.check_workers()
+        snapshots = []
+        try:
+            while True:
+                snapshots.append(self.outbox.get_nowait())
+        except queue.Empty:
+            pass
+        return snapshots
+
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
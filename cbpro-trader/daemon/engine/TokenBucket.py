@@ -0,0 +1,31 @@
+import time
+import threading
+
+
+class TokenBucket:
+    # Allows rate requests per second with bursts of up to burst requests.
+    # Callers over the limit reserve a token and sleep until it is theirs,
+    # so waiting threads keep their order without holding the lock.
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.last = clock()
+
+    def reserve(self):
+        # Takes a token and returns the seconds to wait before using it
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            self.sleep(wait)
+        return wait
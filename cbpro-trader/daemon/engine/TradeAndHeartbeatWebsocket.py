@@ -2,20 +2,31 @@ import datetime
 import logging
 import queue
 import cbpro
+import trade
 from websocket import WebSocketConnectionClosedException
 
 class TradeAndHeartbeatWebsocket(cbpro.WebsocketClient):
-    def __init__(self, fiat='USD', sandbox=False):
+    def __init__(self, fiat='USD', sandbox=False, products=None, channels=None, key=None, secret=None, passphrase=None, recorder=None):
         self.logger = logging.getLogger('trader-logger')
         self.error_logger = logging.getLogger('error-logger')
         self.fiat_currency = fiat
-        self.products = ["BTC-" + self.fiat_currency, "ETH-" + self.fiat_currency]
-        self.channels = ['full', 'heartbeat']
+        # FeedRecorder keeping every message for FeedReplay, if any
+        self.recorder = recorder
+        if products is None:
+            products = ["BTC-" + self.fiat_currency, "ETH-" + self.fiat_currency]
+        self.products = list(products)
+        # Channels of the configured feed profile, see engine.FEED_PROFILES
+        self.channels = list(channels) if channels is not None else ['full', 'heartbeat']
+        if key:
+            # Our own order events, signed with the API key
+            self.channels.append('user')
         if sandbox:
             url="wss://ws-feed-public.sandbox.pro.coinbase.com"
         else:
             url="wss://ws-feed.pro.coinbase.com"
-        super(TradeAndHeartbeatWebsocket, self).__init__(products=self.products, channels=self.channels, url=url)
+        super(TradeAndHeartbeatWebsocket, self).__init__(products=self.products, channels=self.channels, url=url,
+                                                         auth=bool(key), api_key=key or '', api_secret=secret or '',
+                                                         api_passphrase=passphrase or '')
 
 
     def on_open(self):
@@ -45,4 +56,7 @@ class TradeAndHeartbeatWebsocket(cbpro.WebsocketClient):
                 pass
 
     def on_message(self, msg):
-        self.websocket_queue.put(msg)
\ No newline at end of file
+        if self.recorder is not None:
+            self.recorder.record(msg)
+        # Decode once here so consumers never re-parse timestamps or prices
+        self.websocket_queue.put(trade.decode_message(msg))
\ No newline at end of file
@@ -2,17 +2,24 @@ import time
 import logging
 import threading
 import datetime
-import itertools
-import math
 from decimal import Decimal, ROUND_DOWN
+import storage
+from strategy import Strategy
 from .Product import Product
+from .ProductRegistry import ProductRegistry
+from .OrderTracker import OrderTracker
+from .BalanceLedger import BalanceLedger
 
 
 class TradeEngine:
-    def __init__(self, auth_client, mongo_connection, product_list=['BTC-USD', 'ETH-USD', 'LTC-USD'], fiat='USD', is_live=False, max_slippage=Decimal('0.10')):
+    def __init__(self, auth_client, mongo_connection, product_list=['BTC-USD', 'ETH-USD', 'LTC-USD'], fiat='USD', is_live=False, max_slippage=Decimal('0.10'), product_registry=None, feed='full', balance_reconcile_interval=30, journal=None, strategy=None):
         self.logger = logging.getLogger('trader-logger')
         self.error_logger = logging.getLogger('error-logger')
         self.mc = mongo_connection
+        # storage.TradeJournal recording trade decisions, if enabled
+        self.journal = journal
+        # Buy and sell rules, see strategy.Strategy
+        self.strategy = strategy if strategy is not None else Strategy()
         self.auth_client = auth_client
         self.product_list = product_list
         self.fiat_currency = fiat
@@ -20,24 +27,63 @@ class TradeEngine:
         self.market_orders = True  # TODO: make this a config option
         self.available_products = []
         self.products = []
-        self.balances = {}
-        self.stop_update_order_thread = False
-        self.last_order_update = time.time()
-        self.all_open_orders = []
-        self.recent_fills = []
+        # Balances from order and fill events, reconciled with get_accounts in the background
+        self.balance_ledger = BalanceLedger(auth_client, reconcile_interval=balance_reconcile_interval)
+        # Open orders and fills from the user channel, see process_user_message
+        self.order_tracker = OrderTracker(auth_client)
+        # Product metadata fetched once and shared by every product
+        if product_registry is None:
+            product_registry = ProductRegistry(auth_client).load()
+        self.product_registry = product_registry
         for product in self.product_list:
-            self.products.append(Product(auth_client, product_id=product))
-        self.last_balance_update = 0
-        self.update_amounts()
+            self.products.append(Product(auth_client, product_id=product, product_registry=product_registry, feed=feed,
+                                         order_tracker=self.order_tracker))
+        self.order_tracker.product_ids = [product.product_id for product in self.products if not product.meta]
+        self.reconcile_orders()
+        self.reconcile_balances()
+        self.start_balance_reconcile()
         self.init_available_products()
-        self.last_balance_update = time.time()
         self.max_slippage = max_slippage
-        self.update_order_thread = threading.Thread(target=self.update_orders, name='update_orders')
-        self.update_order_thread.start()
+
+    @property
+    def all_open_orders(self):
+        return self.order_tracker.all_open_orders
+
+    @property
+    def recent_fills(self):
+        return self.order_tracker.get_recent_fills()
+
+    @property
+    def balances(self):
+        balances = dict(self.balance_ledger.available)
+        balances['fiat_equivalent'] = self.get_fiat_equivalent()
+        return balances
+
+    def reconcile_orders(self):
+        # At startup and after reconnects, user channel messages may have been missed
+        try:
+            self.order_tracker.reconcile()
+        except Exception:
+            self.error_logger.exception(datetime.datetime.now())
+
+    def reconcile_balances(self):
+        try:
+            self.balance_ledger.reconcile()
+        except Exception:
+            self.error_logger.exception(datetime.datetime.now())
+
+    def start_balance_reconcile(self):
+        self.balance_ledger.start()
+
+    def process_user_message(self, msg):
+        self.order_tracker.process_message(msg)
+        self.balance_ledger.process_message(msg)
+        if msg.get('type') == 'match':
+            self.mc.fills_log(self.recent_fills)
 
     def close(self, exit=False):
         if exit:
-            self.stop_update_order_thread = True
+            self.balance_ledger.close()
         for product in self.products:
             # Setting both flags will close any open order threads
             product.buy_flag = False
@@ -56,37 +102,7 @@ class TradeEngine:
         return None
 
     def init_available_products(self):
-        for product in self.auth_client.get_products():
-            self.available_products.append(product.get('id'))
-
-    def update_orders(self):
-        while not self.stop_update_order_thread:
-            need_updating = False
-            for product in self.products:
-                if product.order_in_progress:
-                    need_updating = True
-
-            if time.time() - self.last_order_update >= 1.0:
-                self.temp_recent_fills = []
-                try:
-                    for product in self.products:
-                        self.temp_recent_fills += list(itertools.islice(self.auth_client.get_fills(product_id=product.product_id), 5))
-                        self.recent_fills = sorted(self.temp_recent_fills, key=lambda x: x['created_at'], reverse=True)[:5]
-                except Exception:
-                    self.error_logger.exception(datetime.datetime.now())
-                if need_updating:
-                    try:
-                        self.all_open_orders = list(self.auth_client.get_orders())
-                        for product in self.products:
-                            product.open_orders = []
-                        for order in self.all_open_orders:
-                            self.get_product_by_product_id(order.get('product_id')).open_orders.append(order)
-                    except Exception:
-                        self.error_logger.exception(datetime.datetime.now())
-                elif not need_updating:
-                    self.all_open_orders = []
-                self.last_order_update = time.time()
-            time.sleep(0.01)
+        self.available_products = self.product_registry.product_ids()
 
     def round_fiat(self, money):
         return Decimal(money).quantize(Decimal('.01'), rounding=ROUND_DOWN)
@@ -96,35 +112,19 @@ class TradeEngine:
         # For now round down to the hundred-millionth place value
         return Decimal(money).quantize(Decimal('.00000001'), rounding=ROUND_DOWN)
 
-    def update_amounts(self):
-        # If more than one second since last update
-        if time.time() - self.last_balance_update > 1.0:
-            try:
-                self.last_balance_update = time.time()
-                ret = self.auth_client.get_accounts()
-                if isinstance(ret, list):
-                    # For each type of currency held
-                    for account in ret:
-                        # Record the balance rounded down
-                        self.balances[account['currency']] = self.round_coin(account.get('available'))
-
-                self.mc.fills_log(self.recent_fills)
-                # self.logger.debug("logging fills")
-
-            except Exception:
-                self.error_logger.exception(datetime.datetime.now())
-                return
-            self.balances['fiat_equivalent'] = Decimal('0.0')
-            # For each product being traded
-            for product in self.products:
-                if not product.meta and product.order_book.get_current_ticker() and product.order_book.get_current_ticker().get('price'):
-                    # Add the projected cost of any held currencies
-                    self.balances['fiat_equivalent'] += self.get_base_currency_from_product_id(product.product_id, update=False) * Decimal(product.order_book.get_current_ticker().get('price'))
-            # Then add any reserved fiat
-            self.balances['fiat_equivalent'] += self.balances[self.fiat_currency]
+    def get_fiat_equivalent(self):
+        # Held currencies valued at the last trade price of their fiat product
+        fiat_equivalent = Decimal('0.0')
+        for product in self.products:
+            ticker = product.order_book.get_current_ticker()
+            if not product.meta and ticker and ticker.get('price'):
+                fiat_equivalent += self.get_base_currency_from_product_id(product.product_id) * Decimal(ticker.get('price'))
+        # Then add any reserved fiat
+        return fiat_equivalent + self.balance_ledger.get_available(self.fiat_currency)
 
     def print_amounts(self):
-        self.logger.debug("[BALANCES] %s: %.2f BTC: %.8f" % (self.fiat_currency, self.balances[self.fiat_currency], self.balances['BTC']))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("[BALANCES] %s: %.2f BTC: %.8f", self.fiat_currency, self.balance_ledger.get_available(self.fiat_currency), self.balance_ledger.get_available('BTC'))
 
     def place_buy(self, product=None, partial='1.0'):
         amount = self.get_quoted_currency_from_product_id(product.product_id) * Decimal(partial)
@@ -137,11 +137,10 @@ class TradeEngine:
             amount = self.round_coin(Decimal(amount) / Decimal(bid))
 
         if amount >= Decimal(product.min_size):
-            self.logger.debug("Placing buy... Price: %.8f Size: %.8f" % (bid, amount))
+            self.logger.debug("Placing buy... Price: %.8f Size: %.8f", bid, amount)
             ret = self.auth_client.place_limit_order(product.product_id, "buy", size=str(amount),
                                                      price=str(bid), post_only=True)
-            if ret.get('status') == 'pending' or ret.get('status') == 'open':
-                product.open_orders.append(ret)
+            self.order_tracker.add_order(ret)
             return ret
         else:
             ret = {'status': 'done'}
@@ -149,7 +148,6 @@ class TradeEngine:
 
     def buy(self, product=None, amount=None):
         product.order_in_progress = True
-        last_order_update = 0
         starting_price = product.order_book.get_ask() - Decimal(product.quote_increment)
         try:
             ret = self.place_buy(product=product, partial='0.5')
@@ -173,15 +171,11 @@ class TradeEngine:
                         if order.get('id') != ret.get('id'):
                             self.auth_client.cancel_order(order.get('id'))
                     bid = ret.get('price')
-                if ret.get('id') and time.time() - last_order_update >= 1.0:
-                    try:
-                        ret = self.auth_client.get_order(ret.get('id'))
-                        last_order_update = time.time()
-                    except ValueError:
-                        self.error_logger.exception(datetime.datetime.now())
-                        pass
+                if ret.get('id'):
+                    ret = self.order_tracker.get_order(ret.get('id')) or ret
                 amount = self.get_quoted_currency_from_product_id(product.product_id)
-                time.sleep(0.01)
+                # Wakes up on order events, and often enough to follow the price
+                self.order_tracker.wait_for_update(0.1)
             self.auth_client.cancel_all(product_id=product.product_id)
             amount = self.get_quoted_currency_from_product_id(product.product_id)
         except Exception:
@@ -197,11 +191,10 @@ class TradeEngine:
         ask = product.order_book.get_bid() + Decimal(product.quote_increment)
 
         if amount >= Decimal(product.min_size):
-            self.logger.debug("Placing sell... Price: %.2f Size: %.8f" % (ask, amount))
+            self.logger.debug("Placing sell... Price: %.2f Size: %.8f", ask, amount)
             ret = self.auth_client.place_limit_order(product.product_id, "sell", size=str(amount),
                                                      price=str(ask), post_only=True)
-            if ret.get('status') == 'pending' or ret.get('status') == 'open':
-                product.open_orders.append(ret)
+            self.order_tracker.add_order(ret)
             return ret
         else:
             ret = {'status': 'done'}
@@ -209,7 +202,6 @@ class TradeEngine:
 
     def sell(self, product=None, amount=None):
         product.order_in_progress = True
-        last_order_update = 0
         starting_price = product.order_book.get_bid() + Decimal(product.quote_increment)
         try:
             ret = self.place_sell(product=product, partial='0.5')
@@ -233,15 +225,10 @@ class TradeEngine:
                         if order.get('id') != ret.get('id'):
                             self.auth_client.cancel_order(order.get('id'))
                     ask = ret.get('price')
-                if ret.get('id') and time.time() - last_order_update >= 1.0:
-                    try:
-                        ret = self.auth_client.get_order(ret.get('id'))
-                    except ValueError:
-                        self.error_logger.exception(datetime.datetime.now())
-                        pass
-                    last_order_update = time.time()
+                if ret.get('id'):
+                    ret = self.order_tracker.get_order(ret.get('id')) or ret
                 amount = self.get_base_currency_from_product_id(product.product_id)
-                time.sleep(0.01)
+                self.order_tracker.wait_for_update(0.1)
             self.auth_client.cancel_all(product_id=product.product_id)
             amount = self.get_base_currency_from_product_id(product.product_id)
         except Exception:
@@ -250,76 +237,62 @@ class TradeEngine:
         self.auth_client.cancel_all(product_id=product.product_id)
         product.order_in_progress = False
 
-    def get_base_currency_from_product_id(self, product_id, update=True):
-        if update:
-            self.update_amounts()
-        return self.balances[product_id[:3]]
+    def start_buy(self, product, amount):
+        if self.market_orders:
+            ret = self.auth_client.place_market_order(product.product_id, "buy", funds=str(amount))
+            self.logger.debug(ret)
+            self.logger.debug(amount)
+        elif not product.order_in_progress:
+            product.order_thread = threading.Thread(target=self.buy, name='buy_thread', kwargs={'product': product})
+            product.order_thread.start()
+
+    def start_sell(self, product, amount):
+        if self.market_orders:
+            self.auth_client.place_market_order(product.product_id, "sell", size=str(amount))
+        elif not product.order_in_progress:
+            product.order_thread = threading.Thread(target=self.sell, name='sell_thread', kwargs={'product': product})
+            product.order_thread.start()
+
+    def stop_orders(self, product):
+        # Order threads stop on their own once both flags are cleared
+        pass
+
+    def get_base_currency_from_product_id(self, product_id):
+        return self.balance_ledger.get_available(product_id.split('-')[0])
 
     def get_quoted_currency_from_product_id(self, product_id):
-        self.update_amounts()
-        return self.balances[product_id[4:]]
+        return self.balance_ledger.get_available(product_id.split('-')[1])
+
+    def get_rule_values(self, period_list, indicators):
+        # Indicators of each trade period, plus the values the strategy rules
+        # can use that depend on balances and fills
+        recent_fills = self.recent_fills
+        fiat_balance = self.balance_ledger.get_available(self.fiat_currency)
+        sell_point = indicators['sell_point'](recent_fills)
+        last_buy_price = float(recent_fills[-1]['price']) if recent_fills else float('nan')
+        rows = []
+        for cur_period in period_list:
+            row = dict(indicators[cur_period.name])
+            # No break even price to buy at without fiat to buy with
+            row['bep'] = row['bep'](fiat_balance) if 'bep' in row and fiat_balance > 0 else None
+            row['sell_point'] = sell_point
+            row['last_buy_price'] = last_buy_price
+            rows.append(row)
+        return rows
 
     def determine_trades(self, product_id, period_list, indicators):
-        # Get current values of held instruments
-        self.update_amounts()
-
         # if trades can be made
         if self.is_live:
             product = self.get_product_by_product_id(product_id)
-
-            new_buy_flag = True
-            new_sell_flag = False
+            rows = self.get_rule_values(period_list, indicators)
+            # Rules from the strategy section of config.yml, every period at once
+            new_buy_flag, new_sell_flag = self.strategy.decide(rows)
+            current_price = indicators[period_list[-1].name]['close']
+            sell_point = rows[-1]['sell_point']
             for cur_period in period_list:
-                # Moving Average Strategy
-                sma_trend_positive = Decimal(indicators[cur_period.name]['sma_trend']) > Decimal('0.0')
-                sma_trend_negative = Decimal(indicators[cur_period.name]['sma_trend']) < Decimal('0.0')
-
-                current_price = indicators[cur_period.name]['close']
-                projected_market_bottom = indicators[cur_period.name]['bband_lower_1']
-
-                below_market_bottom = current_price < projected_market_bottom
-                above_market_bottom = current_price >= projected_market_bottom
-
-                market_rising = sma_trend_positive and above_market_bottom
-                market_falling = sma_trend_negative and below_market_bottom
-
-                last_purchase_price = float(self.recent_fills[-1]["price"])
-                incurring_losses = current_price < last_purchase_price
-                emergency_sell = below_market_bottom and incurring_losses
-
-                new_buy_flag = new_buy_flag and above_market_bottom
-                new_sell_flag = new_sell_flag or emergency_sell
-
-                # High Low Prediction Strategy
-
-                # Calculate the BEP for buying at this price
-
-                # If the BEP is below the bband upper band
-                bep = math.ceil(indicators[cur_period.name]['bep'](self.balances[self.fiat_currency]))
-                profit_expected = bep < math.ceil(indicators[cur_period.name]['bband_upper_1'])
-
-                new_buy_flag = new_buy_flag and profit_expected
-
-                # If product is >= Last purchase BEP
-                cur_period_balance = float(self.balances[cur_period.name])
-                cur_period_price = cur_period_balance * float(indicators[cur_period.name]['close'])
-
-                sell_point = indicators['sell_point'](self.recent_fills)
-                cur_period_profiting = current_price > sell_point
-
-                new_sell_flag = new_sell_flag or cur_period_profiting
-
-                # Don't sell if we would buy
-                new_sell_flag = new_sell_flag and not new_buy_flag
-
                 self.mc.indicator_log(indicators[cur_period.name], new_buy_flag, new_sell_flag, sell_point=sell_point)
 
-            # if product_id == 'LTC-BTC' or product_id == 'ETH-BTC':
-            #     ltc_or_eth_fiat_product = self.get_product_by_product_id(product_id[:3] + '-' + self.fiat_currency)
-            #     btc_fiat_product = self.get_product_by_product_id('BTC-' + self.fiat_currency)
-            #     new_buy_flag = new_buy_flag and ltc_or_eth_fiat_product.buy_flag
-            #     new_sell_flag = new_sell_flag and btc_fiat_product.buy_flag
-
+            action = storage.ACTION_NONE
             if new_buy_flag:
                 if product.sell_flag:
                     product.last_signal_switch = time.time()
@@ -328,16 +301,8 @@ class TradeEngine:
                 amount = self.round_fiat(self.get_quoted_currency_from_product_id(product_id))
                 if amount >= Decimal(product.min_size):
                     self.mc.placing_buy()
-                    if self.market_orders:
-                        ret = self.auth_client.place_market_order(product.product_id, "buy", funds=str(amount))
-                        self.logger.debug(ret)
-                        self.logger.debug(amount)
-                    else:
-                        if not product.order_in_progress:
-                            bid = product.order_book.get_ask() - Decimal(product.quote_increment)
-                            amount = self.round_coin(Decimal(amount) / Decimal(bid))
-                            product.order_thread = threading.Thread(target=self.buy, name='buy_thread', kwargs={'product': product})
-                            product.order_thread.start()
+                    action = storage.ACTION_BUY
+                    self.start_buy(product, amount)
             elif new_sell_flag:
                 if product.buy_flag:
                     product.last_signal_switch = time.time()
@@ -346,12 +311,12 @@ class TradeEngine:
                 amount_of_coin = self.round_coin(self.get_base_currency_from_product_id(product_id))
                 if amount_of_coin >= Decimal(product.min_size):
                     self.mc.placing_sell()
-                    if self.market_orders:
-                        self.auth_client.place_market_order(product.product_id, "sell", size=str(amount_of_coin))
-                    else:
-                        if not product.order_in_progress:
-                            product.order_thread = threading.Thread(target=self.sell, name='sell_thread', kwargs={'product': product})
-                            product.order_thread.start()
+                    action = storage.ACTION_SELL
+                    self.start_sell(product, amount_of_coin)
             else:
                 product.buy_flag = False
                 product.sell_flag = False
+                self.stop_orders(product)
+            if self.journal is not None:
+                self.journal.record_decision(product_id, 'trades', current_price, new_buy_flag, new_sell_flag,
+                                             sell_point=sell_point, action=action)
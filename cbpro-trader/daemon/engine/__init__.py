@@ -1,4 +1,18 @@
 from .OrderBookCustom import OrderBookCustom
 from .Product import Product
 from .TradeEngine import TradeEngine
-from .TradeAndHeartbeatWebsocket import TradeAndHeartbeatWebsocket
\ No newline at end of file
+from .TradeAndHeartbeatWebsocket import TradeAndHeartbeatWebsocket
+from .OrderBookSnapshot import OrderBookSnapshot
+from .ShardPool import ShardPool, get_period_product_ids
+from .Dispatch import BOOK_MESSAGE_TYPES, FEED_PROFILES, get_feed_profile, build_dispatch, get_product_trade_periods
+from .TokenBucket import TokenBucket
+from .RestSession import RestSession
+from .ProductRegistry import ProductRegistry
+from .OrderTracker import OrderTracker, USER_MESSAGE_TYPES, is_user_message
+from .BalanceLedger import BalanceLedger
+from .AsyncRestClient import AsyncRestClient
+from .AsyncFeed import AsyncFeed
+from .AsyncTradeEngine import AsyncTradeEngine, run_loop, current_task
+from .FeedRecorder import FeedRecorder, read_recording
+from .FeedReplay import FeedReplay, ReplayFinished, describe_recording
+from .OfflineClient import OfflineClient
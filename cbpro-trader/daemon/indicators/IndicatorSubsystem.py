@@ -2,19 +2,25 @@ import talib
 import logging
 import numpy as np
 from decimal import Decimal
+from .StreamingIndicators import StreamingIndicatorSet
 
 
 class IndicatorSubsystem:
-    def __init__(self, period_list, mongo_connection):
+    def __init__(self, period_list, mongo_connection, incremental=False):
         self.logger = logging.getLogger('trader-logger')
         self.mc = mongo_connection
+        self.incremental = incremental
         self.current_indicators = {}
+        self.streaming_indicators = {}
         self.calculate_sell_point()
         self.period_list = period_list
         for period in self.period_list:
             self.current_indicators[period.name] = {}
 
     def recalculate_indicators(self, cur_period):
+        if self.incremental:
+            self.recalculate_indicators_incremental(cur_period)
+            return
         total_periods = len(cur_period.candlesticks)
         if total_periods > 0:
             closing_prices = cur_period.get_closing_prices()
@@ -35,6 +41,36 @@ class IndicatorSubsystem:
             self.calculate_bbands(cur_period.name, closing_prices_close)
             self.calculate_bep(cur_period.name, closing_prices_close)
 
+    def sync_streaming_indicators(self, cur_period):
+        candlesticks = cur_period.candlesticks
+        state = self.streaming_indicators.get(cur_period.name)
+        # Rebuild from the full history if closed candles were rewritten
+        # (late trades, historical data patches, re-initialization)
+        if state is None or state[0] != candlesticks.revision:
+            streaming = StreamingIndicatorSet()
+            for close, volume in zip(candlesticks.closes.tolist(), candlesticks.volumes.tolist()):
+                streaming.update(close, volume)
+        else:
+            streaming = state[2]
+            new_candles = min(candlesticks.appended - state[1], len(candlesticks))
+            if new_candles > 0:
+                for close, volume in zip(candlesticks.closes[-new_candles:].tolist(),
+                                         candlesticks.volumes[-new_candles:].tolist()):
+                    streaming.update(close, volume)
+        self.streaming_indicators[cur_period.name] = (candlesticks.revision, candlesticks.appended, streaming)
+        return streaming
+
+    def recalculate_indicators_incremental(self, cur_period):
+        total_periods = len(cur_period.candlesticks)
+        if total_periods > 0:
+            streaming = self.sync_streaming_indicators(cur_period)
+            cur_stick = cur_period.cur_candlestick
+            self.current_indicators[cur_period.name].update(streaming.peek(float(cur_stick.close),
+                                                                           float(cur_stick.volume)))
+            self.current_indicators[cur_period.name]['close'] = cur_stick.close
+            self.current_indicators[cur_period.name]['total_periods'] = total_periods
+            self.calculate_bep(cur_period.name, [cur_stick.close])
+
 
     def calculate_sma(self, period_name, closing_prices):
         sma = talib.SMA(closing_prices, timeperiod=9)
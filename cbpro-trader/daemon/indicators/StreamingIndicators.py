@@ -0,0 +1,256 @@
+import math
+from collections import deque
+
+# Incremental versions of the TA-Lib indicators used by IndicatorSubsystem.
+# update() commits a closed candle value, peek() returns what the indicator
+# would be if the given value were appended, without changing any state.
+# Seeding follows TA-Lib's default compatibility mode so results match a full
+# recalculation over the same history.
+
+NAN = float('nan')
+
+
+def is_zero(value):
+    # Same threshold TA-Lib uses for its TA_IS_ZERO checks
+    return -0.00000001 < value < 0.00000001
+
+
+class RollingWindow:
+    # Running sum and sum of squares over the last n values (SMA, BBANDS)
+    def __init__(self, n):
+        self.n = n
+        self.values = deque(maxlen=n)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.updates = 0
+
+    def update(self, value):
+        if len(self.values) == self.n:
+            oldest = self.values[0]
+            self.total -= oldest
+            self.total_sq -= oldest * oldest
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        # Resynchronise the running sums every n updates to stop float drift
+        self.updates += 1
+        if self.updates % self.n == 0:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+
+    def _peek_totals(self, value):
+        if len(self.values) < self.n - 1:
+            return None
+        total = self.total + value
+        total_sq = self.total_sq + value * value
+        if len(self.values) == self.n:
+            oldest = self.values[0]
+            total -= oldest
+            total_sq -= oldest * oldest
+        return total, total_sq
+
+    def mean(self):
+        if len(self.values) < self.n:
+            return NAN
+        return self.total / self.n
+
+    def peek_mean(self, value):
+        totals = self._peek_totals(value)
+        if totals is None:
+            return NAN
+        return totals[0] / self.n
+
+    def peek_bands(self, value, nbdev):
+        totals = self._peek_totals(value)
+        if totals is None:
+            return NAN, NAN, NAN
+        middle = totals[0] / self.n
+        variance = totals[1] / self.n - middle * middle
+        deviation = math.sqrt(variance) * nbdev if variance >= 0.00000001 else 0.0
+        return middle + deviation, middle, middle - deviation
+
+
+class StreamingEMA:
+    # EMA seeded with the SMA of the first n values, like TA-Lib's EMA
+    def __init__(self, n):
+        self.n = n
+        self.k = 2.0 / (n + 1)
+        self.count = 0
+        self.seed_total = 0.0
+        self.value = NAN
+
+    def update(self, value):
+        self.value = self.peek(value)
+        if self.count < self.n:
+            self.seed_total += value
+        self.count += 1
+
+    def peek(self, value):
+        if self.count < self.n - 1:
+            return NAN
+        if self.count == self.n - 1:
+            return (self.seed_total + value) / self.n
+        return (value - self.value) * self.k + self.value
+
+
+class StreamingMACD:
+    def __init__(self, fastperiod=12, slowperiod=26, signalperiod=9):
+        if slowperiod < fastperiod:
+            fastperiod, slowperiod = slowperiod, fastperiod
+        # TA-Lib starts the fast EMA so it becomes valid on the same input as
+        # the slow EMA, i.e. the first (slow - fast) values are skipped.
+        self.fast_offset = slowperiod - fastperiod
+        self.fast = StreamingEMA(fastperiod)
+        self.slow = StreamingEMA(slowperiod)
+        self.signal = StreamingEMA(signalperiod)
+        self.count = 0
+
+    def update(self, value):
+        if self.count >= self.fast_offset:
+            self.fast.update(value)
+        self.slow.update(value)
+        macd = self.fast.value - self.slow.value
+        if not math.isnan(macd):
+            self.signal.update(macd)
+        self.count += 1
+
+    def peek(self, value):
+        fast = self.fast.peek(value) if self.count >= self.fast_offset else NAN
+        macd = fast - self.slow.peek(value)
+        if math.isnan(macd):
+            return NAN, NAN, NAN
+        signal = self.signal.peek(macd)
+        if math.isnan(signal):
+            # TA-Lib only outputs MACD once the signal line is valid
+            return NAN, NAN, NAN
+        return macd, signal, macd - signal
+
+
+class StreamingRSI:
+    # Wilder smoothed RSI, seeded with the simple average of the first n changes
+    def __init__(self, n=14):
+        self.n = n
+        self.prev_value = None
+        self.changes = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self.value = NAN
+
+    def update(self, value):
+        if self.prev_value is None:
+            self.prev_value = value
+            return
+        change = value - self.prev_value
+        self.prev_value = value
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        self.changes += 1
+        if self.changes <= self.n:
+            self.avg_gain += gain
+            self.avg_loss += loss
+            if self.changes < self.n:
+                return
+            self.avg_gain /= self.n
+            self.avg_loss /= self.n
+        else:
+            self.avg_gain = (self.avg_gain * (self.n - 1) + gain) / self.n
+            self.avg_loss = (self.avg_loss * (self.n - 1) + loss) / self.n
+        total = self.avg_gain + self.avg_loss
+        self.value = 100.0 * (self.avg_gain / total) if not is_zero(total) else 0.0
+
+
+class MonotonicMinMax:
+    # Sliding window min/max in O(1) amortised time per update
+    def __init__(self, n):
+        self.n = n
+        self.count = 0
+        self.min_deque = deque()
+        self.max_deque = deque()
+
+    def update(self, value):
+        while self.min_deque and self.min_deque[-1][1] >= value:
+            self.min_deque.pop()
+        self.min_deque.append((self.count, value))
+        while self.max_deque and self.max_deque[-1][1] <= value:
+            self.max_deque.pop()
+        self.max_deque.append((self.count, value))
+        self.count += 1
+        window_start = self.count - self.n
+        if self.min_deque[0][0] < window_start:
+            self.min_deque.popleft()
+        if self.max_deque[0][0] < window_start:
+            self.max_deque.popleft()
+
+    def is_full(self):
+        return self.count >= self.n
+
+    def min(self):
+        return self.min_deque[0][1]
+
+    def max(self):
+        return self.max_deque[0][1]
+
+
+class StreamingStochRSI:
+    # STOCHF applied to RSI, matching talib.STOCHRSI with fastd_matype=0
+    def __init__(self, timeperiod=14, fastk_period=5, fastd_period=3):
+        self.rsi = StreamingRSI(timeperiod)
+        self.rsi_range = MonotonicMinMax(fastk_period)
+        self.fastd = RollingWindow(fastd_period)
+        self.fastk_value = NAN
+        self.fastd_value = NAN
+
+    def update(self, value):
+        self.rsi.update(value)
+        if math.isnan(self.rsi.value):
+            return
+        rsi = self.rsi.value
+        self.rsi_range.update(rsi)
+        if not self.rsi_range.is_full():
+            return
+        lowest = self.rsi_range.min()
+        diff = (self.rsi_range.max() - lowest) / 100.0
+        fastk = (rsi - lowest) / diff if diff != 0.0 else 0.0
+        self.fastd.update(fastk)
+        if len(self.fastd.values) == self.fastd.n:
+            self.fastk_value = fastk
+            self.fastd_value = self.fastd.mean()
+
+
+class StreamingIndicatorSet:
+    # Streaming state for every indicator IndicatorSubsystem publishes for a period
+    def __init__(self):
+        self.sma = RollingWindow(9)
+        self.bbands = RollingWindow(20)
+        self.avg_volume = RollingWindow(15)
+        self.vol_macd = StreamingMACD(fastperiod=50, slowperiod=200, signalperiod=14)
+        self.stochrsi = StreamingStochRSI(timeperiod=14, fastk_period=3, fastd_period=3)
+        self.total_periods = 0
+
+    def update(self, close, volume):
+        self.sma.update(close)
+        self.bbands.update(close)
+        self.avg_volume.update(volume)
+        self.vol_macd.update(volume)
+        self.stochrsi.update(close)
+        self.total_periods += 1
+
+    def peek(self, close, volume):
+        sma = self.sma.peek_mean(close)
+        upper_1, middle, lower_1 = self.bbands.peek_bands(close, 1)
+        upper_2, middle, lower_2 = self.bbands.peek_bands(close, 2)
+        vol_macd, vol_macd_sig, vol_macd_hist = self.vol_macd.peek(volume)
+        return {
+            'sma': sma,
+            'sma_trend': sma - self.sma.mean(),
+            'vol_macd': vol_macd,
+            'vol_macd_sig': vol_macd_sig,
+            'vol_macd_hist': vol_macd_hist,
+            'avg_volume': self.avg_volume.peek_mean(volume),
+            'stochrsi_fastk': self.stochrsi.fastk_value,
+            'stochrsi_fastd': self.stochrsi.fastd_value,
+            'bband_upper_1': upper_1,
+            'bband_lower_1': lower_1,
+            'bband_upper_2': upper_2,
+            'bband_lower_2': lower_2,
+        }
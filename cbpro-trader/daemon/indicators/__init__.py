@@ -1 +1,2 @@
-from .IndicatorSubsystem import IndicatorSubsystem
\ No newline at end of file
+from .IndicatorSubsystem import IndicatorSubsystem
+from .StreamingIndicators import StreamingIndicatorSet
\ No newline at end of file
@@ -0,0 +1,124 @@
+import json
+import asyncio
+import functools
+from aiohttp import web as aiohttp_web
+
+# asyncio.current_task is Python 3.7+, the Docker image runs 3.6
+current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+json_response = functools.partial(aiohttp_web.json_response, dumps=functools.partial(json.dumps, default=str))
+
+
+def parse_etags(header):
+    etags = []
+    for etag in (header or '').split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        if etag:
+            etags.append(etag.strip('"'))
+    return etags
+
+
+class AsyncWeb:
+    # The web API served from the asyncio runtime's event loop, with the
+    # route bodies of interface.web. Config changes need the threaded
+    # runtime, /config/ is read only here.
+    def __init__(self, web_interface, host='0.0.0.0', port=8080):
+        self.web_interface = web_interface
+        self.host = host
+        self.port = port
+        self.runner = None
+        # Handlers of open /stream/ connections, cancelled on close
+        self.streams = set()
+        app = aiohttp_web.Application()
+        app.add_routes([aiohttp_web.get('/products/', self.products),
+                        aiohttp_web.get('/periods/', self.periods),
+                        aiohttp_web.get('/periods/{periodName}', self.periods),
+                        aiohttp_web.get('/indicators/', self.indicators),
+                        aiohttp_web.get('/indicators/{periodName}', self.indicators),
+                        aiohttp_web.get('/orders/', self.orders),
+                        aiohttp_web.get('/orders/{productId}', self.orders),
+                        aiohttp_web.get('/balances/', self.balances),
+                        aiohttp_web.get('/balances/{currency}', self.balances),
+                        aiohttp_web.get('/flags/', self.flags),
+                        aiohttp_web.get('/metrics/', self.metrics),
+                        aiohttp_web.get('/stream/', self.stream),
+                        aiohttp_web.get('/config/', self.config)])
+        self.app = app
+
+    async def start(self):
+        self.runner = aiohttp_web.AppRunner(self.app)
+        await self.runner.setup()
+        site = aiohttp_web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        return site
+
+    async def close(self):
+        for stream in list(self.streams):
+            stream.cancel()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def products(self, request):
+        return json_response(self.web_interface.get_products())
+
+    async def periods(self, request):
+        name = request.match_info.get('periodName')
+        if name is None:
+            return json_response(self.web_interface.get_period_names())
+        period = self.web_interface.get_period(name)
+        if period is None:
+            return json_response([])
+        return self.period_candles(request, period)
+
+    def period_candles(self, request, period):
+        since = request.query.get('since')
+        limit = request.query.get('limit')
+        gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        etags = parse_etags(request.headers.get('If-None-Match'))
+        etag, body = self.web_interface.get_period_candles(period, float(since) if since else None,
+                                                           int(limit) if limit else None, gzip,
+                                                           lambda etag: etag in etags or '*' in etags)
+        headers = {'ETag': '"%s"' % etag, 'Vary': 'Accept-Encoding'}
+        if body is None:
+            return aiohttp_web.Response(status=304, headers=headers)
+        if gzip:
+            headers['Content-Encoding'] = 'gzip'
+        return aiohttp_web.Response(body=body if isinstance(body, bytes) else body.encode(),
+                                    content_type='application/json', headers=headers)
+
+    async def indicators(self, request):
+        return json_response(self.web_interface.get_indicators(request.match_info.get('periodName')))
+
+    async def orders(self, request):
+        return json_response(self.web_interface.get_orders())
+
+    async def balances(self, request):
+        return json_response(self.web_interface.get_balances())
+
+    async def flags(self, request):
+        return json_response(self.web_interface.get_flags())
+
+    async def metrics(self, request):
+        return json_response(self.web_interface.get_metrics())
+
+    async def config(self, request):
+        return json_response(self.web_interface.get_config())
+
+    async def stream(self, request):
+        response = aiohttp_web.StreamResponse(headers={'Content-Type': 'text/event-stream',
+                                                       'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        await response.prepare(request)
+        events = self.web_interface.event_stream.subscribe_async(request.headers.get('Last-Event-ID'))
+        task = current_task()
+        self.streams.add(task)
+        try:
+            async for chunk in events:
+                await response.write(chunk)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.streams.discard(task)
+            await events.aclose()
+        return response
@@ -0,0 +1,89 @@
+import json
+import zlib
+import bisect
+import threading
+
+
+def encode_candle(stick_time, low, high, open_price, close):
+    return json.dumps({'time': stick_time, 'low': low, 'high': high, 'open': open_price, 'close': close})
+
+
+class EncodedCandles:
+    # JSON of a period's closed candles, encoded once per candle. A request
+    # only encodes the live candle and appends it to a cached body prefix,
+    # already compressed when gzip is asked for.
+    max_prefixes = 64
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffer = None
+        self.revision = None
+        self.appended = 0
+        self.times = []
+        self.encoded = []
+        # (first candle, gzip) -> (body prefix, compressor, has candles)
+        self.prefixes = {}
+
+    def sync(self, candlesticks):
+        # Counters are read before copying, so a candle closing while copying
+        # is picked up again on the next sync
+        revision, appended = candlesticks.revision, candlesticks.appended
+        if candlesticks is self.buffer and revision == self.revision:
+            if appended == self.appended:
+                return
+        else:
+            self.times = []
+            self.encoded = []
+        times, lows, highs, opens, closes, volumes = candlesticks.snapshot()
+        first_new = bisect.bisect_right(times, self.times[-1]) if self.times else 0
+        rows = zip(times[first_new:].tolist(), lows[first_new:].tolist(), highs[first_new:].tolist(),
+                   opens[first_new:].tolist(), closes[first_new:].tolist())
+        self.times.extend(times[first_new:].tolist())
+        self.encoded.extend(encode_candle(*row) for row in rows)
+        # Candles that dropped out of the buffer
+        dropped = max(len(self.times) - len(times), 0)
+        del self.times[:dropped]
+        del self.encoded[:dropped]
+        self.prefixes = {}
+        self.buffer = candlesticks
+        self.revision = revision
+        self.appended = appended
+
+    def get_prefix(self, first, gzip):
+        prefix = self.prefixes.get((first, gzip))
+        if prefix is None:
+            text = ('[' + ', '.join(self.encoded[first:])).encode()
+            compressor = None
+            if gzip:
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                text = compressor.compress(text) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if len(self.prefixes) >= self.max_prefixes:
+                self.prefixes = {}
+            prefix = (text, compressor, first < len(self.encoded))
+            self.prefixes[(first, gzip)] = prefix
+        return prefix
+
+    def get_body(self, candlesticks, live_candle, since=None, limit=None, gzip=False):
+        # JSON list of the closed candles starting at or after since, then the
+        # live candle, keeping only the last limit candles
+        include_live = live_candle is not None and (since is None or live_candle[0] >= since) \
+            and (limit is None or limit > 0)
+        with self.lock:
+            self.sync(candlesticks)
+            first = bisect.bisect_left(self.times, since) if since is not None else 0
+            if limit is not None:
+                first = max(first, len(self.encoded) - max(limit - include_live, 0))
+            body, compressor, has_candles = self.get_prefix(first, gzip)
+            if compressor is not None:
+                compressor = compressor.copy()
+        tail = ']'
+        if include_live:
+            tail = (', ' if has_candles else '') + encode_candle(*live_candle[:5]) + tail
+        if compressor is None:
+            return body + tail.encode()
+        return body + compressor.compress(tail.encode()) + compressor.flush()
+
+    def get_etag(self, candlesticks, live_candle):
+        # Changes whenever the body for any since/limit could change
+        return '%x-%d-%d-%s' % (id(candlesticks), candlesticks.revision, candlesticks.appended,
+                                '-'.join(str(value) for value in (live_candle or [])[:5]))
@@ -0,0 +1,121 @@
+import json
+import time
+import asyncio
+import threading
+import itertools
+from collections import deque
+
+
+def set_done(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def encode_event(event_id, event_type, data):
+    return ('id: %d\nevent: %s\ndata: %s\n\n' % (event_id, event_type, json.dumps(data))).encode()
+
+
+class EventStream:
+    # Server-sent events hub. Events are encoded once when published and the
+    # same bytes are written to every client. New clients, and clients too far
+    # behind to catch up from the recent events, get a snapshot of the
+    # current state first.
+    def __init__(self, max_events=1000, poll_interval=0.1, keepalive_interval=15):
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=max_events)
+        self.last_id = 0
+        self.state = {}
+        self.encoded_snapshot = None
+        self.poll_interval = poll_interval
+        self.keepalive_interval = keepalive_interval
+        self.clients = 0
+        # (loop, future) of asyncio clients waiting for the next publish
+        self.waiters = []
+
+    def publish(self, events, state):
+        # Called from the trading thread with (type, data) pairs and the state
+        # after applying them. state must not be mutated afterwards.
+        with self.lock:
+            for event_type, data in events:
+                self.last_id += 1
+                self.events.append((self.last_id, encode_event(self.last_id, event_type, data)))
+            self.state = state
+            waiters, self.waiters = self.waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(set_done, waiter)
+
+    def get_snapshot(self):
+        with self.lock:
+            snapshot_id, state, encoded = self.last_id, self.state, self.encoded_snapshot
+        if encoded is None or encoded[0] != snapshot_id:
+            # Encoded outside the lock, once per state shared by all clients
+            encoded = (snapshot_id, encode_event(snapshot_id, 'snapshot', state))
+            self.encoded_snapshot = encoded
+        return encoded
+
+    def events_since(self, event_id):
+        # Encoded events after event_id, or None if some were already dropped
+        with self.lock:
+            if event_id > self.last_id:
+                return None
+            first_id = self.events[0][0] if self.events else self.last_id + 1
+            if event_id < first_id - 1:
+                return None
+            return [encoded for _, encoded in itertools.islice(self.events, event_id - first_id + 1, None)]
+
+    def get_position(self, last_event_id):
+        if last_event_id is not None and str(last_event_id).isdigit():
+            return int(last_event_id)
+        return None
+
+    def next_chunk(self, position):
+        # Events after position, preceded by a snapshot when they cannot be
+        # caught up from the recent events. Returns the new position and chunk.
+        chunks = []
+        events = self.events_since(position) if position is not None else None
+        if events is None:
+            position, snapshot = self.get_snapshot()
+            chunks.append(snapshot)
+            events = self.events_since(position) or []
+        chunks.extend(events)
+        return position + len(events), b''.join(chunks)
+
+    def subscribe(self, last_event_id=None, sleep=time.sleep):
+        # Generator of encoded chunks for one client. sleep must be
+        # cooperative (gevent.sleep) when clients share a gevent hub.
+        position = self.get_position(last_event_id)
+        self.clients += 1
+        try:
+            last_write = time.time()
+            while True:
+                position, chunk = self.next_chunk(position)
+                if chunk:
+                    last_write = time.time()
+                    yield chunk
+                elif time.time() - last_write >= self.keepalive_interval:
+                    last_write = time.time()
+                    yield b': keepalive\n\n'
+                sleep(self.poll_interval)
+        finally:
+            self.clients -= 1
+
+    async def subscribe_async(self, last_event_id=None):
+        # subscribe() for asyncio servers, woken by publish() instead of polling
+        position = self.get_position(last_event_id)
+        loop = asyncio.get_event_loop()
+        self.clients += 1
+        try:
+            while True:
+                waiter = loop.create_future()
+                with self.lock:
+                    self.waiters.append((loop, waiter))
+                try:
+                    position, chunk = self.next_chunk(position)
+                    yield chunk or b': keepalive\n\n'
+                    await asyncio.wait((waiter,), timeout=self.keepalive_interval)
+                finally:
+                    with self.lock:
+                        if (loop, waiter) in self.waiters:
+                            self.waiters.remove((loop, waiter))
+        finally:
+            self.clients -= 1
@@ -0,0 +1,88 @@
+import math
+import time
+
+
+def candle_dict(stick):
+    stick_time = stick[0]
+    if hasattr(stick_time, 'timestamp'):
+        stick_time = stick_time.timestamp()
+    return {'time': stick_time, 'low': stick[1], 'high': stick[2], 'open': stick[3], 'close': stick[4]}
+
+
+def json_value(value):
+    # NaN is not valid JSON for browsers
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+class StreamPublisher:
+    # Turns the trading state into EventStream deltas. Runs on the trading
+    # thread, at most once per interval, and only compares the current state
+    # against what was last sent.
+    def __init__(self, event_stream, interval=0.1):
+        self.event_stream = event_stream
+        self.interval = interval
+        self.last_publish = 0
+        # Per period (buffer, revision, appended, live candle, indicators) last sent
+        self.sent = {}
+        self.state = {'periods': {}, 'flags': {}, 'balances': {}, 'orders': {}}
+
+    def maybe_publish(self, period_list, current_indicators, trade_engine):
+        now = time.time()
+        if now - self.last_publish < self.interval:
+            return
+        self.last_publish = now
+        events = []
+        state = dict(self.state)
+        periods_state = dict(state['periods'])
+        for cur_period in period_list:
+            self.publish_period(cur_period, current_indicators.get(cur_period.name, {}), events, periods_state)
+        state['periods'] = periods_state
+
+        flags = {product.product_id: 'buy' if product.buy_flag is True else 'sell' for product in trade_engine.products}
+        balances = {currency: '{0:.8f}'.format(amount) for currency, amount in trade_engine.balances.items()}
+        orders = {'orders': list(trade_engine.all_open_orders), 'fills': list(trade_engine.recent_fills)}
+        for name, value in (('flags', flags), ('balances', balances), ('orders', orders)):
+            if value != state[name]:
+                state[name] = value
+                events.append((name, value))
+
+        self.state = state
+        if events:
+            self.event_stream.publish(events, state)
+
+    def publish_period(self, cur_period, indicators, events, periods_state):
+        name = cur_period.name
+        candlesticks = cur_period.candlesticks
+        buffer, revision, appended, live, sent_indicators = self.sent.get(name, (None, None, 0, None, {}))
+        if buffer is not None and (buffer is not candlesticks or revision != candlesticks.revision):
+            # History was rewritten or reloaded, clients fetch it again from /periods/<name>
+            events.append(('reset', {'period': name}))
+        elif buffer is not None and candlesticks.appended > appended:
+            new_candles = min(candlesticks.appended - appended, len(candlesticks))
+            times, lows, highs, opens, closes, volumes = candlesticks.snapshot()
+            for row in zip(times[-new_candles:].tolist(), lows[-new_candles:].tolist(), highs[-new_candles:].tolist(),
+                           opens[-new_candles:].tolist(), closes[-new_candles:].tolist()):
+                events.append(('candle', {'period': name, 'candle': candle_dict(row), 'closed': True}))
+
+        cur_stick = cur_period.cur_candlestick.to_list()
+        new_live = candle_dict(cur_stick) if cur_stick[4] is not None else None
+        if new_live is not None and new_live != live:
+            events.append(('candle', {'period': name, 'candle': new_live, 'closed': False}))
+
+        new_indicators = {}
+        for indicator, value in indicators.items():
+            if callable(value):
+                continue
+            try:
+                new_indicators[indicator] = json_value(value)
+            except (TypeError, ValueError):
+                continue
+        changed = {indicator: value for indicator, value in new_indicators.items()
+                   if indicator not in sent_indicators or sent_indicators[indicator] != value}
+        if changed:
+            events.append(('indicators', {'period': name, 'indicators': changed}))
+
+        self.sent[name] = (candlesticks, candlesticks.revision, candlesticks.appended, new_live, new_indicators)
+        if new_live != live or changed or name not in periods_state:
+            periods_state[name] = {'candle': new_live, 'indicators': new_indicators}
@@ -1,2 +1,6 @@
 from .cursesDisplay import cursesDisplay
-from .web import web
\ No newline at end of file
+from .web import web
+from .EventStream import EventStream
+from .StreamPublisher import StreamPublisher
+from .EncodedCandles import EncodedCandles
+from .AsyncWeb import AsyncWeb
@@ -1,153 +1,217 @@
 import curses
 import time
 import logging
-from decimal import Decimal
+import datetime
+import threading
+
+PAD_WIDTH = 120
+ORDER_PAD_HEIGHT = 10
+# Colors of print_color
+GREEN, RED, PLAIN = 1, 2, 0
 
 
 class cursesDisplay:
-    def __init__(self, enable=True):
+    # Renders on its own thread at refresh_rate Hz. update() runs for every
+    # message and only records that the state changed; the render thread
+    # builds the screen as (pad, y, x) -> (text, color) cells from the
+    # current state and writes only the cells that differ from the last frame.
+    def __init__(self, enable=True, refresh_rate=10):
         self.enable = enable
         if not self.enable:
             return
         self.logger = logging.getLogger('trader-logger')
+        self.error_logger = logging.getLogger('error-logger')
+        self.interval = 1.0 / refresh_rate
         self.stdscr = curses.initscr()
-        self.pad = curses.newpad(23, 120)
-        self.order_pad = curses.newpad(10, 120)
+        self.pad = curses.newpad(23, PAD_WIDTH)
+        self.order_pad = curses.newpad(ORDER_PAD_HEIGHT, PAD_WIDTH)
         self.timestamp = ""
         self.last_order_update = 0
         curses.start_color()
         curses.noecho()
         curses.cbreak()
-        curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_GREEN)
-        curses.init_pair(2, curses.COLOR_BLACK, curses.COLOR_RED)
+        curses.init_pair(GREEN, curses.COLOR_BLACK, curses.COLOR_GREEN)
+        curses.init_pair(RED, curses.COLOR_BLACK, curses.COLOR_RED)
         self.stdscr.keypad(1)
-        self.pad.addstr(1, 0, "Waiting for a trade...")
-
-    def update_balances(self, trade_engine):
-        self.pad.addstr(0, 0, "%s: %.2f BTC: %.8f" %
-                        (trade_engine.fiat_currency, trade_engine.balances[trade_engine.fiat_currency], trade_engine.balances['BTC']))
-        self.pad.addstr(1, 0, "%s_EQUIV: %.2f" %
-                        (trade_engine.fiat_currency, trade_engine.balances['fiat_equivalent']))
-
-    def update_candlesticks(self, period_list):
-        starty = self.starty
-        if starty < self.signal_end_y + 1:
-            starty = self.signal_end_y + 1
-        for cur_period in period_list:
-            cur_stick = cur_period.cur_candlestick
-            if cur_stick.new is False:
-                self.pad.addstr(starty, 0, "%s - %s O: %f H: %f L: %f C: %f V: %f" %
-                                (cur_period.name, cur_stick.time, cur_stick.open,
-                                 cur_stick.high, cur_stick.low, cur_stick.close,
-                                 cur_stick.volume),
-                                self.print_color(cur_stick.close, cur_stick.open))
-            starty += 1
-        self.starty = starty
+        # Latest state handed to update(), read by the render thread
+        self.state = None
+        self.dirty = False
+        # Cells on screen, and the pad height and terminal size they were drawn for
+        self.cells = {}
+        self.padsize = 23
+        self.screen_size = None
+        self.order_cells = {}
+        self.frames = 0
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='curses_display', daemon=True)
+        self.thread.start()
 
-    def update_heartbeat(self):
-        self.pad.addstr(0, 83, self.timestamp)
+    def update(self, trade_engine, indicators, period_list, msg):
+        if not self.enable:
+            return
+        if msg.get('type') == "heartbeat":
+            self.timestamp = msg.get('time')
+        self.state = (trade_engine, indicators, period_list)
+        self.dirty = True
 
-    def update_indicators(self, period_list, indicators):
-        starty = self.starty
-        for cur_period in period_list:
-            stoch_diff = Decimal(indicators[cur_period.name]['stoch_slowk']) - Decimal(indicators[cur_period.name]['stoch_slowd'])
-            obv_diff = Decimal(indicators[cur_period.name]['obv']) - Decimal(indicators[cur_period.name]['obv_ema'])
-            self.pad.addstr(starty, 0, "%s - OBV_DIFF: %f STOCH_DIFF: %f ADX: %f" %
-                            (cur_period.name, obv_diff, stoch_diff, indicators[cur_period.name]['adx']),
-                            self.print_color(Decimal(obv_diff), Decimal('0.0')))
-            starty += 1
-        self.starty = starty + 1
-
-    def update_fills(self, trade_engine):
-        self.pad.addstr(9, 0, "Recent Fills")
-        starty = 10
-        for fill in trade_engine.auth_client.get_fills(limit=5)[0]:
-            self.pad.addstr(starty, 0, "%s Price: %s Size: %s Time: %s" %
-                            (fill.get('side').upper(), fill.get('price'),
-                             fill.get('size'), fill.get('created_at')))
-            starty += 1
+    def run(self):
+        while not self.stop.wait(self.interval):
+            try:
+                self.render()
+            except Exception:
+                self.error_logger.exception(datetime.datetime.now())
 
-    def update_orders(self, trade_engine):
-        starty = 0
-        self.order_pad.addstr(starty, 0, "Open Orders")
+    def render(self):
+        screen_size = self.stdscr.getmaxyx()
+        if screen_size != self.screen_size:
+            # Redraws everything after the terminal is resized
+            self.screen_size = screen_size
+            self.stdscr.clear()
+            self.stdscr.noutrefresh()
+            self.pad.erase()
+            self.order_pad.erase()
+            self.cells = {}
+            self.order_cells = {}
+            self.dirty = True
+            self.last_order_update = 0
+        if not self.dirty:
+            return
+        self.dirty = False
+        height, width = screen_size
+        if self.state is None:
+            if self.draw(self.pad, self.cells, {('pad', 1, 0): ("Waiting for a trade...", PLAIN)}):
+                self.pad.noutrefresh(0, 0, 0, 0, height - 1, width - 1)
+                curses.doupdate()
+            return
+        trade_engine, indicators, period_list = self.state
 
+        padsize = (len(period_list) * 2) + 3
+        if padsize != self.padsize:
+            self.padsize = padsize
+            self.pad.resize(padsize, PAD_WIDTH)
+            self.pad.erase()
+            self.cells = {}
+        changed = self.draw(self.pad, self.cells, self.get_cells(trade_engine, indicators, period_list))
+        if changed:
+            self.pad.noutrefresh(0, 0, 0, 0, height - 1, width - 1)
+        # Orders change rarely and the list is long, read every 3 seconds
         if time.time() - self.last_order_update > 3.0:
-            self.order_pad.erase()
-            self.order_pad.addstr(starty, 0, "Open Orders")
-            order_in_progress = False
-            # First check if trade engine has any open orders
-            for product in trade_engine.products:
-                if product.order_in_progress:
-                    order_in_progress = True
-            starty += 1
-            if not trade_engine.all_open_orders:
-                self.order_pad.addstr(starty, 0, 'None')
-            for order in trade_engine.all_open_orders:
-                self.order_pad.addstr(starty, 0, "%s %s Price: %s Size: %s Status: %s" %
-                                        (order.get('side').upper(), order.get('product_id'),
-                                        order.get('price'), order.get('size'),
-                                        order.get('status')))
-                starty += 1
             self.last_order_update = time.time()
-            height, width = self.stdscr.getmaxyx()
-            if height > (self.padsize + 1):
-                self.order_pad.refresh(0, 0, (self.padsize + 1), 0, (height - 1), (width - 1))
+            if self.draw(self.order_pad, self.order_cells, self.get_order_cells(trade_engine)) or changed:
+                if height > (self.padsize + 1):
+                    self.order_pad.noutrefresh(0, 0, self.padsize + 1, 0, height - 1, width - 1)
+                changed = True
+        if changed:
+            curses.doupdate()
+            self.frames += 1
+
+    def draw(self, pad, cells, new_cells):
+        # Writes the cells that differ from what is on the pad, blanking what
+        # is left of longer old text. Returns whether anything was written
+        changed = False
+        for key in list(cells):
+            if key not in new_cells:
+                y, x = key[1:]
+                self.write(pad, y, x, ' ' * len(cells.pop(key)[0]), PLAIN)
+                changed = True
+        for key, (text, color) in new_cells.items():
+            old = cells.get(key)
+            if old == (text, color):
+                continue
+            y, x = key[1:]
+            self.write(pad, y, x, text.ljust(len(old[0])) if old is not None else text, color)
+            cells[key] = (text, color)
+            changed = True
+        return changed
+
+    def write(self, pad, y, x, text, color):
+        try:
+            pad.addstr(y, x, text[:PAD_WIDTH - x], curses.color_pair(color))
+        except curses.error:
+            # Writing the bottom right corner of a pad moves the cursor off it
+            pass
 
-    def update_signals(self, trade_engine):
+    def get_cells(self, trade_engine, indicators, period_list):
+        cells = {}
+        self.add_balances(cells, trade_engine)
+        cells[('pad', 0, 83)] = (self.timestamp or '', PLAIN)
+        signal_end_y = self.add_signals(cells, trade_engine)
+        starty = 2
+        # Make sure indicator dict is populated
+        if len(indicators[period_list[0].name]) > 0:
+            starty = self.add_indicators(cells, period_list, indicators, starty)
+        self.add_candlesticks(cells, period_list, max(starty, signal_end_y + 1))
+        return cells
+
+    def add_balances(self, cells, trade_engine):
+        balances = trade_engine.balances
+        cells[('pad', 0, 0)] = ("%s: %.2f BTC: %.8f" % (trade_engine.fiat_currency, balances.get(trade_engine.fiat_currency, 0),
+                                                        balances.get('BTC', 0)), PLAIN)
+        cells[('pad', 1, 0)] = ("%s_EQUIV: %.2f" % (trade_engine.fiat_currency, balances['fiat_equivalent']), PLAIN)
+
+    def add_signals(self, cells, trade_engine):
         starty = 1
         for product in trade_engine.products:
             if product.buy_flag:
-                text = 'BUY'
-                color = curses.color_pair(1)
+                text, color = 'BUY', GREEN
             elif product.sell_flag:
-                text = 'SELL'
-                color = curses.color_pair(2)
+                text, color = 'SELL', RED
             else:
-                text = 'NONE'
-                color = curses.color_pair(0)
-            self.pad.addstr(starty, 93, "%s: %s" % (product.product_id, text), color)
+                text, color = 'NONE', PLAIN
+            cells[('pad', starty, 93)] = ("%s: %s" % (product.product_id, text), color)
             starty += 1
-        self.signal_end_y = starty
+        return starty
 
-    def update(self, trade_engine, indicators, period_list, msg):
-        if not self.enable:
-            return
-        self.padsize = (len(period_list) * 2) + 3
-        self.pad.resize(self.padsize, 120)
+    def add_indicators(self, cells, period_list, indicators, starty):
+        for cur_period in period_list:
+            period_indicators = dict(indicators[cur_period.name])
+            stoch_diff = float(period_indicators['stoch_slowk']) - float(period_indicators['stoch_slowd'])
+            obv_diff = float(period_indicators['obv']) - float(period_indicators['obv_ema'])
+            cells[('pad', starty, 0)] = ("%s - OBV_DIFF: %f STOCH_DIFF: %f ADX: %f" %
+                                         (cur_period.name, obv_diff, stoch_diff, period_indicators['adx']),
+                                         self.print_color(obv_diff, 0.0))
+            starty += 1
+        return starty + 1
 
-        self.starty = 2
-        if msg.get('type') == "heartbeat":
-            self.timestamp = msg.get('time')
-        self.pad.erase()
-        self.update_balances(trade_engine)
-        self.update_heartbeat()
-        self.update_signals(trade_engine)
-        # Make sure indicator dict is populated
-        if len(indicators[period_list[0].name]) > 0:
-            self.update_indicators(period_list, indicators)
-        self.update_candlesticks(period_list)
-        self.update_orders(trade_engine)
+    def add_candlesticks(self, cells, period_list, starty):
+        for cur_period in period_list:
+            cur_stick = cur_period.cur_candlestick
+            if cur_stick.new is False:
+                cells[('pad', starty, 0)] = ("%s - %s O: %f H: %f L: %f C: %f V: %f" %
+                                             (cur_period.name, cur_stick.time, cur_stick.open,
+                                              cur_stick.high, cur_stick.low, cur_stick.close,
+                                              cur_stick.volume),
+                                             self.print_color(cur_stick.close, cur_stick.open))
+            starty += 1
 
-        height, width = self.stdscr.getmaxyx()
-        self.pad.refresh(0, 0, 0, 0, (height - 1), (width - 1))
+    def get_order_cells(self, trade_engine):
+        cells = {('orders', 0, 0): ("Open Orders", PLAIN)}
+        open_orders = list(trade_engine.all_open_orders)
+        if not open_orders:
+            cells[('orders', 1, 0)] = ('None', PLAIN)
+        for starty, order in enumerate(open_orders[:ORDER_PAD_HEIGHT - 1], 1):
+            cells[('orders', starty, 0)] = ("%s %s Price: %s Size: %s Status: %s" %
+                                            (order.get('side').upper(), order.get('product_id'),
+                                             order.get('price'), order.get('size'), order.get('status')), PLAIN)
+        return cells
 
     def print_color(self, a, b, c=None, d=None):
         # If a > b, print green, otherwise red
         if c and d:
-            if Decimal(a) > Decimal(b) and Decimal(c) > Decimal(d):
-                return curses.color_pair(1)
-            else:
-                return curses.color_pair(2)
-        else:
-            if Decimal(a) > Decimal(b):
-                return curses.color_pair(1)
-            else:
-                return curses.color_pair(2)
+            if float(a) > float(b) and float(c) > float(d):
+                return GREEN
+            return RED
+        if float(a) > float(b):
+            return GREEN
+        return RED
 
     def close(self):
         if not self.enable:
             return
+        self.stop.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
         curses.nocbreak()
         self.stdscr.keypad(0)
         curses.echo()
-        curses.endwin()
\ No newline at end of file
+        curses.endwin()
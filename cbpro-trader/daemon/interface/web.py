@@ -1,94 +1,172 @@
 import os
-from flask import Flask, request, jsonify
+import time
+import gevent
+from flask import Flask, Response, request, jsonify
 from gevent.pywsgi import WSGIServer
+from .EventStream import EventStream
+from .StreamPublisher import StreamPublisher
+from .EncodedCandles import EncodedCandles
 
 class web(object):
-    def __init__(self, indicator_subsys, trade_engine, config, init_engine_and_indicators):
+    def __init__(self, indicator_subsys, trade_engine, config, init_engine_and_indicators, metrics=None):
         self.indicator_subsys = indicator_subsys
+        self.metrics = metrics
         self.trade_engine = trade_engine
         self.config = config
         self.init_engine_and_indicators = init_engine_and_indicators
+        self.event_stream = EventStream()
+        self.stream_publisher = StreamPublisher(self.event_stream)
+        # Stream clients wait with this, gevent.sleep once served by gevent
+        self.sleep = time.sleep
+        # Per period name, closed candles already encoded for /periods/<name>
+        self.encoded_candles = {}
         app = Flask(__name__)
         self.app = app
 
         @app.route('/products/')
         def products():
-            return jsonify(self.trade_engine.available_products)
+            return jsonify(self.get_products())
     
         @app.route('/periods/')
         @app.route('/periods/<periodName>')
         def periods(periodName=None):
-            period_data = []
             if periodName is None:
-                for period in self.indicator_subsys.period_list:
-                    period_data.append(period.name)
-                return jsonify(period_data)
-            else:
-                for period in self.indicator_subsys.period_list:
-                    if period.name == periodName:
-                        period_data = period.candlesticks.tolist() + [period.cur_candlestick.to_list()]
-                return jsonify([{
-                                'time': stick[0].timestamp(), 
-                                'low': stick[1],
-                                'high': stick[2],
-                                'open': stick[3],
-                                'close': stick[4]
-                                }
-                                for stick in period_data])
+                return jsonify(self.get_period_names())
+            period = self.get_period(periodName)
+            if period is None:
+                return jsonify([])
+            return self.period_candles(period)
 
         @app.route('/indicators/')
         @app.route('/indicators/<periodName>')
         def indicators(periodName=None):
-            if periodName is None:
-                return jsonify(self.indicator_subsys.current_indicators)
-            else:
-                return jsonify(self.indicator_subsys.current_indicators.get(periodName))
+            return jsonify(self.get_indicators(periodName))
 
         @app.route('/orders/')
         @app.route('/orders/<productId>')
         def orders(productId=None):
-            return jsonify({'orders': trade_engine.all_open_orders, 'fills': trade_engine.recent_fills})
+            return jsonify(self.get_orders())
 
         @app.route('/balances/')
         @app.route('/balances/<currency>')
         def balances(currency=None):
-            balances = trade_engine.balances.copy()
-            for key in balances:
-                balances[key] = '{0:.8f}'.format(balances[key])
-            return jsonify(balances)
+            return jsonify(self.get_balances())
 
         @app.route('/flags/')
         def flags():
-            flags = {}
-            for product in self.trade_engine.products:
-                if product.buy_flag is True:
-                    flags[product.product_id] = "buy"
-                else:
-                    flags[product.product_id] = "sell"
-            return jsonify(flags)
+            return jsonify(self.get_flags())
+
+        @app.route('/metrics/')
+        def metrics():
+            return jsonify(self.get_metrics())
+
+        @app.route('/stream/')
+        def stream():
+            # Server-sent events: a snapshot, then candle, indicator, flag,
+            # balance and order changes as they happen
+            events = self.event_stream.subscribe(request.headers.get('Last-Event-ID'), self.sleep)
+            return Response(events, mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
         @app.route('/config/', methods=['GET', 'POST'])
         def config(periodName=None):
-            if self.config.get("web_config"):
-                if request.method == 'POST':
-                    self.trade_engine.close()
-                    new_config = request.get_json()
-                    self.config.update(new_config)
-                    init_engine_and_indicators()
-
-                # Remove key/secret info from the response
-                new_config = self.config.copy()
-                del new_config['key']
-                del new_config['secret']
-                del new_config['passphrase']
+            if self.config.get("web_config") and request.method == 'POST':
+                self.trade_engine.close()
+                new_config = request.get_json()
+                self.config.update(new_config)
+                init_engine_and_indicators()
+            return jsonify(self.get_config())
+
+    # Route bodies, shared with AsyncWeb
+
+    def get_products(self):
+        return self.trade_engine.product_registry.product_ids()
+
+    def get_period_names(self):
+        return [period.name for period in self.indicator_subsys.period_list]
+
+    def get_period(self, name):
+        for period in self.indicator_subsys.period_list:
+            if period.name == name:
+                return period
+        return None
+
+    def get_indicators(self, name=None):
+        if name is None:
+            return self.indicator_subsys.current_indicators
+        return self.indicator_subsys.current_indicators.get(name)
+
+    def get_orders(self):
+        return {'orders': self.trade_engine.all_open_orders, 'fills': self.trade_engine.recent_fills}
+
+    def get_balances(self):
+        balances = self.trade_engine.balances.copy()
+        for key in balances:
+            balances[key] = '{0:.8f}'.format(balances[key])
+        return balances
+
+    def get_flags(self):
+        flags = {}
+        for product in self.trade_engine.products:
+            if product.buy_flag is True:
+                flags[product.product_id] = "buy"
             else:
-                new_config = {'web_config': False}
+                flags[product.product_id] = "sell"
+        return flags
+
+    def get_metrics(self):
+        if self.metrics is None or not self.metrics.enabled:
+            return {'enabled': False}
+        return self.metrics.snapshot()
+
+    def get_config(self):
+        if not self.config.get("web_config"):
+            return {'web_config': False}
+        # Remove key/secret info from the response
+        new_config = self.config.copy()
+        del new_config['key']
+        del new_config['secret']
+        del new_config['passphrase']
+        return new_config
+
+    def get_period_candles(self, period, since=None, limit=None, gzip=False, etag_matches=None):
+        # Returns the ETag and the body, None when etag_matches(etag) says the
+        # client already has it
+        cur_stick = period.cur_candlestick.to_list()
+        live_candle = [cur_stick[0].timestamp()] + cur_stick[1:5]
+        encoded = self.encoded_candles.get(period.name)
+        if encoded is None:
+            encoded = self.encoded_candles.setdefault(period.name, EncodedCandles())
+        etag = encoded.get_etag(period.candlesticks, live_candle) + ('-gzip' if gzip else '')
+        if etag_matches is not None and etag_matches(etag):
+            return etag, None
+        return etag, encoded.get_body(period.candlesticks, live_candle, since, limit, gzip)
+
+    def period_candles(self, period):
+        # ?since=<epoch> returns only candles from that time on, ?limit=<n> the
+        # last n. Clients revalidate with If-None-Match.
+        gzip = request.accept_encodings['gzip'] > 0
+        etag, body = self.get_period_candles(period, request.args.get('since', type=float),
+                                             request.args.get('limit', type=int), gzip,
+                                             request.if_none_match.contains)
+        if body is None:
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+            if gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
 
-            return jsonify(new_config)
+    def publish(self, period_list):
+        # Called from the trading loop, cheap when nothing changed
+        self.stream_publisher.maybe_publish(period_list, self.indicator_subsys.current_indicators, self.trade_engine)
 
     def start(self):
         if 'PRODUCTION' in os.environ:
+            self.sleep = gevent.sleep
             http_server = WSGIServer(('', 8080), self.app)
             http_server.serve_forever()
         else:
-            self.app.run(host='0.0.0.0')
\ No newline at end of file
+            self.app.run(host='0.0.0.0', threaded=True)
\ No newline at end of file
@@ -0,0 +1,26 @@
+import queue
+import logging
+from logging.handlers import QueueHandler
+
+
+class DeferredQueueHandler(QueueHandler):
+    # Queues records as they are, leaving message formatting to the
+    # QueueListener thread. Arguments must not be changed after logging,
+    # which holds for the numbers, strings and times logged here. A full
+    # queue drops debug records rather than blocking the caller, errors
+    # wait for room.
+    def __init__(self, log_queue):
+        super(DeferredQueueHandler, self).__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.ERROR:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,37 @@
+import logging
+
+categories = {}
+
+
+class LogCategory:
+    # Debug logging of one kind of hot path event (trades, candle updates,
+    # heartbeats), keeping one event in every. Callers check enabled()
+    # before building any arguments, which costs a cached level lookup when
+    # debug logging is off and a counter when it is on.
+    def __init__(self, name, logger_name='trader-logger', every=1):
+        self.name = name
+        self.logger = logging.getLogger(logger_name)
+        # 0 turns the category off
+        self.every = every
+        self.count = 0
+
+    def enabled(self):
+        if not self.every or not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        self.count += 1
+        return self.count % self.every == 0
+
+
+def get_category(name):
+    category = categories.get(name)
+    if category is None:
+        category = categories.setdefault(name, LogCategory(name))
+    return category
+
+
+def set_sampling(rates):
+    # rates maps category names to log one in every N events
+    for name, every in (rates or {}).items():
+        category = get_category(name)
+        category.every = int(every)
+        category.count = 0
@@ -0,0 +1,61 @@
+import queue
+import logging
+from logging.handlers import QueueListener
+from .DeferredQueueHandler import DeferredQueueHandler
+from .RotatingLogFile import RotatingLogFile
+from .LogCategory import set_sampling
+
+LOG_FORMAT = '%(message)s'
+
+
+class LogSubsystem:
+    # Routes 'trader-logger' and 'error-logger' through one queue to a
+    # QueueListener thread, so the trading thread never formats messages or
+    # waits on disk. Debug logging is only enabled when something writes it,
+    # otherwise the hot path guards skip it entirely.
+    def __init__(self, config):
+        self.queue = queue.Queue(maxsize=config.get('log_queue_size', 10000))
+        self.handler = DeferredQueueHandler(self.queue)
+        max_bytes = config.get('log_max_mb', 50) * 1024 * 1024
+        backups = config.get('log_backups', 5)
+        compress = config.get('log_compress', True)
+
+        trader_handlers = []
+        if config.get('logging'):
+            trader_handlers.append(RotatingLogFile(config.get('log_file', 'debug.log'), max_bytes, backups, compress))
+        if config.get('frontend') == 'debug':
+            trader_handlers.append(logging.StreamHandler())
+        error_handler = RotatingLogFile('error.log', max_bytes, backups, compress)
+        error_handler.addFilter(logging.Filter('error-logger'))
+        for handler in trader_handlers:
+            handler.addFilter(logging.Filter('trader-logger'))
+        for handler in trader_handlers + [error_handler]:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        self.logger = logging.getLogger('trader-logger')
+        self.error_logger = logging.getLogger('error-logger')
+        for logger in (self.logger, self.error_logger):
+            # Replaces the handlers of an earlier instance
+            logger.handlers = [self.handler]
+            logger.propagate = False
+        if trader_handlers:
+            self.logger.setLevel(str(config.get('log_level', 'debug')).upper())
+        else:
+            self.logger.setLevel(logging.WARNING)
+        set_sampling(config.get('log_sample'))
+
+        self.listener = QueueListener(self.queue, *(trader_handlers + [error_handler]), respect_handler_level=True)
+        self.listener.start()
+        self.closed = False
+
+    def get_stats(self):
+        return {'queued': self.queue.qsize(), 'dropped': self.handler.dropped}
+
+    def close(self):
+        # Writes out everything queued so far
+        if self.closed:
+            return
+        self.closed = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
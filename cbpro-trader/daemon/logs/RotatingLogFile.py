@@ -0,0 +1,20 @@
+import os
+import gzip
+import shutil
+from logging.handlers import RotatingFileHandler
+
+
+def compress_file(source, dest):
+    with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+class RotatingLogFile(RotatingFileHandler):
+    # Starts a new file every max_bytes (0 never), keeping backups old ones,
+    # gzip compressed as debug.log.1.gz etc. when compress is set
+    def __init__(self, filename, max_bytes=50 * 1024 * 1024, backups=5, compress=True):
+        super(RotatingLogFile, self).__init__(filename, maxBytes=max_bytes, backupCount=backups, delay=True)
+        if compress:
+            self.namer = lambda name: name + '.gz'
+            self.rotator = compress_file
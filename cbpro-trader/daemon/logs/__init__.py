@@ -0,0 +1,4 @@
+from .LogCategory import LogCategory, get_category, set_sampling
+from .DeferredQueueHandler import DeferredQueueHandler
+from .RotatingLogFile import RotatingLogFile
+from .LogSubsystem import LogSubsystem
@@ -0,0 +1,55 @@
+class LatencyHistogram:
+    # Log-linear histogram of durations in microseconds. Each power of two is
+    # split into 8 buckets, so percentiles are accurate to within ~12%.
+    SUB_BUCKETS = 8
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (64 * self.SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        micros = int(seconds * 1000000)
+        if micros < 0:
+            micros = 0
+        if micros < self.SUB_BUCKETS:
+            idx = micros
+        else:
+            shift = micros.bit_length() - 4
+            idx = (shift + 1) * self.SUB_BUCKETS + ((micros >> shift) & 7)
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += micros
+        if micros > self.max:
+            self.max = micros
+
+    def bucket_upper_bound(self, idx):
+        group, sub = divmod(idx, self.SUB_BUCKETS)
+        if group == 0:
+            return sub
+        return ((self.SUB_BUCKETS + sub + 1) << (group - 1)) - 1
+
+    def percentile(self, fraction):
+        if self.count == 0:
+            return 0
+        target = fraction * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                return min(self.bucket_upper_bound(idx), self.max)
+        return self.max
+
+    def summary(self):
+        # All values in microseconds
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(0.50),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
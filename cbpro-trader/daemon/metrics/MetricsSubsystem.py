@@ -0,0 +1,126 @@
+import time
+import logging
+from .LatencyHistogram import LatencyHistogram
+
+
+class MetricsSubsystem:
+    def __init__(self, enabled=True, summary_interval=60, sequence_field='sequence'):
+        self.logger = logging.getLogger('trader-logger')
+        self.enabled = enabled
+        # 'sequence' on the full channel, 'trade_id' of matches otherwise
+        self.sequence_field = sequence_field
+        self.summary_interval = summary_interval
+        self.started = time.time()
+        self.last_summary_time = time.time()
+        self.last_summary = {}
+        # Cumulative since start and for the current summary interval
+        self.totals = {}
+        self.intervals = {}
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.messages = 0
+        self.last_sequence = {}
+        self.sequence_gaps = 0
+        self.missing_messages = 0
+        self.out_of_order = 0
+        # Callables returning stats dicts from other subsystems, included in snapshots
+        self.sources = {}
+        # Created up front, snapshot() iterates the stages from the web thread
+        self.get_histograms('lag')
+
+    def add_source(self, name, get_stats):
+        self.sources[name] = get_stats
+
+    def get_histograms(self, stage):
+        if stage not in self.totals:
+            self.totals[stage] = LatencyHistogram()
+            self.intervals[stage] = LatencyHistogram()
+        return self.totals[stage], self.intervals[stage]
+
+    def record(self, stage, seconds):
+        total, interval = self.get_histograms(stage)
+        total.record(seconds)
+        interval.record(seconds)
+
+    def timed(self, stage, func):
+        # Wraps func so every call is recorded under stage. Disabled metrics
+        # return func itself so there is no overhead at all.
+        if not self.enabled:
+            return func
+        total, interval = self.get_histograms(stage)
+        perf_counter = time.perf_counter
+
+        def timed_func(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                total.record(elapsed)
+                interval.record(elapsed)
+        return timed_func
+
+    def message_received(self, msg, queue_depth):
+        self.messages += 1
+        self.queue_depth = queue_depth
+        if queue_depth > self.max_queue_depth:
+            self.max_queue_depth = queue_depth
+        # Decoded events carry the exchange time, so lag is exchange -> here
+        timestamp = getattr(msg, 'timestamp', None)
+        if timestamp is not None:
+            self.record('lag', time.time() - timestamp)
+        if self.sequence_field == 'sequence':
+            if msg.get('type') != 'heartbeat':
+                self.check_sequence(msg.get('product_id'), msg.get('sequence'))
+        elif msg.get('type') == 'match':
+            # Without the full channel only trade ids are consecutive
+            self.check_sequence(msg.get('product_id'), msg.get(self.sequence_field))
+
+    def check_sequence(self, product_id, sequence):
+        if product_id is None or sequence is None:
+            return
+        sequence = int(sequence)
+        last_sequence = self.last_sequence.get(product_id)
+        if last_sequence is not None:
+            if sequence > last_sequence + 1:
+                self.sequence_gaps += 1
+                self.missing_messages += sequence - last_sequence - 1
+            elif sequence <= last_sequence:
+                self.out_of_order += 1
+                return
+        self.last_sequence[product_id] = sequence
+
+    def reset_sequences(self):
+        # Sequences restart from the current book after a reconnect
+        self.last_sequence = {}
+
+    def snapshot(self):
+        return {
+            'uptime': time.time() - self.started,
+            'messages': self.messages,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'sequence_gaps': self.sequence_gaps,
+            'missing_messages': self.missing_messages,
+            'out_of_order': self.out_of_order,
+            'stages': {stage: histogram.summary() for stage, histogram in list(self.totals.items())},
+            'last_interval': self.last_summary,
+            'sources': {name: get_stats() for name, get_stats in list(self.sources.items())},
+        }
+
+    def maybe_log_summary(self):
+        now = time.time()
+        if not self.enabled or now - self.last_summary_time < self.summary_interval:
+            return
+        self.last_summary = {stage: histogram.summary() for stage, histogram in self.intervals.items()}
+        for histogram in self.intervals.values():
+            histogram.reset()
+        self.last_summary_time = now
+
+        self.logger.debug("[METRICS] messages: %d queue depth: %d (max %d) gaps: %d missing: %d out of order: %d",
+                          self.messages, self.queue_depth, self.max_queue_depth, self.sequence_gaps,
+                          self.missing_messages, self.out_of_order)
+        for stage, summary in sorted(self.last_summary.items()):
+            self.logger.debug("[METRICS] %s count: %d p50: %dus p99: %dus max: %dus",
+                              stage, summary['count'], summary['p50'], summary['p99'], summary['max'])
+        self.max_queue_depth = self.queue_depth
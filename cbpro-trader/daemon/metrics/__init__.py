@@ -0,0 +1,2 @@
+from .LatencyHistogram import LatencyHistogram
+from .MetricsSubsystem import MetricsSubsystem
\ No newline at end of file
@@ -0,0 +1,81 @@
+import cbpro
+import datetime
+import pytz
+import numpy as np
+from .Period import Period
+from .CandleView import CandleView
+
+
+class AggregatedPeriod(Period):
+    # Period rolled up from the closed candles of a finer Period of the same
+    # product. It consumes no trades or heartbeats itself: the base period
+    # notifies it when its candles change, so per-trade work stays with the
+    # base candle however many coarser periods there are.
+    def __init__(self, base_period, period_size=300, name='Period', initialize=True, cbpro_client=cbpro.PublicClient(), max_candles=1000, candle_cache=None):
+        self.base_period = base_period
+        # [time, low, high, open, close, volume] of the closed base candles in
+        # the current bucket, None while there are none
+        self.partial = None
+        super(AggregatedPeriod, self).__init__(period_size=period_size, name=name, product=base_period.product,
+                                               initialize=False, cbpro_client=cbpro_client,
+                                               max_candles=max_candles, candle_cache=candle_cache)
+        self.cur_candlestick = CandleView(self)
+        base_period.views.append(self)
+        if initialize:
+            self.initialize()
+
+    def initialize(self):
+        # Older candles come from history, the current bucket from the base period
+        hist_data = self.get_historical_data()
+        self.set_bucket(self.base_period.cur_candlestick_epoch // self.period_size * self.period_size)
+        self.candlesticks.clear()
+        self.candlesticks.extend([row for row in hist_data if row[0].timestamp() < self.cur_candlestick_epoch])
+        self.refresh()
+
+    def set_bucket(self, epoch):
+        self.cur_candlestick_epoch = epoch
+        self.cur_candlestick_start = datetime.datetime.fromtimestamp(epoch, pytz.utc)
+
+    def aggregate_bucket(self, start):
+        base_candles = self.base_period.candlesticks
+        times = base_candles.times
+        first, last = np.searchsorted(times, [start, start + self.period_size])
+        if first == last:
+            return None
+        return [int(start), float(base_candles.lows[first:last].min()), float(base_candles.highs[first:last].max()),
+                float(base_candles.opens[first]), float(base_candles.closes[last - 1]),
+                float(base_candles.volumes[first:last].sum())]
+
+    def refresh(self):
+        # Called by the base period whenever its candles change
+        while self.base_period.cur_candlestick_epoch >= self.cur_candlestick_epoch + self.period_size:
+            closed_stick = self.aggregate_bucket(self.cur_candlestick_epoch)
+            if closed_stick is None:
+                # No base candles in this bucket, carry the last close forward
+                prev_close = self.candlesticks.closes[-1] if len(self.candlesticks) else self.base_period.cur_candlestick.open
+                closed_stick = [self.cur_candlestick_epoch, prev_close, prev_close, prev_close, prev_close, 0.0]
+            self.candlesticks.append(closed_stick)
+            self.cur_candlestick.print_stick(self.name)
+            self.set_bucket(self.cur_candlestick_epoch + self.period_size)
+        self.partial = self.aggregate_bucket(self.cur_candlestick_epoch)
+
+    def reaggregate(self, since):
+        # Rebuilds closed candles from base candles patched since the given
+        # epoch, only for buckets the base period still holds entirely
+        base_times = self.base_period.candlesticks.times
+        if len(base_times) == 0:
+            return
+        covered = -(-int(base_times[0]) // self.period_size) * self.period_size
+        start = max(covered, since // self.period_size * self.period_size)
+        times = self.candlesticks.times.tolist()
+        for idx in range(int(np.searchsorted(times, start)), len(times)):
+            closed_stick = self.aggregate_bucket(times[idx])
+            if closed_stick is not None:
+                self.candlesticks.replace(idx, closed_stick)
+        self.partial = self.aggregate_bucket(self.cur_candlestick_epoch)
+
+    def process_heartbeat(self, heartbeat):
+        pass
+
+    def process_trade(self, cur_trade):
+        pass
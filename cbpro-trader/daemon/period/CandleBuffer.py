@@ -0,0 +1,139 @@
+import datetime
+import threading
+import pytz
+import numpy as np
+
+
+class CandleBuffer:
+    # Column order matches the rows returned by the CBPRO historic rates API
+    # (time, low, high, open, close, volume). Time is kept separately as int64
+    # epoch seconds, the price/volume columns are float64.
+    LOW, HIGH, OPEN, CLOSE, VOLUME = range(5)
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        # Every row is written twice, at slot and slot + capacity, so the most
+        # recent rows are always one contiguous slice of the arrays below.
+        self._times = np.zeros(2 * capacity, dtype='i8')
+        self._data = np.zeros((5, 2 * capacity), dtype='f8')
+        self._slot = 0
+        self._size = 0
+        # Number of candles ever appended and number of times existing history
+        # was rewritten. Lets consumers with incremental state detect changes.
+        self.appended = 0
+        self.revision = 0
+        # Held while the buffer changes so other threads can take a snapshot
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _window(self):
+        end = self._slot + self.capacity
+        return end - self._size, end
+
+    def _index_to_slot(self, idx):
+        if idx < 0:
+            idx += self._size
+        if idx < 0 or idx >= self._size:
+            raise IndexError("candle index out of range")
+        start, end = self._window()
+        return (start + idx) % self.capacity
+
+    def _write(self, slot, row):
+        stick_time = row[0]
+        if isinstance(stick_time, datetime.datetime):
+            stick_time = stick_time.timestamp()
+        for position in (slot, slot + self.capacity):
+            self._times[position] = int(stick_time)
+            self._data[:, position] = row[1:6]
+
+    def __getitem__(self, idx):
+        slot = self._index_to_slot(idx)
+        return np.array([datetime.datetime.fromtimestamp(int(self._times[slot]), pytz.utc),
+                         *self._data[:, slot].tolist()], dtype='object')
+
+    def append(self, row):
+        with self.lock:
+            self._write(self._slot, row)
+            self._slot = (self._slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            self.appended += 1
+
+    def extend(self, rows):
+        for row in rows[-self.capacity:]:
+            self.append(row)
+
+    def load(self, times, lows, highs, opens, closes, volumes):
+        # Bulk replacement of the history from column arrays, keeps the newest
+        # capacity rows
+        size = min(len(times), self.capacity)
+        start = len(times) - size
+        with self.lock:
+            for position in (0, self.capacity):
+                self._times[position:position + size] = times[start:]
+                for column, values in enumerate((lows, highs, opens, closes, volumes)):
+                    self._data[column, position:position + size] = values[start:]
+            self._slot = size % self.capacity
+            self._size = size
+            self.appended += size
+            self.revision += 1
+
+    def pop(self):
+        with self.lock:
+            row = self[-1]
+            self._slot = (self._slot - 1) % self.capacity
+            self._size -= 1
+            self.revision += 1
+        return row
+
+    def replace(self, idx, row):
+        with self.lock:
+            self._write(self._index_to_slot(idx), row)
+            self.revision += 1
+
+    def clear(self):
+        with self.lock:
+            self._slot = 0
+            self._size = 0
+            self.revision += 1
+
+    def snapshot(self):
+        # Copies of every column taken from the same window, for readers on
+        # other threads (times, lows, highs, opens, closes, volumes)
+        with self.lock:
+            start, end = self._window()
+            times = self._times[start:end].copy()
+            data = self._data[:, start:end].copy()
+        return (times, *data)
+
+    def _column(self, column):
+        start, end = self._window()
+        return self._data[column, start:end]
+
+    # Zero-copy, C-contiguous views of the live window, oldest candle first.
+    # They are only valid until the next append, so copy before storing.
+    @property
+    def times(self):
+        start, end = self._window()
+        return self._times[start:end]
+
+    @property
+    def lows(self):
+        return self._column(self.LOW)
+
+    @property
+    def highs(self):
+        return self._column(self.HIGH)
+
+    @property
+    def opens(self):
+        return self._column(self.OPEN)
+
+    @property
+    def closes(self):
+        return self._column(self.CLOSE)
+
+    @property
+    def volumes(self):
+        return self._column(self.VOLUME)
@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+import numpy as np
+
+# One record per candle, same column order as CBPRO historic rates
+CANDLE_DTYPE = np.dtype([('time', '<i8'), ('low', '<f8'), ('high', '<f8'),
+                         ('open', '<f8'), ('close', '<f8'), ('volume', '<f8')])
+# Granularity coarser periods are derived from when it is cached
+BASE_GRANULARITY = 60
+# CBPRO returns at most this many candles per historic rates request
+MAX_REQUEST_CANDLES = 300
+# Recent candles are refetched on every refresh, CBPRO history lags a few minutes
+OVERLAP_CANDLES = 10
+
+
+def aggregate_candles(candles, granularity):
+    # Rolls finer candles (oldest first) up into granularity aligned buckets
+    if len(candles) == 0:
+        return np.empty(0, dtype=CANDLE_DTYPE)
+    buckets = candles['time'] // granularity * granularity
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(candles)]
+    aggregated = np.empty(len(starts), dtype=CANDLE_DTYPE)
+    aggregated['time'] = buckets[starts]
+    aggregated['low'] = np.minimum.reduceat(candles['low'], starts)
+    aggregated['high'] = np.maximum.reduceat(candles['high'], starts)
+    aggregated['open'] = candles['open'][starts]
+    aggregated['close'] = candles['close'][ends - 1]
+    aggregated['volume'] = np.add.reduceat(candles['volume'], starts)
+    return aggregated
+
+
+class CandleCache:
+    # On-disk candle history per (product, granularity). Each file is a flat
+    # array of CANDLE_DTYPE records, oldest first, read through a memory map.
+    # Only the candles missing since the last refresh are fetched.
+    def __init__(self, path='candles', max_candles=20000, fresh_seconds=5):
+        self.path = path
+        self.max_candles = max_candles
+        # Refreshes within this many seconds of the last one are served from disk
+        self.fresh_seconds = fresh_seconds
+        self.last_refresh = {}
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def file_name(self, product, granularity):
+        return os.path.join(self.path, '%s-%d.candles' % (product, granularity))
+
+    def read(self, product, granularity):
+        file_name = self.file_name(product, granularity)
+        try:
+            # Ignores a partially written trailing record
+            count = os.path.getsize(file_name) // CANDLE_DTYPE.itemsize
+        except OSError:
+            count = 0
+        if count == 0:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return np.memmap(file_name, dtype=CANDLE_DTYPE, mode='r', shape=(count,))
+
+    def write(self, product, granularity, candles, replace=False):
+        # Stores fetched candles (oldest first). They supersede any cached
+        # candles from their first time onwards.
+        if len(candles) == 0:
+            return
+        file_name = self.file_name(product, granularity)
+        cached = self.read(product, granularity)
+        if not replace and len(cached) and candles['time'][0] > cached['time'][-1] \
+           and len(cached) + len(candles) <= self.max_candles:
+            with open(file_name, 'ab') as candle_file:
+                candle_file.write(candles.tobytes())
+            return
+        if not replace:
+            candles = np.concatenate((cached[cached['time'] < candles['time'][0]], candles))
+        candles = candles[-self.max_candles:]
+        # Written aside and renamed so readers never see a half written file
+        temp_name = file_name + '.tmp'
+        candles.tofile(temp_name)
+        os.replace(temp_name, file_name)
+
+    def refresh(self, product, granularity, start, end, fetch):
+        key = (product, granularity)
+        cached = self.read(product, granularity)
+        if len(cached) and time.time() - self.last_refresh.get(key, 0) < self.fresh_seconds:
+            return cached
+        if self.has_tail(cached, granularity, start, end):
+            fetch_start = max(cached['time'][0], cached['time'][-1] - OVERLAP_CANDLES * granularity)
+            self.write(product, granularity, fetch(product, granularity, fetch_start, end))
+        else:
+            self.write(product, granularity, fetch(product, granularity, start, end), replace=True)
+        self.last_refresh[key] = time.time()
+        return self.read(product, granularity)
+
+    def has_tail(self, cached, granularity, start, end):
+        # True if cached covers start and the rest can be fetched in one request
+        return len(cached) > 0 and cached['time'][0] <= start \
+            and (end - cached['time'][-1]) // granularity + OVERLAP_CANDLES < MAX_REQUEST_CANDLES
+
+    def get_candles(self, product, granularity, start, end, fetch):
+        # Candles of product between start and end (epoch seconds), oldest
+        # first. fetch(product, granularity, start, end) requests candles from
+        # CBPRO in the same format.
+        with self.lock:
+            if granularity > BASE_GRANULARITY and granularity % BASE_GRANULARITY == 0:
+                aligned_start = start // granularity * granularity
+                base = self.read(product, BASE_GRANULARITY)
+                if self.has_tail(base, BASE_GRANULARITY, aligned_start, end):
+                    base = self.refresh(product, BASE_GRANULARITY, aligned_start, end, fetch)
+                    return aggregate_candles(base[base['time'] >= aligned_start], granularity)
+            candles = self.refresh(product, granularity, start, end, fetch)
+            return np.array(candles[candles['time'] >= start // granularity * granularity])
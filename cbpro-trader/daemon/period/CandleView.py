@@ -0,0 +1,60 @@
+import logging
+
+
+class CandleView:
+    # Live candle of an AggregatedPeriod. Merges the closed base candles of the
+    # current bucket with the base period's live candle when read, so trades
+    # only ever update the base candle.
+    def __init__(self, aggregated_period):
+        self.period = aggregated_period
+
+    @property
+    def base(self):
+        return self.period.base_period.cur_candlestick
+
+    @property
+    def new(self):
+        return self.period.partial is None and self.base.new
+
+    @property
+    def time(self):
+        return self.period.cur_candlestick_start
+
+    @property
+    def open(self):
+        partial = self.period.partial
+        return partial[3] if partial is not None else self.base.open
+
+    @property
+    def high(self):
+        partial = self.period.partial
+        if partial is None or self.base.high is None:
+            return self.base.high if partial is None else partial[2]
+        return max(partial[2], self.base.high)
+
+    @property
+    def low(self):
+        partial = self.period.partial
+        if partial is None or self.base.low is None:
+            return self.base.low if partial is None else partial[1]
+        return min(partial[1], self.base.low)
+
+    @property
+    def close(self):
+        partial = self.period.partial
+        if self.base.close is None and partial is not None:
+            return partial[4]
+        return self.base.close
+
+    @property
+    def volume(self):
+        partial = self.period.partial
+        return self.base.volume + (partial[5] if partial is not None else 0)
+
+    def to_list(self):
+        return [self.time, self.low, self.high, self.open, self.close, self.volume]
+
+    def print_stick(self, period_name):
+        if self.period.logger.isEnabledFor(logging.DEBUG):
+            self.period.logger.debug("[CANDLESTICK %s] Time: %s Open: %s High: %s Low: %s Close: %s Vol: %s",
+                                     period_name, self.time, self.open, self.high, self.low, self.close, self.volume)
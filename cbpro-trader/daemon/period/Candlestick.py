@@ -1,5 +1,9 @@
 import logging
 import numpy as np
+from logs import get_category
+
+# Every trade added to a candle, sampled by log_sample in config.yml
+trade_log = get_category('trade')
 
 class Candlestick:
     def __init__(self, isotime=None, existing_candlestick=None, prev_close=None):
@@ -41,8 +45,9 @@ class Candlestick:
 
         self.close = new_trade.price
         self.volume = self.volume + new_trade.volume
-        self.logger.debug("[TRADE] Time: %s Price: %f Vol: %f" %
-                          (new_trade.time, new_trade.price, new_trade.volume))
+        if trade_log.enabled():
+            self.logger.debug("[TRADE] Time: %s Price: %f Vol: %f",
+                              new_trade.epoch, new_trade.price, new_trade.volume)
 
     def close_candlestick(self, period_name, prev_stick=None):
         self.logger.debug("Candlestick Closed!")
@@ -61,6 +66,6 @@ class Candlestick:
                         self.close, self.volume]
 
     def print_stick(self, period_name):
-        self.logger.debug("[CANDLESTICK %s] Time: %s Open: %s High: %s Low: %s Close: %s Vol: %s" %
-                          (period_name, self.time, self.open, self.high, self.low,
-                           self.close, self.volume))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("[CANDLESTICK %s] Time: %s Open: %s High: %s Low: %s Close: %s Vol: %s",
+                              period_name, self.time, self.open, self.high, self.low, self.close, self.volume)
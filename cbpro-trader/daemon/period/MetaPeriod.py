@@ -1,64 +1,95 @@
-import copy
 import cbpro
-import datetime
-import time
 import numpy as np
-import pytz
-from decimal import Decimal
 from .Period import Period
 
-class MetaPeriod(Period):
-    def __init__(self, period_size=60, name='Period', product='BTC-USD', fiat='USD', initialize=True, cbpro_client=cbpro.PublicClient()):
-        self.base = product[:3] + '-' + fiat
-        self.quoted = product[4:] + '-' + fiat
-        super(MetaPeriod, self).__init__(period_size=period_size, name=name, product=product, initialize=True, cbpro_client=cbpro_client)
 
-    def process_trade(self, msg):
-        newmsg = copy.deepcopy(msg)
-        if msg.get('product_id') == self.base:
-            newmsg['product_id'] = self.product
-            quoted_last = Decimal(msg.get('price')) / Decimal(self.cur_candlestick.close)
-            total_price = quoted_last + Decimal(msg.get('price'))
-            newmsg['size'] = Decimal(msg.get('size')) * (Decimal(msg.get('price')) / total_price)
-            newmsg['price'] = Decimal(msg.get('price')) / quoted_last
-        elif msg.get('product_id') == self.quoted:
-            newmsg['product_id'] = self.product
-            base_last = Decimal(self.cur_candlestick.close) * Decimal(msg.get('price'))
-            total_price = base_last + Decimal(msg.get('price'))
-            newmsg['size'] = Decimal(msg.get('size')) * (Decimal(msg.get('price')) / total_price)
-            newmsg['price'] = base_last / Decimal(msg.get('price'))
-        super(MetaPeriod, self).process_trade(msg=newmsg)
+def get_meta_legs(product, fiat='USD'):
+    # A synthetic BASE-QUOTED pair is priced from BASE-fiat / QUOTED-fiat,
+    # e.g. LTC-ETH from LTC-USD and ETH-USD
+    base, quoted = product.split('-')
+    return base + '-' + fiat, quoted + '-' + fiat
+
+
+def synthetic_candles(base, quoted):
+    # Candles of base / quoted from the candles of both legs, as float arrays
+    # of historic rates rows [time, low, high, open, close, volume], oldest
+    # first. The legs are joined on time: a minute without trades on one leg
+    # holds its previous close, minutes before either leg's first candle are
+    # left out. Volume is in base units, the quoted leg's converted at the
+    # synthetic close.
+    if len(base) == 0 or len(quoted) == 0:
+        return np.empty((0, 6))
+    times = np.union1d(base[:, 0], quoted[:, 0])
+    times = times[times >= max(base[0, 0], quoted[0, 0])]
+    legs = []
+    for leg in (base, quoted):
+        idx = np.searchsorted(leg[:, 0], times, side='right') - 1
+        exact = leg[idx, 0] == times
+        filled = leg[idx].copy()
+        # Flat at the previous close with no volume when the leg has no candle
+        filled[~exact, 1:5] = leg[idx[~exact], 4:5]
+        filled[~exact, 5] = 0
+        legs.append(filled)
+    base, quoted = legs
+    candles = np.empty((len(times), 6))
+    candles[:, 0] = times
+    candles[:, 3] = base[:, 3] / quoted[:, 3]
+    candles[:, 4] = base[:, 4] / quoted[:, 4]
+    # Both legs' extremes may not be simultaneous, so bound the candle by
+    # every ratio known to have traded
+    prices = np.column_stack((base[:, 1] / quoted[:, 1], base[:, 2] / quoted[:, 2], candles[:, 3], candles[:, 4]))
+    candles[:, 1] = prices.min(axis=1)
+    candles[:, 2] = prices.max(axis=1)
+    candles[:, 5] = base[:, 5] + quoted[:, 5] / candles[:, 4]
+    return candles
+
+
+class MetaPeriod(Period):
+    # Period of a pair not traded on CBPRO, derived from two fiat pairs.
+    # The last price of each leg is kept as a float and every trade on
+    # either leg becomes a trade of the synthetic pair at their ratio.
+    def __init__(self, period_size=60, name='Period', product='BTC-USD', fiat='USD', initialize=True, cbpro_client=cbpro.PublicClient(), max_candles=1000, candle_cache=None):
+        self.base, self.quoted = get_meta_legs(product, fiat)
+        self.base_price = None
+        self.quoted_price = None
+        super(MetaPeriod, self).__init__(period_size=period_size, name=name, product=product, initialize=initialize, cbpro_client=cbpro_client, max_candles=max_candles, candle_cache=candle_cache)
 
-    def get_historical_data(self, num_periods=200):
-        end = datetime.datetime.utcnow()
-        end_iso = end.isoformat()
-        start = end - datetime.timedelta(seconds=(self.period_size * num_periods))
-        start_iso = start.isoformat()
+    def initialize(self):
+        # Leg prices start over from the fetched history
+        self.base_price = None
+        self.quoted_price = None
+        super(MetaPeriod, self).initialize()
 
-        ret_base = self.cbpro_client.get_product_historic_rates(self.base, granularity=self.period_size, start=start_iso, end=end_iso)
-        ret_quoted = self.cbpro_client.get_product_historic_rates(self.quoted, granularity=self.period_size, start=start_iso, end=end_iso)
-        # Check if we got rate limited, which will return a JSON message
-        while not isinstance(ret_base, list):
-            time.sleep(3)
-            ret_base = self.cbpro_client.get_product_historic_rates(self.base, granularity=self.period_size, start=start_iso, end=end_iso)
-        while not isinstance(ret_quoted, list):
-            time.sleep(3)
-            ret_quoted = self.cbpro_client.get_product_historic_rates(self.quoted, granularity=self.period_size, start=start_iso, end=end_iso)
-        hist_data_base = np.array(ret_base, dtype='object')
-        hist_data_quoted = np.array(ret_quoted, dtype='object')
-        array_size = min(len(ret_base), len(ret_quoted))
-        hist_data_base.resize(array_size, 6)
-        hist_data_quoted.resize(array_size, 6)
+    def get_product_ids(self):
+        return [self.base, self.quoted]
 
-        for row in hist_data_base:
-            row[0] = datetime.datetime.fromtimestamp(row[0], pytz.utc)
-        for row in hist_data_quoted:
-            row[0] = datetime.datetime.fromtimestamp(row[0], pytz.utc)
+    def process_trade(self, cur_trade):
+        if cur_trade.product_id == self.base:
+            self.base_price = cur_trade.price
+            size = cur_trade.size
+        elif cur_trade.product_id == self.quoted:
+            self.quoted_price = cur_trade.price
+            size = None
+        else:
+            return
+        if not self.base_price or not self.quoted_price:
+            return
+        price = self.base_price / self.quoted_price
+        if size is None:
+            # Quoted leg volume in base units
+            size = cur_trade.size * self.quoted_price / self.base_price
+        super(MetaPeriod, self).process_trade(cur_trade.derive(self.product, price, size))
 
-        hist_data = np.ndarray((len(hist_data_base), 6), dtype='object')
-        hist_data[:, 0] = hist_data_base[:, 0]
-        hist_data[:, [1,2,3,4]] = hist_data_base[:, [1,2,3,4]]/hist_data_quoted[:, [1,2,3,4]]
-        total_price = (hist_data_base[:, 4] + hist_data_quoted[:, 4])
-        hist_data[:, 5] = ((hist_data_base[:, 4] / total_price) * hist_data_base[:, 5]) + ((hist_data_base[:, 4] / total_price)  * hist_data_quoted[:, 5])
-        hist_data[:, 5] = hist_data[:, 5] * hist_data[:, 4]
-        return np.flipud(hist_data)
\ No newline at end of file
+    def get_product_candles(self, product, num_periods=200):
+        if product != self.product:
+            return super(MetaPeriod, self).get_product_candles(product, num_periods)
+        # Newest first like the historic rates API
+        base = np.array(super(MetaPeriod, self).get_product_candles(self.base, num_periods), dtype=float).reshape(-1, 6)[::-1]
+        quoted = np.array(super(MetaPeriod, self).get_product_candles(self.quoted, num_periods), dtype=float).reshape(-1, 6)[::-1]
+        if self.base_price is None and len(base) and len(quoted):
+            self.base_price = float(base[-1, 4])
+            self.quoted_price = float(quoted[-1, 4])
+        rows = synthetic_candles(base, quoted)[::-1].tolist()
+        for row in rows:
+            row[0] = int(row[0])
+        return rows
@@ -2,14 +2,27 @@ import logging
 import cbpro
 import datetime
 import time
-import dateutil
 import pytz
-import trade
 import numpy as np
 from .Candlestick import Candlestick
+import threading
+from .CandleBuffer import CandleBuffer
+from .CandleCache import CANDLE_DTYPE
+from logs import get_category
+
+# The current candle after every trade, and heartbeats, sampled by log_sample in config.yml
+candle_log = get_category('candle')
+heartbeat_log = get_category('heartbeat')
 
 class Period:
-    def __init__(self, period_size=60, name='Period', product='BTC-USD', initialize=True, cbpro_client=cbpro.PublicClient()):
+    # Historic rates requests from every period are spaced at least this far apart
+    request_interval = 1.0
+    request_lock = threading.Lock()
+    last_request = 0
+    # Set on periods rolled up from another period's candles
+    base_period = None
+
+    def __init__(self, period_size=60, name='Period', product='BTC-USD', initialize=True, cbpro_client=cbpro.PublicClient(), max_candles=1000, candle_cache=None):
         self.period_size = period_size
         self.name = name
         self.product = product
@@ -22,100 +35,139 @@ class Period:
         self.logger = logging.getLogger('trader-logger')
         self.error_logger = logging.getLogger('error-logger')
         self.cbpro_client = cbpro_client
+        self.candlesticks = CandleBuffer(capacity=max_candles)
+        self.candle_cache = candle_cache
+        # Coarser periods built from this period's candles
+        self.views = []
         if initialize:
             self.initialize()
-        else:
-            self.candlesticks = np.array([])
 
     def initialize(self):
-        self.candlesticks = self.get_historical_data()
-        self.cur_candlestick = Candlestick(existing_candlestick=self.candlesticks[-1])
-        self.candlesticks = self.candlesticks[:-1]
+        hist_data = self.get_historical_data()
+        self.candlesticks.clear()
+        self.candlesticks.extend(hist_data[:-1])
+        self.cur_candlestick = Candlestick(existing_candlestick=hist_data[-1])
         self.cur_candlestick_start = self.cur_candlestick.time
+        self.cur_candlestick_epoch = self.cur_candlestick_start.timestamp()
+        for view in self.views:
+            view.initialize()
 
     def get_historical_data(self, num_periods=200):
-        end = datetime.datetime.utcnow()
-        end_iso = end.isoformat()
-        start = end - datetime.timedelta(seconds=(self.period_size * num_periods))
-        start_iso = start.isoformat()
+        hist_data = np.array(self.get_product_candles(self.product, num_periods), dtype='object')
+        for row in hist_data:
+            row[0] = datetime.datetime.fromtimestamp(row[0], pytz.utc)
+        return np.flipud(hist_data)
 
+    def get_product_candles(self, product, num_periods=200):
+        # Candles of product ending now, newest first like the historic rates API
+        end = int(time.time())
+        start = end - self.period_size * num_periods
+        if self.candle_cache is not None:
+            candles = self.candle_cache.get_candles(product, self.period_size, start, end, self.fetch_candles)
+            return [list(row) for row in candles[::-1].tolist()]
+        return self.request_historic_rates(product, self.period_size, start, end)
+
+    def fetch_candles(self, product, granularity, start, end):
+        ret = self.request_historic_rates(product, granularity, start, end)
+        return np.array([tuple(row) for row in reversed(ret)], dtype=CANDLE_DTYPE)
+
+    def request_historic_rates(self, product, granularity, start, end):
+        start_iso = datetime.datetime.utcfromtimestamp(start).isoformat()
+        end_iso = datetime.datetime.utcfromtimestamp(end).isoformat()
         ret = None
 
         # Check if we got rate limited, which will return a JSON message
         while not isinstance(ret, list):
+            # Back off for longer after being rate limited or an error
+            self.wait_for_request_slot(self.request_interval if ret is None else 3)
             try:
-                time.sleep(3)
-                ret = self.cbpro_client.get_product_historic_rates(self.product, granularity=self.period_size, start=start_iso, end=end_iso)
+                ret = self.cbpro_client.get_product_historic_rates(product, granularity=granularity, start=start_iso, end=end_iso)
             except Exception:
+                ret = {}
                 self.error_logger.exception(datetime.datetime.now())
-        hist_data = np.array(ret, dtype='object')
-        for row in hist_data:
-            row[0] = datetime.datetime.fromtimestamp(row[0], pytz.utc)
-        return np.flipud(hist_data)
+        return ret
+
+    def wait_for_request_slot(self, interval):
+        with Period.request_lock:
+            wait = Period.last_request + interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            Period.last_request = time.time()
 
     def update_historical_data(self):
         updated_sticks = self.get_historical_data(num_periods=5)
+        recent_times = self.candlesticks.times[-10:].tolist()
         for new_stick in updated_sticks:
-            for idx, old_stick in enumerate(self.candlesticks[-10:]):
-                if new_stick[0] == old_stick[0]:
-                    self.candlesticks[-10 + idx] = new_stick
+            new_time = int(new_stick[0].timestamp())
+            if new_time in recent_times:
+                self.candlesticks.replace(recent_times.index(new_time) - len(recent_times), new_stick)
         self.updated_hist_data = True
+        if recent_times:
+            self.notify_views(since=recent_times[0])
 
-    def process_heartbeat(self, msg):
+    def process_heartbeat(self, heartbeat):
         if not self.updated_hist_data and self.time_of_first_candlestick_close \
            and datetime.datetime.now() - self.time_of_first_candlestick_close >= datetime.timedelta(minutes=10):
             self.update_historical_data()
 
-        isotime = dateutil.parser.parse(msg.get('time'))
-        if isotime:
-            if self.verbose_heartbeat:
-                self.logger.debug("[HEARTBEAT] " + str(isotime) + " " + str(msg.get('last_trade_id')))
-            if isotime - self.cur_candlestick_start > datetime.timedelta(seconds=self.period_size):
-                self.close_candlestick()
-                self.new_candlestick(self.cur_candlestick.time + datetime.timedelta(seconds=self.period_size))
-
-    def process_trade(self, msg):
-        if msg.get('product_id') == self.product:
-            cur_trade = trade.Trade(msg)
-            isotime = dateutil.parser.parse(msg.get('time')).replace(microsecond=0)
-            if isotime < self.cur_candlestick.time:
-                prev_stick = Candlestick(existing_candlestick=self.candlesticks[-1])
-                self.candlesticks = self.candlesticks[:-1]
+        if self.verbose_heartbeat and heartbeat_log.enabled():
+            self.logger.debug("[HEARTBEAT] %s %s", heartbeat.raw.get('time'), heartbeat.last_trade_id)
+        if heartbeat.timestamp - self.cur_candlestick_epoch > self.period_size:
+            self.close_candlestick()
+            self.new_candlestick(self.cur_candlestick.time + datetime.timedelta(seconds=self.period_size))
+
+    def process_trade(self, cur_trade):
+        if cur_trade.product_id == self.product:
+            if cur_trade.epoch < self.cur_candlestick_epoch:
+                prev_stick = Candlestick(existing_candlestick=self.candlesticks.pop())
                 prev_stick.add_trade(cur_trade)
                 self.add_stick(prev_stick)
             else:
-                if isotime > self.cur_candlestick.time + datetime.timedelta(seconds=self.period_size):
+                if cur_trade.epoch > self.cur_candlestick_epoch + self.period_size:
                     self.close_candlestick()
                     self.new_candlestick(self.cur_candlestick.time + datetime.timedelta(seconds=self.period_size))
                 self.cur_candlestick.add_trade(cur_trade)
-                self.cur_candlestick.print_stick(self.name)
+                if candle_log.enabled():
+                    self.cur_candlestick.print_stick(self.name)
+
+    def get_product_ids(self):
+        # Products whose trades and heartbeats this period consumes
+        return [self.product]
 
     def get_highs(self):
-        return np.array(self.candlesticks[:, 2], dtype='f8')
+        return self.candlesticks.highs
 
     def get_lows(self):
-        return np.array(self.candlesticks[:, 1], dtype='f8')
+        return self.candlesticks.lows
 
     def get_closing_prices(self):
-        return np.array(self.candlesticks[:, 4], dtype='f8')
+        return self.candlesticks.closes
 
     def get_volumes(self):
-        return np.array(self.candlesticks[:, 5], dtype='f8')
+        return self.candlesticks.volumes
 
     def new_candlestick(self, isotime):
         prev_close = self.cur_candlestick.close
         self.cur_candlestick = Candlestick(isotime=isotime, prev_close=prev_close)
         self.cur_candlestick_start = isotime.replace(second=0, microsecond=0)
+        self.cur_candlestick_epoch = self.cur_candlestick_start.timestamp()
+        self.notify_views()
 
     def add_stick(self, stick_to_add):
-        self.candlesticks = np.row_stack((self.candlesticks, stick_to_add.close_candlestick(self.name)))
+        self.candlesticks.append(stick_to_add.close_candlestick(self.name))
+        self.notify_views(since=stick_to_add.time.timestamp())
+
+    def notify_views(self, since=None):
+        for view in self.views:
+            if since is not None:
+                view.reaggregate(since)
+            view.refresh()
 
     def close_candlestick(self):
         if not self.updated_hist_data:
             self.time_of_first_candlestick_close = datetime.datetime.now()
         if len(self.candlesticks) > 0:
-            self.candlesticks = np.row_stack((self.candlesticks,
-                                              self.cur_candlestick.close_candlestick(period_name=self.name,
-                                                                                     prev_stick=self.candlesticks[-1])))
+            self.candlesticks.append(self.cur_candlestick.close_candlestick(period_name=self.name,
+                                                                            prev_stick=self.candlesticks[-1]))
         else:
-            self.candlesticks = np.array([self.cur_candlestick.close_candlestick(self.name)])
\ No newline at end of file
+            self.candlesticks.append(self.cur_candlestick.close_candlestick(self.name))
\ No newline at end of file
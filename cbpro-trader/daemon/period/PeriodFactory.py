@@ -0,0 +1,40 @@
+import cbpro
+from .Period import Period
+from .MetaPeriod import MetaPeriod
+from .AggregatedPeriod import AggregatedPeriod
+
+
+def create_periods(period_configs, fiat='USD', cbpro_client=cbpro.PublicClient(), max_candles=1000, candle_cache=None, aggregate=False):
+    # Builds the periods listed in config.yml, in the same order. With
+    # aggregate, the finest period of each product is built from trades and
+    # the coarser periods whose length it divides are rolled up from it.
+    base_configs = {}
+    if aggregate:
+        for period_config in period_configs:
+            if period_config.get('meta'):
+                continue
+            base_config = base_configs.get(period_config['product'])
+            if base_config is None or period_config['length'] < base_config['length']:
+                base_configs[period_config['product']] = period_config
+
+    periods = {}
+    # Base periods first, their views read from them while initializing
+    for period_config in sorted(period_configs, key=lambda period_config: period_config['length']):
+        period_size = 60 * period_config['length']
+        base_config = base_configs.get(period_config['product'])
+        if period_config.get('meta'):
+            new_period = MetaPeriod(period_size=period_size, fiat=fiat, product=period_config['product'],
+                                    name=period_config['name'], cbpro_client=cbpro_client,
+                                    max_candles=max_candles, candle_cache=candle_cache)
+        elif base_config is not None and base_config is not period_config \
+                and period_config['length'] % base_config['length'] == 0 \
+                and period_config['length'] // base_config['length'] <= max_candles:
+            new_period = AggregatedPeriod(periods[id(base_config)], period_size=period_size,
+                                          name=period_config['name'], cbpro_client=cbpro_client,
+                                          max_candles=max_candles, candle_cache=candle_cache)
+        else:
+            new_period = Period(period_size=period_size, product=period_config['product'],
+                                name=period_config['name'], cbpro_client=cbpro_client,
+                                max_candles=max_candles, candle_cache=candle_cache)
+        periods[id(period_config)] = new_period
+    return [periods[id(period_config)] for period_config in period_configs]
@@ -1,3 +1,8 @@
 from .Candlestick import Candlestick
+from .CandleBuffer import CandleBuffer
+from .CandleCache import CandleCache, CANDLE_DTYPE, aggregate_candles
 from .Period import Period
-from .MetaPeriod import MetaPeriod
\ No newline at end of file
+from .MetaPeriod import MetaPeriod, get_meta_legs, synthetic_candles
+from .CandleView import CandleView
+from .AggregatedPeriod import AggregatedPeriod
+from .PeriodFactory import create_periods
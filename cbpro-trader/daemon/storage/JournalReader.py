@@ -0,0 +1,74 @@
+import os
+import numpy as np
+from .TradeJournal import CANDLE_DTYPE, DECISION_DTYPE, segment_index, map_segment
+
+
+class JournalReader(object):
+    # Reads a TradeJournal directory back as NumPy record arrays. Segments
+    # are memory-mapped, so a single segment is returned without copying and
+    # several days are one concatenation, with no parsing either way.
+    def __init__(self, directory):
+        self.directory = directory
+
+    def products(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(entry for entry in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, entry)))
+
+    def days(self, product, start_day=None, end_day=None):
+        # UTC days as YYYY-MM-DD, inclusive bounds in the same format
+        product_dir = os.path.join(self.directory, product)
+        if not os.path.isdir(product_dir):
+            return []
+        return [day for day in sorted(os.listdir(product_dir))
+                if (start_day is None or day >= start_day) and (end_day is None or day <= end_day)]
+
+    def names(self, product, kind):
+        # Period names journaled for a product, e.g. names('BTC-USD', 'candles')
+        names = set()
+        for day in self.days(product):
+            for segment in os.listdir(os.path.join(self.directory, product, day)):
+                if segment.startswith(kind + '-') and segment.endswith('.bin'):
+                    name = segment[len(kind) + 1:-len('.bin')].rsplit('-', 1)[0]
+                    if segment_index(segment, kind, name) is not None:
+                        names.add(name)
+        return sorted(names)
+
+    def segments(self, product, kind, name, start_day=None, end_day=None):
+        # Memory-mapped segments in time order
+        segments = []
+        for day in self.days(product, start_day, end_day):
+            day_dir = os.path.join(self.directory, product, day)
+            indexed = [(segment_index(segment, kind, name), segment) for segment in os.listdir(day_dir)]
+            for index, segment in sorted(entry for entry in indexed if entry[0] is not None):
+                records = map_segment(os.path.join(day_dir, segment))
+                if len(records):
+                    segments.append(records)
+        return segments
+
+    def read(self, product, kind, name, start_day=None, end_day=None):
+        # kind is 'candles', 'indicators' or 'decisions'. Indicator segments
+        # with different columns are merged, missing values are NaN
+        segments = self.segments(product, kind, name, start_day, end_day)
+        if len(segments) == 1:
+            return segments[0]
+        if not segments:
+            return np.empty(0, dtype={'candles': CANDLE_DTYPE, 'decisions': DECISION_DTYPE}.get(kind, [('time', '<f8')]))
+        dtypes = set(segment.dtype for segment in segments)
+        if len(dtypes) == 1:
+            return np.concatenate(segments)
+        fields = ['time'] + sorted(set(field for dtype in dtypes for field in dtype.names) - {'time'})
+        merged = np.full(sum(len(segment) for segment in segments), np.nan,
+                         dtype=[(field, '<f8') for field in fields])
+        offset = 0
+        for segment in segments:
+            for field in segment.dtype.names:
+                merged[field][offset:offset + len(segment)] = segment[field]
+            offset += len(segment)
+        return merged
+
+    def read_candles(self, product, name, start_day=None, end_day=None):
+        # Columns keyed like backtest.load_candles_csv returns them
+        candles = self.read(product, 'candles', name, start_day, end_day)
+        return {field: candles[field] for field in candles.dtype.names}
@@ -4,10 +4,15 @@ from time import gmtime, strftime
 from pytz import timezone
 import pytz
 import logging
+from collections import OrderedDict
+from .MongoWriter import MongoWriter
 
 
 class MongoConnection(object):
-    def __init__(self, mongo_url):
+    # Most recent fill trade ids remembered to skip requeueing them
+    max_logged_trade_ids = 1000
+
+    def __init__(self, mongo_url, batch_size=100, flush_interval=1.0, max_queue=10000):
         self.connection = MongoClient(mongo_url)
         self.db = self.connection.trading_bot
         self.logger = logging.getLogger('trader-logger')
@@ -15,10 +20,16 @@ class MongoConnection(object):
 
         self.last_indicator_entry = self.get_last_indicator_entry
         self.last_fills_entry = {}
+        self.logged_trade_ids = OrderedDict()
+        self.writer = MongoWriter(self.db, self.format_time, batch_size=batch_size,
+                                  flush_interval=flush_interval, max_queue=max_queue,
+                                  unique_keys={'fills_log': 'trade_id'})
 
     def get_time(self):
+        return self.format_time(datetime.now(tz=pytz.utc))
+
+    def format_time(self, date):
         date_format = '%m/%d/%Y %H:%M:%S %Z'
-        date = datetime.now(tz=pytz.utc)
         date = date.astimezone(timezone('US/Pacific'))
         return date.strftime(date_format)
 
@@ -33,7 +44,7 @@ class MongoConnection(object):
         except AttributeError:
             self.error_logger.info(msg="No collections found, collection will need to be created.")
 
-        self.logger.debug(f'retrieved {data}')
+        self.logger.debug('retrieved %s', data)
 
         return data
 
@@ -56,25 +67,29 @@ class MongoConnection(object):
             # self.logger.debug(data)
             # self.logger.debug(self.last_indicator_entry)
             self.last_indicator_entry = data.copy()
-            data['time'] = self.get_time()
-            self.db.indicator_log.insert(data, manipulate=False)
+            self.writer.insert('indicator_log', data)
 
     def fills_log(self, fills):
         # self.logger.debug(fills)
         # self.logger.debug("trying to log fills")
-        data = {}
         for fill in fills:
-            if self.db.fills_log.find({'tradeId': str(fill['trade_id'])}).count() < 1:
-                fill['log_time'] = self.get_time()
-                self.db.fills_log.insert(fill, maniplulate=False)
+            # Upserts on the unique trade_id index make repeats harmless, this
+            # just avoids queueing fills already written by this process
+            if fill['trade_id'] in self.logged_trade_ids:
+                self.logged_trade_ids.move_to_end(fill['trade_id'])
+                continue
+            self.logged_trade_ids[fill['trade_id']] = True
+            if len(self.logged_trade_ids) > self.max_logged_trade_ids:
+                self.logged_trade_ids.popitem(last=False)
+            self.writer.upsert('fills_log', 'trade_id', dict(fill))
             # self.logger.debug(fill)
 
     def placing_buy(self):
-        data = self.last_indicator_entry.copy()
-        data['time'] = self.get_time()
-        self.db.placing_buy.insert(data, manipulate=False)
+        self.writer.insert('placing_buy', self.last_indicator_entry.copy())
 
     def placing_sell(self):
-        data = self.last_indicator_entry.copy()
-        data['time'] = self.get_time()
-        self.db.placing_sell.insert(data, manipulate=False)
+        self.writer.insert('placing_sell', self.last_indicator_entry.copy())
+
+    def close(self):
+        # Flush anything still queued before exiting
+        self.writer.close()
@@ -0,0 +1,88 @@
+import time
+import queue
+import logging
+import datetime
+import threading
+from pymongo import InsertOne, UpdateOne
+
+
+class MongoWriter(object):
+    # Background writer so database latency never blocks the trading loop.
+    # Documents are queued without blocking, then written in batches once
+    # batch_size documents are pending or flush_interval seconds have passed.
+    def __init__(self, db, format_time, batch_size=100, flush_interval=1.0, max_queue=10000, unique_keys=None):
+        self.logger = logging.getLogger('trader-logger')
+        self.error_logger = logging.getLogger('error-logger')
+        self.db = db
+        self.format_time = format_time
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.unique_keys = unique_keys or {}
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.run, name='mongo_writer', daemon=True)
+        self.thread.start()
+
+    def insert(self, collection, document, time_field='time'):
+        self.put((collection, InsertOne, document, time_field, datetime.datetime.now(datetime.timezone.utc)))
+
+    def upsert(self, collection, key, document, time_field='log_time'):
+        # Idempotent insert on a unique key, existing documents are left untouched
+        self.put((collection, key, document, time_field, datetime.datetime.now(datetime.timezone.utc)))
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Drop rather than block the caller, the counter shows the backpressure
+            self.dropped += 1
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        # Created here so an unreachable database doesn't hold up startup
+        for collection, key in self.unique_keys.items():
+            try:
+                self.db[collection].create_index(key, unique=True)
+            except Exception:
+                self.error_logger.exception(datetime.datetime.now())
+        pending = []
+        deadline = time.time() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                item = False
+            if item:
+                pending.append(item)
+            if item is None or len(pending) >= self.batch_size or time.time() >= deadline:
+                if pending:
+                    self.flush(pending)
+                    pending = []
+                deadline = time.time() + self.flush_interval
+            if item is None:
+                break
+
+    def flush(self, pending):
+        requests = {}
+        for collection, key, document, time_field, logged_at in pending:
+            document[time_field] = self.format_time(logged_at)
+            if key is InsertOne:
+                request = InsertOne(document)
+            else:
+                request = UpdateOne({key: document[key]}, {'$setOnInsert': document}, upsert=True)
+            requests.setdefault(collection, []).append(request)
+        for collection, collection_requests in requests.items():
+            try:
+                self.db[collection].bulk_write(collection_requests, ordered=False)
+                self.written += len(collection_requests)
+            except Exception:
+                self.failed += len(collection_requests)
+                self.error_logger.exception(datetime.datetime.now())
+
+    def get_stats(self):
+        return {'pending': self.queue.qsize(), 'written': self.written, 'dropped': self.dropped, 'failed': self.failed}
@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import time
+import queue
+import logging
+import datetime
+import threading
+import numpy as np
+
+# Closed candles, as in period.CandleCache
+CANDLE_DTYPE = np.dtype([('time', '<i8'), ('low', '<f8'), ('high', '<f8'),
+                         ('open', '<f8'), ('close', '<f8'), ('volume', '<f8')])
+# One record per trade decision. action is what was done about it
+DECISION_DTYPE = np.dtype([('time', '<f8'), ('price', '<f8'), ('buy_flag', '?'), ('sell_flag', '?'),
+                           ('sell_point', '<f8'), ('action', 'u1')])
+ACTION_NONE, ACTION_BUY, ACTION_SELL = 0, 1, 2
+
+
+def day_of(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def segment_index(filename, kind, name):
+    # n of a <kind>-<name>-<n>.bin segment file, None for other files
+    match = re.match(r'%s-%s-(\d+)\.bin$' % (re.escape(kind), re.escape(name)), filename)
+    return int(match.group(1)) if match else None
+
+
+def map_segment(path, dtype=None):
+    # Read-only view of a segment's records, ignoring a partly written last record
+    if dtype is None:
+        dtype = read_header(path + '.json')
+    count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def write_header(path, dtype):
+    with open(path, 'w') as header_file:
+        json.dump({'dtype': dtype.descr}, header_file)
+
+
+def read_header(path):
+    with open(path) as header_file:
+        return np.dtype([tuple(field) for field in json.load(header_file)['dtype']])
+
+
+class TradeJournal(object):
+    # Append-only journal of closed candles, indicator snapshots and trade
+    # decisions, as fixed-width little endian records partitioned by product
+    # and UTC day:
+    #   <directory>/<product>/<YYYY-MM-DD>/<kind>-<name>-<n>.bin
+    # with the record dtype in a .json header next to each segment. A new
+    # segment starts when the columns change, e.g. an indicator is added.
+    # Records are queued without blocking and appended by a background
+    # thread, see storage.JournalReader for reading them back.
+    def __init__(self, directory, flush_interval=1.0, max_queue=10000, clock=time.time):
+        self.logger = logging.getLogger('trader-logger')
+        self.error_logger = logging.getLogger('error-logger')
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.queue = queue.Queue(maxsize=max_queue)
+        # (product, kind, name) -> time of the last candle journaled
+        self.last_candle_times = {}
+        # period name -> (revision, appended) of its candles when last journaled
+        self.candle_state = {}
+        # period name -> last indicator values journaled, unchanged snapshots are skipped
+        self.last_indicators = {}
+        # (product, day, kind, name) -> (path, dtype) of the open segment
+        self.segments = {}
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.run, name='trade_journal', daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_candles(self, cur_period):
+        # Closed candles not journaled yet. Cheap when nothing was appended
+        candlesticks = cur_period.candlesticks
+        state = (candlesticks.revision, candlesticks.appended)
+        if self.candle_state.get(cur_period.name) == state or len(candlesticks) == 0:
+            return
+        self.candle_state[cur_period.name] = state
+        candles = np.empty(len(candlesticks), dtype=CANDLE_DTYPE)
+        for field, column in zip(CANDLE_DTYPE.names, candlesticks.snapshot()):
+            candles[field] = column
+        self.put(('candles', cur_period.product, cur_period.name, candles))
+
+    def record_indicators(self, product, period_name, indicators):
+        # Numeric indicators only, 'bep' is evaluated at the close like indicator_log
+        values = {}
+        for indicator, value in indicators.items():
+            if indicator == 'bep' and 'close' in indicators:
+                value = value(indicators['close'])
+            try:
+                values[indicator] = float(value)
+            except (TypeError, ValueError):
+                continue
+        if not values or values == self.last_indicators.get(period_name):
+            return
+        self.last_indicators[period_name] = values
+        self.put(('indicators', product, period_name, (self.clock(), values)))
+
+    def record_decision(self, product, period_name, price, buy_flag, sell_flag, sell_point=0, action=ACTION_NONE):
+        self.put(('decisions', product, period_name,
+                  (self.clock(), float(price), bool(buy_flag), bool(sell_flag), float(sell_point), action)))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        pending = []
+        deadline = time.time() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                item = False
+            if item:
+                pending.append(item)
+            if item is None or time.time() >= deadline:
+                if pending:
+                    self.flush(pending)
+                    pending = []
+                deadline = time.time() + self.flush_interval
+            if item is None:
+                break
+
+    def flush(self, pending):
+        batches = {}
+        for kind, product, name, data in pending:
+            try:
+                for day, dtype, records in self.to_records(kind, product, name, data):
+                    batches.setdefault((product, day, kind, name, dtype), []).append(records)
+            except Exception:
+                self.failed += 1
+                self.error_logger.exception(datetime.datetime.now())
+        for (product, day, kind, name, dtype), record_list in batches.items():
+            records = np.concatenate(record_list)
+            try:
+                with open(self.get_segment(product, day, kind, name, dtype), 'ab') as segment_file:
+                    records.tofile(segment_file)
+                self.written += len(records)
+            except Exception:
+                self.failed += len(records)
+                self.error_logger.exception(datetime.datetime.now())
+
+    def to_records(self, kind, product, name, data):
+        # Yields (day, dtype, records) for a queued item
+        if kind == 'candles':
+            # History overlaps what was journaled before, including by earlier runs
+            key = (product, kind, name)
+            if key not in self.last_candle_times:
+                self.last_candle_times[key] = self.find_last_time(product, kind, name)
+            candles = data[data['time'] > self.last_candle_times[key]]
+            if len(candles) == 0:
+                return
+            self.last_candle_times[key] = int(candles['time'][-1])
+            days = np.array([day_of(epoch) for epoch in candles['time'].tolist()])
+            for day in np.unique(days):
+                yield day, CANDLE_DTYPE, candles[days == day]
+        elif kind == 'indicators':
+            epoch, values = data
+            dtype = np.dtype([('time', '<f8')] + [(indicator, '<f8') for indicator in sorted(values)])
+            record = np.empty(1, dtype=dtype)
+            record['time'] = epoch
+            for indicator, value in values.items():
+                record[indicator] = value
+            yield day_of(epoch), dtype, record
+        else:
+            yield day_of(data[0]), DECISION_DTYPE, np.array([data], dtype=DECISION_DTYPE)
+
+    def get_segment(self, product, day, kind, name, dtype):
+        key = (product, day, kind, name)
+        segment = self.segments.get(key)
+        if segment is not None and segment[1] == dtype:
+            return segment[0]
+        day_dir = os.path.join(self.directory, product, day)
+        os.makedirs(day_dir, exist_ok=True)
+        index = 0
+        while True:
+            path = os.path.join(day_dir, '%s-%s-%d.bin' % (kind, name, index))
+            if not os.path.exists(path + '.json'):
+                write_header(path + '.json', dtype)
+                break
+            # Continues a segment of an earlier run with the same columns,
+            # dropping a record it was killed in the middle of writing
+            if read_header(path + '.json') == dtype:
+                if os.path.exists(path) and os.path.getsize(path) % dtype.itemsize:
+                    os.truncate(path, os.path.getsize(path) // dtype.itemsize * dtype.itemsize)
+                break
+            index += 1
+        self.segments[key] = (path, dtype)
+        return path
+
+    def find_last_time(self, product, kind, name):
+        product_dir = os.path.join(self.directory, product)
+        if not os.path.isdir(product_dir):
+            return 0
+        for day in sorted(os.listdir(product_dir), reverse=True):
+            day_dir = os.path.join(product_dir, day)
+            last_time = 0
+            for segment in os.listdir(day_dir):
+                if segment_index(segment, kind, name) is not None:
+                    records = map_segment(os.path.join(day_dir, segment))
+                    if len(records):
+                        last_time = max(last_time, int(records['time'].max()))
+            if last_time:
+                return last_time
+        return 0
+
+    def get_stats(self):
+        return {'pending': self.queue.qsize(), 'written': self.written, 'dropped': self.dropped, 'failed': self.failed}
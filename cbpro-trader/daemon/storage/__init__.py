@@ -1 +1,4 @@
-from .MongoConnection import MongoConnection
\ No newline at end of file
+from .MongoConnection import MongoConnection
+from .MongoWriter import MongoWriter
+from .TradeJournal import TradeJournal, ACTION_NONE, ACTION_BUY, ACTION_SELL
+from .JournalReader import JournalReader
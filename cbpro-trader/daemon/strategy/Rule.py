@@ -0,0 +1,93 @@
+import ast
+import sys
+import numpy as np
+
+# Functions rules may call, evaluated element-wise
+FUNCTIONS = {'ceil': 'ceil', 'floor': 'floor', 'abs': 'abs', 'min': 'minimum', 'max': 'maximum'}
+COMPARISONS = {ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=', ast.Eq: '==', ast.NotEq: '!='}
+ARITHMETIC = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/'}
+# Number literals are ast.Num and True/False ast.NameConstant before Python 3.8
+CONSTANTS = (ast.Constant,) if sys.version_info >= (3, 8) else (ast.Num, ast.NameConstant)
+
+
+class RuleTranslator(ast.NodeVisitor):
+    # Rewrites a rule expression as the source of NumPy operations on a dict
+    # of values, so one compiled rule evaluates single values and whole
+    # arrays alike: names become v['name'], and/or/not become &, |,
+    # logical_not and comparison chains are split into pairs. Anything
+    # else is rejected.
+    def __init__(self):
+        self.names = set()
+
+    def truth(self, node):
+        # Operands of and/or/not, NaN counts as true like in Python
+        return 'np.not_equal(%s, 0)' % self.visit(node)
+
+    def visit_Expression(self, node):
+        return self.visit(node.body)
+
+    def visit_BoolOp(self, node):
+        operator = ' & ' if isinstance(node.op, ast.And) else ' | '
+        return '(%s)' % operator.join(self.truth(value) for value in node.values)
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return 'np.logical_not(%s)' % self.truth(node.operand)
+        if isinstance(node.op, ast.USub):
+            return '(-%s)' % self.visit(node.operand)
+        raise ValueError("Operator not allowed in rules: %s" % type(node.op).__name__)
+
+    def visit_Compare(self, node):
+        pairs = []
+        left = self.visit(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            if type(op) not in COMPARISONS:
+                raise ValueError("Comparison not allowed in rules: %s" % type(op).__name__)
+            right = self.visit(comparator)
+            pairs.append('(%s %s %s)' % (left, COMPARISONS[type(op)], right))
+            left = right
+        return '(%s)' % ' & '.join(pairs)
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in ARITHMETIC:
+            raise ValueError("Operator not allowed in rules: %s" % type(node.op).__name__)
+        return '(%s %s %s)' % (self.visit(node.left), ARITHMETIC[type(node.op)], self.visit(node.right))
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ValueError("Function not allowed in rules: %s" % ast.dump(node.func))
+        return 'np.%s(%s)' % (FUNCTIONS[node.func.id], ', '.join(self.visit(arg) for arg in node.args))
+
+    def visit_Name(self, node):
+        self.names.add(node.id)
+        return 'v[%r]' % node.id
+
+    def generic_visit(self, node):
+        if isinstance(node, CONSTANTS):
+            value = getattr(node, 'value', getattr(node, 'n', None))
+            if isinstance(value, (bool, int, float)):
+                return repr(value)
+            raise ValueError("Constant not allowed in rules: %r" % value)
+        raise ValueError("Expression not allowed in rules: %s" % type(node).__name__)
+
+
+class Rule:
+    # A boolean expression over indicator names, e.g.
+    #   close >= bband_lower_1 and ceil(bep) < ceil(bband_upper_1)
+    # compiled once into a NumPy function. evaluate() takes a dict of values
+    # (floats or equal length arrays, mixed freely) and returns a boolean
+    # array with the broadcast shape.
+    def __init__(self, expression):
+        self.expression = expression
+        try:
+            tree = ast.parse(str(expression), mode='eval')
+        except SyntaxError as e:
+            raise ValueError("Invalid rule %r: %s" % (expression, e.msg))
+        translator = RuleTranslator()
+        self.source = translator.visit(tree)
+        self.names = translator.names
+        self.function = eval(compile('lambda v: %s' % self.source, '<rule>', 'eval'), {'np': np, '__builtins__': {}})
+
+    def evaluate(self, values):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.asarray(self.function(values), dtype=bool)
@@ -0,0 +1,54 @@
+import numpy as np
+from .Rule import Rule
+
+# The rules determine_trades used to hardcode. bep is the break even price
+# of buying at the close, sell_point that of the coins last bought and
+# last_buy_price the price of the last fill
+DEFAULT_RULES = {
+    'buy': 'close >= bband_lower_1 and ceil(bep) < ceil(bband_upper_1)',
+    'sell': '(close < bband_lower_1 and close < last_buy_price) or close > sell_point',
+}
+
+
+class Strategy:
+    # Buy and sell rules from the strategy section of config.yml. Every
+    # trade period of a product has to agree to buy, any one of them can
+    # sell, and buying wins over selling.
+    def __init__(self, buy=DEFAULT_RULES['buy'], sell=DEFAULT_RULES['sell']):
+        self.buy = Rule(buy)
+        self.sell = Rule(sell)
+        self.names = sorted(self.buy.names | self.sell.names)
+
+    @classmethod
+    def from_config(cls, config):
+        rules = dict(DEFAULT_RULES, **(config or {}))
+        return cls(rules['buy'], rules['sell'])
+
+    def get_values(self, rows):
+        # Columns of the names the rules use from one dict per period, NaN
+        # where a period has no value. Comparisons with NaN are false
+        values = np.full((len(self.names), len(rows)), np.nan)
+        for col, row in enumerate(rows):
+            for idx, name in enumerate(self.names):
+                value = row.get(name)
+                if value is not None:
+                    try:
+                        values[idx, col] = value
+                    except (TypeError, ValueError):
+                        pass
+        return dict(zip(self.names, values))
+
+    def evaluate(self, values):
+        # Per-element (buy, sell) for values of one period over time
+        buy = self.buy.evaluate(values)
+        sell = self.sell.evaluate(values) & ~buy
+        return buy, sell
+
+    def decide(self, rows):
+        # (buy, sell) for a product from the values of each of its trade periods
+        if not rows:
+            return False, False
+        values = self.get_values(rows)
+        buy = bool(self.buy.evaluate(values).all())
+        sell = bool(self.sell.evaluate(values).any()) and not buy
+        return buy, sell
@@ -0,0 +1,2 @@
+from .Rule import Rule
+from .Strategy import Strategy, DEFAULT_RULES
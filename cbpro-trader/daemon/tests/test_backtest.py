@@ -0,0 +1,136 @@
+#
+# test_backtest.py
+#
+# Pytest tests on the backtest module
+
+import math
+import pytest
+import backtest
+import indicators
+import numpy as np
+import talib
+import period
+import storage
+import strategy
+
+
+def make_candles(closes):
+    closes = np.asarray(closes, dtype='f8')
+    return {
+        'time': np.arange(len(closes)) * 60.0,
+        'low': closes - 1,
+        'high': closes + 1,
+        'open': closes,
+        'close': closes,
+        'volume': np.ones(len(closes)),
+    }
+
+
+class TestLoaders(object):
+    def test_load_candles_csv_headerless(self, tmp_path):
+        path = tmp_path / 'candles.csv'
+        path.write_text("120,1,3,2,2.5,10\n60,0.5,2,1,1.5,5\n")
+        candles = backtest.load_candles_csv(str(path))
+        assert list(candles['time']) == [60, 120]
+        assert list(candles['close']) == [1.5, 2.5]
+
+    def test_load_candles_csv_header(self, tmp_path):
+        path = tmp_path / 'candles.csv'
+        path.write_text("time,open,high,low,close,volume\n60,1,2,0.5,1.5,5\n")
+        candles = backtest.load_candles_csv(str(path))
+        assert list(candles['low']) == [0.5]
+        assert list(candles['open']) == [1]
+
+    def test_load_indicator_log_csv(self, tmp_path):
+        path = tmp_path / 'log.csv'
+        path.write_text("time,close\n"
+                        "04/30/2021 20:00:01 PDT,10\n"
+                        "04/30/2021 20:00:30 PDT,12\n"
+                        "04/30/2021 20:01:05 PDT,11\n")
+        candles = backtest.load_indicator_log_csv(str(path), period_size=60)
+        assert len(candles['time']) == 2
+        assert list(candles['high']) == [12, 11]
+        assert list(candles['close']) == [12, 11]
+
+    def test_load_period(self):
+        backtest_period = backtest.load_period(make_candles(np.arange(1, 6)))
+        assert len(backtest_period.candlesticks) == 5
+        assert list(backtest_period.get_closing_prices()) == [1, 2, 3, 4, 5]
+        assert backtest_period.candlesticks[-1][0].timestamp() == 240
+
+
+class TestBacktester(object):
+    def setup_class(self):
+        steps = np.arange(2000)
+        self.closes = 1000 + 100 * np.sin(steps / 15.0)
+        self.backtest_period = backtest.load_period(make_candles(self.closes))
+
+    def test_indicators_match_talib(self):
+        indicators = backtest.Backtester(self.backtest_period).calculate_indicators()
+        upper, middle, lower = talib.BBANDS(self.closes, timeperiod=20, nbdevup=1, nbdevdn=1, matype=0)
+        assert np.allclose(indicators['bband_upper_1'], upper, equal_nan=True)
+
+    def test_sell_point_matches_calculate_sell_point(self):
+        indicator_subsys = indicators.IndicatorSubsystem([], None)
+        fills = [{'side': 'buy', 'usd_volume': '1000.0', 'size': '0.5', 'fee': '5.0'}]
+        expected = indicator_subsys.current_indicators['sell_point'](fills)
+        assert np.isclose(backtest.Backtester(self.backtest_period).sell_point(2000.0), expected)
+
+    def test_run_matches_stepwise_rules(self):
+        backtester = backtest.Backtester(self.backtest_period)
+        report = backtester.run()
+        assert report['trades'] > 0
+        assert report['candles'] == 2000
+
+        # Step through every candle with the rules determine_trades used to hardcode
+        upper, middle, lower = talib.BBANDS(self.closes, timeperiod=20, nbdevup=1, nbdevdn=1, matype=0)
+        entries = []
+        entry_price = None
+        for idx, close in enumerate(self.closes):
+            buy = close >= lower[idx] and math.ceil(close / 0.995 ** 2) < math.ceil(upper[idx]) if idx >= 19 else False
+            if entry_price is None:
+                if buy:
+                    entry_price = close
+                    entries.append(idx * 60)
+            elif not buy and ((close < lower[idx] and close < entry_price) or
+                              close > backtester.sell_point(entry_price)):
+                entry_price = None
+        assert [trade['entry_time'] for trade in report['trade_log']] == entries
+
+    def test_strategy_rules(self):
+        # Buys above a rising SMA, sells on any rise
+        rules = strategy.Strategy('close > sma and sma_trend > 0', 'close > last_buy_price')
+        backtester = backtest.Backtester(self.backtest_period, strategy=rules)
+        indicators = backtester.calculate_indicators()
+        buy = backtester.calculate_signals(indicators)
+        with np.errstate(invalid='ignore'):
+            assert np.array_equal(buy, (indicators['close'] > indicators['sma']) & (indicators['sma_trend'] > 0))
+        for trade in backtester.run()['trade_log']:
+            if trade['exit_price'] is not None:
+                assert trade['exit_price'] > trade['entry_price']
+
+    def test_unknown_indicator(self):
+        backtester = backtest.Backtester(self.backtest_period, strategy=strategy.Strategy('adx > 20', 'close < 0'))
+        with pytest.raises(ValueError):
+            backtester.run()
+
+    def test_flat_market_never_trades(self):
+        report = backtest.Backtester(backtest.load_period(make_candles(np.full(100, 50.0)))).run()
+        assert report['trades'] == 0
+        assert report['final_balance'] == 1000.0
+        assert report['max_drawdown_pct'] == 0
+
+
+class TestJournalLoader(object):
+    def test_load_journal_candles(self, tmp_path):
+        journal_period = period.Period(period_size=60, name='BTC60', product='BTC-USD', initialize=False)
+        journal_period.candlesticks.load(np.array([60, 120]), np.array([1.0, 2.0]), np.array([3.0, 4.0]),
+                                         np.array([2.0, 3.0]), np.array([2.5, 3.5]), np.array([5.0, 6.0]))
+        journal = storage.TradeJournal(str(tmp_path))
+        journal.record_candles(journal_period)
+        journal.close()
+
+        candles = backtest.load_journal_candles(str(tmp_path), 'BTC-USD', 'BTC60')
+        assert candles['time'].tolist() == [60, 120]
+        assert candles['close'].tolist() == [2.5, 3.5]
+        assert len(backtest.load_period(candles).candlesticks) == 2
@@ -0,0 +1,875 @@
+#
+# test_engine.py
+#
+# Pytest tests on the engine module
+
+import os
+import engine
+import period
+import strategy
+import indicators
+import trade
+import json
+import time
+import cbpro
+import queue
+import http.server
+import gzip
+import random
+import importlib.util
+import asyncio
+from aiohttp import web as aiohttp_web
+from decimal import Decimal
+import datetime
+import threading
+import pytest
+from engine.ShardPool import partition_products, run_shard
+
+
+class TestShardPool(object):
+    def setup_class(self):
+        self.period_configs = [{'name': 'BTC', 'product': 'BTC-USD', 'length': 1},
+                               {'name': 'ETH', 'product': 'ETH-USD', 'length': 1},
+                               {'name': 'LTC', 'product': 'LTC-USD', 'length': 1},
+                               {'name': 'LTCETH', 'product': 'LTC-ETH', 'length': 1, 'meta': True},
+                               {'name': 'BTC5', 'product': 'BTC-USD', 'length': 5}]
+        start_time = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+        self.start_time = start_time - datetime.timedelta(minutes=3)
+        self.fake_hist_data = [[(self.start_time + datetime.timedelta(minutes=i)).timestamp(),
+                                100.0 + i, 110.0 + i, 105.0 + i, 106.0 + i, 5.0] for i in range(3)][::-1]
+
+    def test_partition_keeps_meta_legs_together(self):
+        shards = partition_products(self.period_configs, 3)
+
+        assert sorted(product for shard in shards for product in shard) == ['BTC-USD', 'ETH-USD', 'LTC-USD']
+        assert any({'LTC-USD', 'ETH-USD'} <= shard for shard in shards)
+
+    def test_partition_balances_products(self):
+        shards = partition_products([{'product': product} for product in ['A-USD', 'B-USD', 'C-USD', 'D-USD']], 2)
+
+        assert [len(shard) for shard in shards] == [2, 2]
+
+    def test_run_shard_sends_snapshots(self, mocker, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        mocker.patch("cbpro.PublicClient.get_product_historic_rates", return_value=self.fake_hist_data)
+        mocker.patch("time.sleep")
+        mocker.patch("engine.OrderBookCustom.OrderBookCustom.process_message")
+        inbox = queue.Queue()
+        outbox = queue.Queue()
+        config = {'fiat': 'USD', 'incremental_indicators': True}
+        worker = threading.Thread(target=run_shard, args=(0, {'BTC-USD': '0.01'}, self.period_configs[:1], config, inbox, outbox))
+        worker.start()
+
+        initial = outbox.get(timeout=5)
+        assert initial[0] == 'period'
+        assert initial[1] == 'BTC'
+        assert initial[2] is True
+        assert len(initial[3]) == 2
+        assert outbox.get(timeout=5) == ('ready', 0)
+
+        trade_time = self.start_time + datetime.timedelta(minutes=2, seconds=30)
+        inbox.put(trade.decode_message({"type": "match", "trade_id": 10, "sequence": 50, "side": "sell",
+                                        "size": "2.5", "price": "140.5", "product_id": "BTC-USD",
+                                        "time": trade_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}))
+        update = outbox.get(timeout=5)
+        inbox.put(None)
+        worker.join(timeout=5)
+
+        assert update[:4] == ('period', 'BTC', False, [])
+        assert update[4][4] == 140.5
+        assert update[5]['close'] == 140.5
+        assert 'bep' not in update[5]
+
+    def test_run_shard_survives_indicator_errors(self, mocker, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        mocker.patch("cbpro.PublicClient.get_product_historic_rates", return_value=self.fake_hist_data)
+        mocker.patch("time.sleep")
+        mocker.patch("indicators.IndicatorSubsystem.IndicatorSubsystem.recalculate_indicators", side_effect=ValueError)
+        inbox = queue.Queue()
+        outbox = queue.Queue()
+        worker = threading.Thread(target=run_shard, args=(0, {}, self.period_configs[:1], {'fiat': 'USD'}, inbox, outbox))
+        worker.start()
+
+        assert outbox.get(timeout=5) == ('ready', 0)
+        inbox.put(None)
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+
+    def make_pool(self, mocker, alive):
+        pool = engine.ShardPool(1, {'fiat': 'USD', 'periods': self.period_configs[:1]}, start_timeout=0)
+        pool.processes = [mocker.Mock(is_alive=mocker.Mock(return_value=alive), exitcode=1)]
+        return pool
+
+    def test_books_use_product_tick_size(self):
+        registry = engine.ProductRegistry(None)
+        registry.set_products([{'id': 'BTC-USD', 'quote_increment': '0.01', 'base_min_size': '0.001'}], time.time())
+        pool = engine.ShardPool(1, {'fiat': 'USD', 'periods': self.period_configs[:2]}, product_registry=registry)
+        assert pool.processes[0]._args[1] == {'BTC-USD': '0.01', 'ETH-USD': None}
+
+    def test_poll_raises_when_worker_died(self, mocker):
+        pool = self.make_pool(mocker, alive=False)
+        with pytest.raises(RuntimeError):
+            pool.poll()
+
+    def test_start_gives_up_on_dead_or_slow_workers(self, mocker):
+        with pytest.raises(RuntimeError):
+            self.make_pool(mocker, alive=False).start()
+        with pytest.raises(RuntimeError):
+            self.make_pool(mocker, alive=True).start()
+
+
+class TestDispatch(object):
+    def setup_method(self):
+        self.btc = period.Period(period_size=60, name='BTC', product='BTC-USD', initialize=False)
+        self.eth = period.Period(period_size=60, name='ETH', product='ETH-USD', initialize=False)
+
+    def make_meta_period(self, mocker):
+        mocker.patch.object(period.MetaPeriod, "initialize")
+        return period.MetaPeriod(period_size=60, name='LTCETH', product='LTC-ETH')
+
+    def route(self, dispatch, msg):
+        for handler in dispatch.get((msg['product_id'], msg['type']), ()):
+            handler(msg)
+
+    def test_routes_only_to_subscribed_consumers(self, mocker):
+        ltceth = self.make_meta_period(mocker)
+        period_list = [self.btc, self.eth, ltceth]
+        for cur_period in period_list:
+            mocker.patch.object(cur_period, 'process_trade')
+            mocker.patch.object(cur_period, 'process_heartbeat')
+        order_books = {'BTC-USD': mocker.Mock(), 'ETH-USD': mocker.Mock()}
+        dispatch, product_periods = engine.build_dispatch(order_books, period_list)
+
+        self.route(dispatch, {'type': 'match', 'product_id': 'ETH-USD'})
+        assert order_books['ETH-USD'].process_message.call_count == 1
+        assert order_books['BTC-USD'].process_message.call_count == 0
+        assert self.eth.process_trade.call_count == 1
+        assert ltceth.process_trade.call_count == 1
+        assert self.btc.process_trade.call_count == 0
+
+        self.route(dispatch, {'type': 'heartbeat', 'product_id': 'BTC-USD'})
+        assert self.btc.process_heartbeat.call_count == 1
+        assert self.eth.process_heartbeat.call_count == 0
+        assert ltceth.process_heartbeat.call_count == 0
+        assert order_books['BTC-USD'].process_message.call_count == 0
+
+        assert product_periods['LTC-USD'] == [ltceth]
+        assert product_periods['ETH-USD'] == [self.eth, ltceth]
+
+    def test_product_trade_periods(self, mocker):
+        ltceth = self.make_meta_period(mocker)
+        dispatch, product_periods = engine.build_dispatch({}, [self.btc, self.eth, ltceth])
+        trade_period_list = {'BTC-USD': [self.btc], 'LTC-ETH': [ltceth]}
+        product_trade_periods = engine.get_product_trade_periods(product_periods, trade_period_list)
+
+        assert product_trade_periods['BTC-USD'] == {'BTC-USD': [self.btc]}
+        assert product_trade_periods['ETH-USD'] == {'LTC-ETH': [ltceth]}
+        assert product_trade_periods['LTC-USD'] == {'LTC-ETH': [ltceth]}
+
+
+class TestOrderBookSnapshot(object):
+    def test_update_sets_ready(self):
+        book = engine.OrderBookSnapshot(product_id='BTC-USD')
+        assert not book.is_ready()
+
+        book.update(100, 101, {'price': '100.5'})
+        assert book.is_ready()
+        assert book.get_bid() == 100
+        assert book.get_ask() == 101
+        assert book.get_current_ticker() == {'price': '100.5'}
+
+
+class TestOrderBookCustom(object):
+    def make_book(self, mocker):
+        auth_client = mocker.Mock()
+        auth_client.get_product_order_book.return_value = {
+            'sequence': 10,
+            'bids': [['99.98', '1.0', 'b1'], ['99.99', '0.5', 'b2']],
+            'asks': [['100.01', '2.0', 'a1'], ['100.01', '1.0', 'a2'], ['100.05', '3.0', 'a3']]}
+        book = engine.OrderBookCustom(product_id='BTC-USD', auth_client=auth_client, tick_size='0.01')
+        # The first message triggers the snapshot and is older than it
+        book.process_message({'type': 'received', 'sequence': 9})
+        return book
+
+    def test_full_channel_updates(self, mocker):
+        book = self.make_book(mocker)
+        assert book.is_ready()
+        assert book.get_bid() == Decimal('99.99')
+        assert book.get_ask() == Decimal('100.01')
+
+        book.process_message({'type': 'open', 'sequence': 11, 'order_id': 'b3', 'side': 'buy',
+                              'price': '100.00', 'remaining_size': '0.2'})
+        assert book.get_bid() == Decimal('100.00')
+        book.process_message({'type': 'match', 'sequence': 12, 'maker_order_id': 'a1', 'side': 'sell',
+                              'price': '100.01', 'size': '2.0'})
+        assert book.get_ask() == Decimal('100.01')
+        assert book.get_current_ticker()['price'] == '100.01'
+        book.process_message({'type': 'done', 'sequence': 13, 'order_id': 'a1', 'side': 'sell', 'price': '100.01'})
+        book.process_message({'type': 'change', 'sequence': 14, 'order_id': 'a2', 'side': 'sell',
+                              'price': '100.01', 'new_size': '0.5'})
+        assert book.asks.levels[book.to_tick('100.01')] == [0.5, 1]
+        book.process_message({'type': 'done', 'sequence': 15, 'order_id': 'a2', 'side': 'sell', 'price': '100.01'})
+        assert book.get_ask() == Decimal('100.05')
+
+    def test_sequence_gap_resets(self, mocker):
+        book = self.make_book(mocker)
+        book.process_message({'type': 'done', 'sequence': 13, 'order_id': 'a1', 'side': 'sell', 'price': '100.01'})
+
+        assert book._client.get_product_order_book.call_count == 2
+        assert book.get_ask() == Decimal('100.01')
+
+    def test_level2_depth(self, mocker):
+        book = engine.OrderBookCustom(product_id='BTC-USD', auth_client=mocker.Mock(), tick_size='0.01')
+        assert not book.wait_ready(0)
+        book.process_message({'type': 'snapshot', 'bids': [['99.99', '1.0'], ['99.98', '3.0']],
+                              'asks': [['100.01', '1.0'], ['100.02', '1.0']]})
+        book.process_message({'type': 'l2update', 'changes': [['sell', '100.01', '0'], ['buy', '99.97', '2.0']]})
+
+        assert book.get_ask() == Decimal('100.02')
+        bid_prices, bid_sizes, ask_prices, ask_sizes = book.get_depth(2)
+        assert bid_prices.tolist() == pytest.approx([99.99, 99.98])
+        assert bid_sizes.tolist() == [1.0, 3.0]
+        assert ask_sizes.tolist() == [1.0]
+        assert book.get_imbalance(2) == pytest.approx(0.6)
+
+
+class TestFeedProfiles(object):
+    def test_ticker_profile_book(self, mocker):
+        book = engine.OrderBookCustom(product_id='BTC-USD', auth_client=mocker.Mock(), tick_size='0.01', feed='ticker')
+        dispatch, product_periods = engine.build_dispatch(
+            {'BTC-USD': book}, [], book_message_types=engine.get_feed_profile('ticker')['book_message_types'])
+        assert ('BTC-USD', 'open') not in dispatch
+
+        match = trade.decode_message({'type': 'match', 'trade_id': 1, 'sequence': 5, 'maker_order_id': 'a',
+                                      'side': 'sell', 'size': '1', 'price': '100.00', 'product_id': 'BTC-USD',
+                                      'time': '2021-04-30T20:00:00.000000Z'})
+        for handler in dispatch[('BTC-USD', 'match')]:
+            handler(match)
+        assert book.get_current_ticker()['price'] == '100.00'
+        assert not book.is_ready()
+        assert book._client.get_product_order_book.call_count == 0
+
+        for handler in dispatch[('BTC-USD', 'ticker')]:
+            handler({'type': 'ticker', 'product_id': 'BTC-USD', 'price': '100.01',
+                     'best_bid': '100.00', 'best_ask': '100.02'})
+        assert book.get_bid() == Decimal('100.00')
+        assert book.get_ask() == Decimal('100.02')
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            engine.get_feed_profile('l3')
+
+
+class StubOrdersClient(object):
+    def get_orders(self):
+        return iter([{'id': 'old', 'product_id': 'BTC-USD', 'side': 'sell', 'price': '110.00', 'size': '1.0',
+                      'status': 'open'}])
+
+    def get_accounts(self):
+        return [{'currency': 'USD', 'balance': '1000.00', 'hold': '0', 'available': '1000.00'},
+                {'currency': 'BTC', 'balance': '1.0', 'hold': '0', 'available': '1.0'}]
+
+    def get_fills(self, product_id):
+        return iter([{'trade_id': 7, 'product_id': product_id, 'side': 'buy', 'price': '100.00', 'size': '1.0',
+                      'created_at': '2021-04-30T19:00:00.000Z'}])
+
+
+class TestOrderTracker(object):
+    def setup_method(self):
+        self.tracker = engine.OrderTracker(StubOrdersClient(), product_ids=['BTC-USD'])
+        self.tracker.reconcile()
+
+    def user_message(self, **fields):
+        msg = {'product_id': 'BTC-USD', 'profile_id': 'p1', 'user_id': 'u1', 'time': '2021-04-30T20:00:00.000Z'}
+        msg.update(fields)
+        return msg
+
+    def test_order_lifecycle(self):
+        product = engine.Product(None, product_id='BTC-USD', order_tracker=self.tracker,
+                                 product_registry=engine.ProductRegistry(None))
+        assert [order['id'] for order in product.open_orders] == ['old']
+
+        self.tracker.process_message(self.user_message(type='received', order_id='new', side='buy', price='99.00',
+                                                       size='2.0', order_type='limit'))
+        self.tracker.process_message(self.user_message(type='open', order_id='new', price='99.00', remaining_size='2.0'))
+        assert self.tracker.get_order('new')['status'] == 'open'
+        assert len(product.open_orders) == 2
+
+        self.tracker.process_message(self.user_message(type='match', trade_id=8, maker_order_id='new',
+                                                       taker_order_id='other', side='buy', price='99.00',
+                                                       size='2.0', maker_fee_rate='0.005'))
+        self.tracker.process_message(self.user_message(type='done', order_id='new', reason='filled'))
+
+        assert self.tracker.get_order('new')['status'] == 'done'
+        assert self.tracker.get_order('new')['filled_size'] == '2.0'
+        assert [order['id'] for order in self.tracker.all_open_orders] == ['old']
+        fills = self.tracker.get_recent_fills()
+        assert [fill['trade_id'] for fill in fills] == [8, 7]
+        assert fills[0]['side'] == 'buy'
+        assert Decimal(fills[0]['fee']) == Decimal('0.99')
+        assert Decimal(fills[0]['usd_volume']) == Decimal('198')
+
+    def test_taker_fill_and_duplicates(self):
+        self.tracker.process_message(self.user_message(type='received', order_id='market', side='sell',
+                                                       size='0.5', order_type='market'))
+        match = self.user_message(type='match', trade_id=9, maker_order_id='someone', taker_order_id='market',
+                                  side='buy', price='101.00', size='0.5')
+        self.tracker.process_message(match)
+        self.tracker.process_message(match)
+
+        fills = self.tracker.get_recent_fills()
+        assert [fill['trade_id'] for fill in fills] == [9, 7]
+        assert fills[0]['side'] == 'sell'
+        assert fills[0]['liquidity'] == 'T'
+
+    def test_waiters_wake_on_events(self):
+        woke = []
+        waiter = threading.Thread(target=lambda: woke.append(self.tracker.wait_for_update(5)))
+        waiter.start()
+        while not self.tracker.changed._waiters:
+            time.sleep(0.001)
+        self.tracker.process_message(self.user_message(type='done', order_id='old', reason='canceled'))
+        waiter.join()
+
+        assert woke == [True]
+        assert self.tracker.all_open_orders == []
+
+
+class TestBalanceLedger(object):
+    def setup_method(self):
+        self.ledger = engine.BalanceLedger(StubOrdersClient())
+        assert self.ledger.reconcile()
+
+    def test_limit_buy_holds_and_fills(self):
+        self.ledger.process_message({'type': 'received', 'order_id': 'o1', 'product_id': 'BTC-USD', 'side': 'buy',
+                                     'price': '100.00', 'size': '2.0', 'profile_id': 'p1'})
+        assert self.ledger.get_available('USD') == Decimal('800')
+
+        self.ledger.process_message({'type': 'match', 'maker_order_id': 'o1', 'taker_order_id': 'x',
+                                     'product_id': 'BTC-USD', 'side': 'buy', 'price': '100.00', 'size': '1.0',
+                                     'maker_fee_rate': '0.001', 'profile_id': 'p1'})
+        assert self.ledger.get_available('BTC') == Decimal('2')
+        assert self.ledger.get_available('USD') == Decimal('799.9')
+
+        self.ledger.process_message({'type': 'done', 'order_id': 'o1', 'product_id': 'BTC-USD', 'profile_id': 'p1'})
+        assert self.ledger.get_available('USD') == Decimal('899.9')
+        assert self.ledger.accounts['USD'][1] == 0
+
+    def test_market_sell(self):
+        self.ledger.process_message({'type': 'received', 'order_id': 'o2', 'product_id': 'BTC-USD', 'side': 'sell',
+                                     'size': '0.5', 'order_type': 'market', 'profile_id': 'p1'})
+        assert self.ledger.get_available('BTC') == Decimal('0.5')
+        self.ledger.process_message({'type': 'match', 'maker_order_id': 'x', 'taker_order_id': 'o2',
+                                     'product_id': 'BTC-USD', 'side': 'buy', 'price': '100.00', 'size': '0.5',
+                                     'taker_fee_rate': '0.005', 'profile_id': 'p1'})
+        self.ledger.process_message({'type': 'done', 'order_id': 'o2', 'product_id': 'BTC-USD', 'profile_id': 'p1'})
+
+        assert self.ledger.get_available('BTC') == Decimal('0.5')
+        assert self.ledger.get_available('USD') == Decimal('1049.75')
+
+
+class StubExchangeHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        if self.server.rate_limited:
+            self.server.rate_limited -= 1
+            self.reply(429, {'message': 'Rate limit exceeded'})
+            return
+        time.sleep(self.server.delay)
+        self.reply(200, [{'id': 'BTC-USD'}])
+
+    def do_POST(self):
+        self.server.hits.append(self.path)
+        self.reply(200, {'id': 'order'})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRestSession(object):
+    def setup_method(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubExchangeHandler)
+        self.server.hits = []
+        self.server.delay = 0
+        self.server.rate_limited = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = cbpro.PublicClient(api_url='http://127.0.0.1:%d' % self.server.server_port)
+        self.client.session = engine.RestSession(cache_ttl=60, retry_wait=0)
+
+    def teardown_method(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_coalesces_concurrent_gets(self):
+        self.server.delay = 0.2
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.client.get_products())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [[{'id': 'BTC-USD'}]] * 5
+        assert self.server.hits == ['/products']
+
+    def test_caches_until_a_write(self):
+        self.client.get_products()
+        self.client.get_products()
+        assert len(self.server.hits) == 1
+
+        self.client.session.post(self.client.url + '/orders')
+        self.client.get_products()
+        assert self.server.hits == ['/products', '/orders', '/products']
+
+    def test_retries_rate_limited_requests(self):
+        self.server.rate_limited = 2
+
+        assert self.client.get_products() == [{'id': 'BTC-USD'}]
+        assert len(self.server.hits) == 3
+
+
+class TestTokenBucket(object):
+    def test_limits_rate_after_burst(self):
+        now = [0.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+
+        bucket = engine.TokenBucket(rate=5, burst=2, clock=lambda: now[0], sleep=sleep)
+        assert [bucket.acquire() for _ in range(4)] == [0, 0, pytest.approx(0.2), pytest.approx(0.4)]
+        now[0] = 10.0
+        assert bucket.acquire() == 0
+        assert waits == [pytest.approx(0.2), pytest.approx(0.4)]
+
+
+class StubAsyncExchange(object):
+    # REST and websocket stand-in for the asyncio runtime, on a local port
+    def __init__(self):
+        self.hits = []
+        self.signed = []
+        self.delay = 0
+        self.rate_limited = 0
+        self.subscriptions = []
+        self.feed = []
+        app = aiohttp_web.Application()
+        app.add_routes([aiohttp_web.get('/products', self.products),
+                        aiohttp_web.post('/orders', self.place_order),
+                        aiohttp_web.delete('/orders', self.cancel),
+                        aiohttp_web.get('/feed', self.websocket)])
+        self.runner = aiohttp_web.AppRunner(app)
+
+    async def start(self):
+        await self.runner.setup()
+        site = aiohttp_web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return 'http://127.0.0.1:%d' % self.port
+
+    async def close(self):
+        await self.runner.cleanup()
+
+    def record(self, request):
+        self.hits.append(request.method + ' ' + request.path_qs)
+        self.signed.append('CB-ACCESS-SIGN' in request.headers)
+
+    async def products(self, request):
+        self.record(request)
+        if self.rate_limited:
+            self.rate_limited -= 1
+            return aiohttp_web.json_response({'message': 'Rate limit exceeded'}, status=429)
+        await asyncio.sleep(self.delay)
+        return aiohttp_web.json_response([{'id': 'BTC-USD'}])
+
+    async def place_order(self, request):
+        self.record(request)
+        order = await request.json()
+        return aiohttp_web.json_response(dict(order, id='order%d' % len(self.hits), status='pending'))
+
+    async def cancel(self, request):
+        self.record(request)
+        return aiohttp_web.json_response([])
+
+    async def websocket(self, request):
+        ws = aiohttp_web.WebSocketResponse()
+        await ws.prepare(request)
+        self.subscriptions.append(json.loads(await ws.receive_str()))
+        for msg in self.feed:
+            await ws.send_str(json.dumps(msg))
+        await ws.close()
+        return ws
+
+
+def run_with_exchange(scenario):
+    async def run():
+        exchange = StubAsyncExchange()
+        url = await exchange.start()
+        try:
+            return await scenario(exchange, url)
+        finally:
+            await exchange.close()
+    return engine.run_loop(run())
+
+
+class TestAsyncRestClient(object):
+    def client(self, url):
+        return engine.AsyncRestClient('key', 'c2VjcmV0', 'passphrase', api_url=url, cache_ttl=60, retry_wait=0)
+
+    def test_coalesces_and_caches_until_a_write(self):
+        async def scenario(exchange, url):
+            client = self.client(url)
+            exchange.delay = 0.2
+            results = await asyncio.gather(*[client.get_products() for _ in range(5)])
+            assert results == [[{'id': 'BTC-USD'}]] * 5
+            assert exchange.hits == ['GET /products']
+
+            await client.get_products()
+            order = await client.place_limit_order('BTC-USD', 'buy', price='100.00', size='1.0', post_only=True)
+            await client.get_products()
+            await client.close()
+            assert order['id'] == 'order2' and order['post_only'] is True
+            assert exchange.hits == ['GET /products', 'POST /orders', 'GET /products']
+            assert all(exchange.signed)
+        run_with_exchange(scenario)
+
+    def test_retries_rate_limited_requests(self):
+        async def scenario(exchange, url):
+            client = self.client(url)
+            exchange.rate_limited = 2
+            assert await client.get_products() == [{'id': 'BTC-USD'}]
+            await client.close()
+            assert len(exchange.hits) == 3
+        run_with_exchange(scenario)
+
+
+class TestAsyncFeed(object):
+    def test_subscribes_and_decodes(self):
+        async def scenario(exchange, url):
+            exchange.feed = [{'type': 'heartbeat', 'product_id': 'BTC-USD', 'sequence': 1,
+                              'time': '2021-04-30T20:00:00.000000Z'}]
+            feed = engine.AsyncFeed(products=['BTC-USD'], channels=['ticker', 'heartbeat'], key='key',
+                                    secret='c2VjcmV0', passphrase='passphrase', url=url.replace('http', 'ws') + '/feed')
+            messages = []
+            with pytest.raises(ConnectionError):
+                async for msg in feed.messages():
+                    messages.append(msg)
+            await feed.close()
+            return messages
+        exchange_messages = run_with_exchange(scenario)
+
+        assert [msg.get('type') for msg in exchange_messages] == ['heartbeat']
+        assert exchange_messages[0].sequence == 1
+
+    def test_subscription(self):
+        feed = engine.AsyncFeed(products=['BTC-USD'], channels=['ticker', 'heartbeat'], key='key',
+                                secret='c2VjcmV0', passphrase='passphrase')
+        sub = feed.subscribe_message()
+        assert sub['channels'] == ['ticker', 'heartbeat', 'user']
+        assert sub['product_ids'] == ['BTC-USD']
+        assert sub['key'] == 'key' and sub['signature']
+
+
+class TestRunLoop(object):
+    def test_returns_and_cancels_leftover_tasks(self):
+        leftover = []
+
+        async def forever():
+            await asyncio.sleep(3600)
+
+        async def scenario():
+            leftover.append(asyncio.ensure_future(forever()))
+            assert engine.current_task() is not None
+            return 'done'
+
+        assert engine.run_loop(scenario()) == 'done'
+        assert leftover[0].cancelled()
+
+    def test_keyboard_interrupt_cancels(self):
+        cleaned_up = []
+
+        def interrupt():
+            raise KeyboardInterrupt
+
+        async def scenario():
+            asyncio.get_event_loop().call_soon(interrupt)
+            try:
+                await asyncio.sleep(3600)
+            finally:
+                cleaned_up.append(True)
+
+        engine.run_loop(scenario())
+        assert cleaned_up == [True]
+
+
+class TestAsyncTradeEngine(object):
+    def engine(self, mocker, url):
+        registry = engine.ProductRegistry(None)
+        registry.set_products([{'id': 'BTC-USD', 'quote_increment': '0.01', 'base_min_size': '0.001'}], time.time())
+        rest_client = engine.AsyncRestClient('key', 'c2VjcmV0', 'passphrase', api_url=url, retry_wait=0)
+        trade_engine = engine.AsyncTradeEngine(StubOrdersClient(), mocker.Mock(), rest_client=rest_client,
+                                               product_list=['BTC-USD'], product_registry=registry, feed='ticker')
+        trade_engine.market_orders = False
+        product = trade_engine.get_product_by_product_id('BTC-USD')
+        product.order_book.process_message({'type': 'ticker', 'product_id': 'BTC-USD', 'price': '100.01',
+                                            'best_bid': '100.00', 'best_ask': '100.02'})
+        return trade_engine, product
+
+    def test_signal_change_cancels_order_workflow(self, mocker):
+        async def scenario(exchange, url):
+            trade_engine, product = self.engine(mocker, url)
+            trade_engine.start_buy(product, Decimal('1000'))
+            await asyncio.sleep(0.05)
+            assert product.order_in_progress
+            assert exchange.hits == ['POST /orders']
+            assert [order['price'] for order in product.open_orders] == ['110.00', '100.01']
+
+            trade_engine.stop_orders(product)
+            await asyncio.sleep(0.05)
+            assert not product.order_in_progress
+            assert exchange.hits == ['POST /orders', 'DELETE /orders?product_id=BTC-USD']
+            await trade_engine.aclose(exit=True)
+            await trade_engine.rest_client.close()
+            assert exchange.hits[-1] == 'DELETE /orders'
+            assert not trade_engine.tasks
+        run_with_exchange(scenario)
+
+    def test_order_workflow_follows_order_events(self, mocker):
+        async def scenario(exchange, url):
+            trade_engine, product = self.engine(mocker, url)
+            trade_engine.start_sell(product, Decimal('1.0'))
+            await asyncio.sleep(0.05)
+            order_id = product.open_orders[-1]['id']
+            woke = asyncio.ensure_future(trade_engine.wait_for_update(5))
+            await asyncio.sleep(0)
+            trade_engine.process_user_message({'type': 'done', 'order_id': order_id, 'product_id': 'BTC-USD',
+                                               'reason': 'canceled', 'profile_id': 'p1'})
+            assert await woke
+            # A same side signal leaves the running workflow alone
+            running = trade_engine.order_tasks['BTC-USD'][1]
+            trade_engine.start_sell(product, Decimal('1.0'))
+            assert trade_engine.order_tasks['BTC-USD'][1] is running
+            await trade_engine.aclose()
+            await trade_engine.rest_client.close()
+            assert running.cancelled()
+        run_with_exchange(scenario)
+
+
+class TestDetermineTrades(object):
+    def engine(self, mocker, rules=None):
+        registry = engine.ProductRegistry(None)
+        registry.set_products([{'id': 'BTC-USD', 'quote_increment': '0.01', 'base_min_size': '0.001'}], time.time())
+        trade_engine = engine.TradeEngine(StubOrdersClient(), mocker.Mock(), product_list=['BTC-USD'], is_live=True,
+                                          product_registry=registry, feed='ticker', strategy=rules)
+        trade_engine.balance_ledger.close()
+        mocker.patch.object(trade_engine.order_tracker, 'get_recent_fills',
+                            return_value=[{'side': 'buy', 'price': '100.00', 'size': '1.0', 'usd_volume': '100.0',
+                                           'fee': '0.5'}])
+        for method in ('start_buy', 'start_sell', 'stop_orders'):
+            mocker.patch.object(trade_engine, method)
+        return trade_engine
+
+    def indicators(self, **values):
+        indicator_subsys = indicators.IndicatorSubsystem([], None)
+        current_indicators = {'sell_point': indicator_subsys.current_indicators['sell_point']}
+        for name, close in values.items():
+            indicator_subsys.current_indicators[name] = {}
+            indicator_subsys.calculate_bep(name, [close])
+            current_indicators[name] = dict(indicator_subsys.current_indicators[name], close=close,
+                                            bband_lower_1=95.0, bband_upper_1=110.0)
+        return current_indicators
+
+    def test_default_rules(self, mocker):
+        trade_engine = self.engine(mocker)
+        period_list = [period.Period(name='BTC', initialize=False), period.Period(name='BTC5', initialize=False)]
+
+        trade_engine.determine_trades('BTC-USD', period_list, self.indicators(BTC=100.0, BTC5=100.0))
+        assert trade_engine.start_buy.called
+
+        # Below the lower band at a loss in one period is an emergency sell
+        trade_engine.determine_trades('BTC-USD', period_list, self.indicators(BTC=100.0, BTC5=90.0))
+        assert trade_engine.start_sell.called
+
+    def test_configured_rules(self, mocker):
+        trade_engine = self.engine(mocker, strategy.Strategy('close < 0', 'close > last_buy_price * 1.1'))
+        period_list = [period.Period(name='BTC', initialize=False)]
+
+        trade_engine.determine_trades('BTC-USD', period_list, self.indicators(BTC=105.0))
+        assert trade_engine.stop_orders.called
+        trade_engine.determine_trades('BTC-USD', period_list, self.indicators(BTC=111.0))
+        assert trade_engine.start_sell.called
+        assert not trade_engine.start_buy.called
+
+
+def record_feed(directory, num_trades=600, seed=3, segment_size=20000):
+    # A match roughly every 2s and a heartbeat every 5 trades, for BTC-USD
+    rng = random.Random(seed)
+    recorder = engine.FeedRecorder(str(directory), segment_size=segment_size, clock=lambda: 0.0)
+    start = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+    price = 100.0
+    for idx in range(1, num_trades + 1):
+        now = start + datetime.timedelta(seconds=idx * 2 + rng.random())
+        price = round(price * (1 + rng.gauss(0, 0.002)), 2)
+        recorder.clock = lambda: now.timestamp()
+        recorder.record({'type': 'match', 'trade_id': idx, 'sequence': idx, 'maker_order_id': 'm', 'taker_order_id': 't',
+                         'side': rng.choice(('buy', 'sell')), 'size': '%.8f' % rng.uniform(0.01, 1),
+                         'price': '%.2f' % price, 'product_id': 'BTC-USD',
+                         'time': now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')})
+        if idx % 5 == 0:
+            recorder.record({'type': 'heartbeat', 'last_trade_id': idx, 'product_id': 'BTC-USD', 'sequence': idx,
+                             'time': now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')})
+    recorder.close()
+    return recorder
+
+
+def load_trader():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cbpro-trader.py')
+    spec = importlib.util.spec_from_file_location('cbpro_trader', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestFeedReplay(object):
+    def test_recorder_round_trip(self, tmp_path):
+        recorder = record_feed(tmp_path, num_trades=100)
+        paths = sorted(os.listdir(str(tmp_path)))
+        assert len(paths) == recorder.segments > 1
+        records = list(engine.read_recording(str(tmp_path)))
+        assert len(records) == recorder.messages == 120
+        assert [msg['trade_id'] for _, msg in records if msg['type'] == 'match'] == list(range(1, 101))
+
+        # A segment cut short by a crash ends at its last complete record
+        last = os.path.join(str(tmp_path), paths[-1])
+        with gzip.open(last, 'rb') as segment:
+            data = segment.read()
+        with gzip.open(last, 'wb') as segment:
+            segment.write(data[:-10])
+        assert len(list(engine.read_recording(str(tmp_path)))) == 119
+
+    def test_replays_at_recorded_pace(self, tmp_path):
+        record_feed(tmp_path, num_trades=10)
+        now = [0.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+        replay = engine.FeedReplay(str(tmp_path), speed=2, clock=lambda: now[0], sleep=sleep)
+        replay.start()
+        replay.thread.join()
+        messages = [replay.websocket_queue.get() for _ in range(replay.websocket_queue.qsize())]
+
+        assert [msg.get('type') for msg in messages[:6]] == ['match'] * 5 + ['heartbeat']
+        assert isinstance(messages[-1], engine.ReplayFinished)
+        # Twice as fast as the ~2s between recorded trades
+        assert sum(waits) == pytest.approx((messages[-2].timestamp - messages[0].timestamp) / 2, abs=0.01)
+
+    def test_offline_client(self, tmp_path):
+        record_feed(tmp_path, num_trades=10)
+        client = engine.OfflineClient.from_recording(str(tmp_path), ['BTC-USD'], {'USD': 1000})
+        history = client.get_product_historic_rates('BTC-USD', granularity=60)
+        first_price = float(next(msg for _, msg in engine.read_recording(str(tmp_path)))['price'])
+        # Ends before the minute the recording starts in
+        assert history[0] == [1619812740, first_price, first_price, first_price, first_price, 0.0]
+        assert history[0][0] - history[1][0] == 60
+        assert client.get_product_historic_rates('BTC-USD', granularity=60) == history
+        assert client.get_accounts()[0]['available'] == '1000'
+        assert client.place_limit_order('BTC-USD', 'buy', '99.00', '1.0')['status'] == 'pending'
+
+    def test_replay_through_trader_is_deterministic(self, tmp_path, mocker, monkeypatch):
+        record_feed(tmp_path / 'feed')
+        monkeypatch.chdir(tmp_path)
+        mocker.patch('storage.MongoConnection')
+        trader_module = load_trader()
+        config = {'key': '', 'secret': '', 'passphrase': '', 'sandbox': False, 'live': False, 'frontend': 'none',
+                  'logging': False, 'fiat': 'USD', 'max_slippage': 0.1, 'mongo': None, 'feed': 'ticker',
+                  'replay_feed': str(tmp_path / 'feed'),
+                  'periods': [{'name': 'BTC', 'product': 'BTC-USD', 'length': 1, 'trade': True, 'meta': False},
+                              {'name': 'BTC5', 'product': 'BTC-USD', 'length': 5, 'trade': False, 'meta': False}]}
+
+        outputs = []
+        for speed in (0, 1000):
+            trader = trader_module.CBProTrader(dict(config, replay_speed=speed))
+            trader.start()
+            outputs.append(([list(cur_period.candlesticks.closes) for cur_period in trader.indicator_period_list],
+                            repr(sorted((name, sorted((key, value) for key, value in values.items() if not callable(value)))
+                                        for name, values in trader.indicator_subsys.current_indicators.items()
+                                        if isinstance(values, dict)))))
+
+        closes, indicator_values = outputs[0]
+        # 20 minutes of trades on top of the flat history
+        assert len(closes[0]) == 220 and len(set(closes[0][:200])) == 1 and len(set(closes[0][200:])) > 1
+        assert 'sma_trend' in indicator_values
+        assert outputs[0] == outputs[1]
+
+    def test_replay_resumes_after_reinitializing(self, tmp_path, mocker, monkeypatch):
+        record_feed(tmp_path / 'feed')
+        monkeypatch.chdir(tmp_path)
+        mocker.patch('storage.MongoConnection')
+        trader_module = load_trader()
+        monkeypatch.setattr(trader_module.time, 'sleep', lambda seconds: None)
+        config = {'key': '', 'secret': '', 'passphrase': '', 'sandbox': False, 'live': False, 'frontend': 'none',
+                  'logging': False, 'fiat': 'USD', 'max_slippage': 0.1, 'mongo': None, 'feed': 'ticker',
+                  'replay_feed': str(tmp_path / 'feed'),
+                  'periods': [{'name': 'BTC', 'product': 'BTC-USD', 'length': 1, 'trade': True, 'meta': False},
+                              {'name': 'BTC', 'product': 'BTC-USD', 'length': 1, 'trade': False, 'meta': False}]}
+        trader = trader_module.CBProTrader(config)
+        handle_message = trader.handle_message
+        trade_ids = []
+
+        def failing_handle_message(msg, queue_size=0):
+            if msg.get('type') == 'match':
+                trade_ids.append(msg.get('trade_id'))
+                if len(trade_ids) == 300:
+                    raise ValueError("handling failed")
+            handle_message(msg, queue_size)
+        trader.handle_message = failing_handle_message
+        reinitialize = mocker.spy(trader, 'reinitialize_periods')
+        trader.start()
+
+        # Every recorded trade once, in order, after history was fetched again
+        assert reinitialize.call_count == 1
+        assert trade_ids == list(range(1, 601))
+        assert len(trader.indicator_period_list[0].candlesticks) > 200
+
+
+class TestProductRegistry(object):
+    def setup_method(self):
+        self.cbpro_products = [{'id': 'BTC-USD', 'quote_increment': '0.01', 'base_min_size': '0.001'},
+                               {'id': 'ETH-USD', 'quote_increment': '0.01', 'base_min_size': '0.01'}]
+
+    def test_products_share_one_fetch(self, mocker):
+        auth_client = mocker.Mock()
+        auth_client.get_products.return_value = self.cbpro_products
+        registry = engine.ProductRegistry(auth_client).load()
+
+        products = [engine.Product(auth_client, product_id=product_id, product_registry=registry)
+                    for product_id in ['BTC-USD', 'ETH-USD', 'ETH-BTC']]
+
+        assert auth_client.get_products.call_count == 1
+        assert [product.meta for product in products] == [False, False, True]
+        assert products[1].min_size == '0.01'
+        assert registry.product_ids() == ['BTC-USD', 'ETH-USD']
+
+    def test_saved_products_expire(self, mocker, tmp_path):
+        auth_client = mocker.Mock()
+        auth_client.get_products.side_effect = [{'message': 'Rate limit exceeded'}, self.cbpro_products,
+                                                self.cbpro_products[:1]]
+        path = str(tmp_path / 'products.json')
+        engine.ProductRegistry(auth_client, path=path, retry_wait=0).load()
+
+        registry = engine.ProductRegistry(auth_client, path=path).load()
+        assert auth_client.get_products.call_count == 2
+        assert registry.get('ETH-USD')['base_min_size'] == '0.01'
+
+        registry = engine.ProductRegistry(auth_client, path=path, ttl=0).load()
+        assert auth_client.get_products.call_count == 3
+        assert registry.get('ETH-USD') is None
@@ -0,0 +1,77 @@
+#
+# test_indicators.py
+#
+# Pytest tests on the indicators module
+
+import period
+import indicators
+import datetime
+import numpy as np
+
+
+class TestStreamingIndicators(object):
+    def setup_class(self):
+        rng = np.random.RandomState(1)
+        start_time = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        closes = 58000 + np.cumsum(rng.normal(0, 30, 260))
+        volumes = np.abs(rng.normal(50, 20, 260))
+        self.rows = [[start_time + datetime.timedelta(minutes=i), close - 10, close + 10, close, close, volume]
+                     for i, (close, volume) in enumerate(zip(closes, volumes))]
+
+    def make_period(self, rows):
+        test_period = period.Period(period_size=60, name="BTC1", product="BTC-USD", initialize=False)
+        test_period.candlesticks.extend(rows[:-1])
+        test_period.cur_candlestick = period.Candlestick(existing_candlestick=rows[-1])
+        return test_period
+
+    def assert_matches_talib(self, test_period):
+        full = indicators.IndicatorSubsystem([test_period], None)
+        streaming = indicators.IndicatorSubsystem([test_period], None, incremental=True)
+        full.recalculate_indicators(test_period)
+        streaming.recalculate_indicators(test_period)
+
+        expected = full.current_indicators[test_period.name]
+        actual = streaming.current_indicators[test_period.name]
+        for name, value in expected.items():
+            if name == 'bep':
+                assert actual[name](1000.0) == value(1000.0)
+            else:
+                np.testing.assert_allclose(actual[name], value, rtol=1e-9, atol=1e-6, err_msg=name)
+        return streaming
+
+    def test_matches_talib_with_short_history(self):
+        self.assert_matches_talib(self.make_period(self.rows[:30]))
+
+    def test_matches_talib_with_full_history(self):
+        self.assert_matches_talib(self.make_period(self.rows))
+
+    def test_commits_closed_candles_and_peeks_live_candle(self):
+        test_period = self.make_period(self.rows[:230])
+        streaming = self.assert_matches_talib(test_period)
+
+        for row in self.rows[230:]:
+            test_period.candlesticks.append(test_period.cur_candlestick.to_list())
+            test_period.cur_candlestick = period.Candlestick(existing_candlestick=row)
+            streaming.recalculate_indicators(test_period)
+
+        state = streaming.streaming_indicators[test_period.name][2]
+        assert state.total_periods == len(self.rows) - 1
+        full = indicators.IndicatorSubsystem([test_period], None)
+        full.recalculate_indicators(test_period)
+        for name in ['sma', 'sma_trend', 'bband_upper_2', 'vol_macd', 'vol_macd_sig', 'avg_volume', 'stochrsi_fastd']:
+            np.testing.assert_allclose(streaming.current_indicators['BTC1'][name],
+                                       full.current_indicators['BTC1'][name], rtol=1e-9, atol=1e-6, err_msg=name)
+
+    def test_rebuilds_after_history_rewrite(self):
+        test_period = self.make_period(self.rows[:100])
+        streaming = indicators.IndicatorSubsystem([test_period], None, incremental=True)
+        streaming.recalculate_indicators(test_period)
+
+        stick = self.rows[98]
+        test_period.candlesticks.replace(-1, [stick[0], stick[1], stick[2], stick[3], stick[4] + 50, stick[5]])
+        streaming.recalculate_indicators(test_period)
+
+        full = indicators.IndicatorSubsystem([test_period], None)
+        full.recalculate_indicators(test_period)
+        np.testing.assert_allclose(streaming.current_indicators['BTC1']['sma'],
+                                   full.current_indicators['BTC1']['sma'], rtol=1e-12)
@@ -0,0 +1,326 @@
+#
+# test_interface.py
+#
+# Pytest tests on the interface module
+
+import datetime
+import gzip
+import json
+import asyncio
+import aiohttp
+import importlib
+import engine
+import interface
+import period
+
+
+def parse_events(chunk):
+    events = []
+    for block in chunk.decode().strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class TestEventStream(object):
+    def test_snapshot_then_events(self):
+        stream = interface.EventStream()
+        stream.publish([('flags', {'BTC-USD': 'buy'})], {'flags': {'BTC-USD': 'buy'}})
+        client = stream.subscribe(sleep=lambda seconds: None)
+
+        assert parse_events(next(client)) == [(1, 'snapshot', {'flags': {'BTC-USD': 'buy'}})]
+        stream.publish([('flags', {'BTC-USD': 'sell'}), ('balances', {'USD': '1.0'})], {})
+        assert parse_events(next(client)) == [(2, 'flags', {'BTC-USD': 'sell'}), (3, 'balances', {'USD': '1.0'})]
+
+    def test_events_are_encoded_once(self):
+        stream = interface.EventStream()
+        first = stream.subscribe(sleep=lambda seconds: None)
+        second = stream.subscribe(sleep=lambda seconds: None)
+        next(first)
+        next(second)
+        stream.publish([('flags', {'BTC-USD': 'buy'})], {})
+
+        assert next(first) == next(second) == stream.events[-1][1]
+        assert stream.get_snapshot() is stream.get_snapshot()
+
+    def test_resume_from_last_event_id(self):
+        stream = interface.EventStream(max_events=2)
+        for idx in range(3):
+            stream.publish([('flags', {'idx': idx})], {'idx': idx})
+
+        resumed = parse_events(next(stream.subscribe(last_event_id='2', sleep=lambda seconds: None)))
+        assert resumed == [(3, 'flags', {'idx': 2})]
+        # Event 1 was dropped, so a client that last saw it starts over
+        too_old = parse_events(next(stream.subscribe(last_event_id='0', sleep=lambda seconds: None)))
+        assert too_old == [(3, 'snapshot', {'idx': 2})]
+
+
+    def test_async_clients_wake_on_publish(self):
+        async def scenario():
+            stream = interface.EventStream(keepalive_interval=5)
+            client = stream.subscribe_async()
+            assert parse_events(await client.__anext__())[0][1] == 'snapshot'
+            pending = asyncio.ensure_future(client.__anext__())
+            await asyncio.sleep(0.01)
+            assert not pending.done()
+            stream.publish([('flags', {'BTC-USD': 'buy'})], {})
+            chunk = await asyncio.wait_for(pending, 1)
+            await client.aclose()
+            assert stream.clients == 0 and stream.waiters == []
+            return parse_events(chunk)
+        assert engine.run_loop(scenario()) == [(1, 'flags', {'BTC-USD': 'buy'})]
+
+
+class TestStreamPublisher(object):
+    def setup_method(self):
+        start = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        self.period = period.Period(period_size=60, name='BTC', initialize=False)
+        self.period.candlesticks.append([start - datetime.timedelta(minutes=1), 1.0, 2.0, 1.5, 1.8, 3.0])
+        self.period.cur_candlestick = period.Candlestick(isotime=start, prev_close=1.8)
+        self.stream = interface.EventStream()
+        self.publisher = interface.StreamPublisher(self.stream, interval=0)
+
+    def make_trade_engine(self, mocker):
+        product = mocker.Mock(product_id='BTC-USD', buy_flag=False)
+        return mocker.Mock(products=[product], balances={'USD': 10.0}, all_open_orders=[], recent_fills=[])
+
+    def events(self):
+        return [(event_type, data) for _, event_type, data in parse_events(b''.join(encoded for _, encoded in self.stream.events))]
+
+    def test_publishes_only_changes(self, mocker):
+        trade_engine = self.make_trade_engine(mocker)
+        indicators = {'BTC': {'close': 1.8, 'sma': float('nan'), 'bep': lambda balance: balance}}
+        self.publisher.maybe_publish([self.period], indicators, trade_engine)
+
+        assert [event_type for event_type, data in self.events()] == ['candle', 'indicators', 'flags', 'balances', 'orders']
+        assert self.events()[1][1] == {'period': 'BTC', 'indicators': {'close': 1.8, 'sma': None}}
+        snapshot = self.stream.state
+        assert snapshot['periods']['BTC']['candle']['close'] == 1.8
+        assert snapshot['balances'] == {'USD': '10.00000000'}
+
+        self.publisher.maybe_publish([self.period], indicators, trade_engine)
+        assert len(self.stream.events) == 5
+
+        trade_engine.products[0].buy_flag = True
+        indicators['BTC']['close'] = 1.9
+        self.publisher.maybe_publish([self.period], indicators, trade_engine)
+        assert self.events()[5:] == [('indicators', {'period': 'BTC', 'indicators': {'close': 1.9}}),
+                                     ('flags', {'BTC-USD': 'buy'})]
+        # Earlier snapshots are left untouched for clients still encoding them
+        assert snapshot['flags'] == {'BTC-USD': 'sell'}
+
+    def test_closed_candles_and_resets(self, mocker):
+        trade_engine = self.make_trade_engine(mocker)
+        self.publisher.maybe_publish([self.period], {}, trade_engine)
+        start = len(self.stream.events)
+
+        self.period.close_candlestick()
+        self.period.new_candlestick(self.period.cur_candlestick.time + datetime.timedelta(minutes=1))
+        self.publisher.maybe_publish([self.period], {}, trade_engine)
+        closed, live = self.events()[start:]
+        assert closed[1]['closed'] is True
+        assert closed[1]['candle']['time'] == self.period.candlesticks.times[-1]
+        assert live[1]['closed'] is False
+        assert live[1]['candle']['time'] == self.period.cur_candlestick_epoch
+
+        self.period.candlesticks.pop()
+        self.publisher.maybe_publish([self.period], {}, trade_engine)
+        assert self.events()[-1] == ('reset', {'period': 'BTC'})
+
+
+class TestEncodedCandles(object):
+    def setup_method(self):
+        self.buffer = period.CandleBuffer(capacity=3)
+        for minute in range(3):
+            self.buffer.append([60.0 * minute, 1.0, 2.0, 1.5, minute, 3.0])
+        self.live = [180.0, 1.0, 2.0, 1.5, 9.0]
+        self.encoded = interface.EncodedCandles()
+
+    def closes(self, body):
+        return [candle['close'] for candle in json.loads(body)]
+
+    def test_since_and_limit(self):
+        assert self.closes(self.encoded.get_body(self.buffer, self.live)) == [0, 1, 2, 9.0]
+        assert self.closes(self.encoded.get_body(self.buffer, self.live, since=60)) == [1, 2, 9.0]
+        assert self.closes(self.encoded.get_body(self.buffer, self.live, since=200)) == []
+        assert self.closes(self.encoded.get_body(self.buffer, self.live, limit=2)) == [2, 9.0]
+        assert self.closes(self.encoded.get_body(self.buffer, self.live, since=60, limit=1)) == [9.0]
+        assert self.closes(self.encoded.get_body(self.buffer, self.live, limit=0)) == []
+
+    def test_encodes_closed_candles_once(self, mocker):
+        encode = mocker.spy(importlib.import_module('interface.EncodedCandles'), 'encode_candle')
+        self.encoded.get_body(self.buffer, self.live)
+        self.encoded.get_body(self.buffer, self.live)
+        # Three closed candles once, the live one per request
+        assert encode.call_count == 5
+
+        self.buffer.append([180.0, 1.0, 2.0, 1.5, 3, 3.0])
+        body = self.encoded.get_body(self.buffer, [240.0, 1.0, 2.0, 1.5, 4.0])
+        assert self.closes(body) == [1, 2, 3, 4.0]
+        assert encode.call_count == 7
+
+        self.buffer.replace(-1, [180.0, 1.0, 2.0, 1.5, 5, 3.0])
+        assert self.closes(self.encoded.get_body(self.buffer, None)) == [1, 2, 5]
+
+    def test_gzip_body(self):
+        body = self.encoded.get_body(self.buffer, self.live, since=60, gzip=True)
+        assert self.closes(gzip.decompress(body)) == [1, 2, 9.0]
+        # The cached compressed prefix is reused with another live candle
+        body = self.encoded.get_body(self.buffer, [180.0, 1.0, 2.0, 1.5, 8.0], since=60, gzip=True)
+        assert self.closes(gzip.decompress(body)) == [1, 2, 8.0]
+
+
+class TestWeb(object):
+    def test_period_candles(self, mocker):
+        start = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        cur_period = period.Period(period_size=60, name='BTC', initialize=False)
+        for minute in range(3, 0, -1):
+            cur_period.candlesticks.append([start - datetime.timedelta(minutes=minute), 1.0, 2.0, 1.5, minute, 3.0])
+        cur_period.cur_candlestick = period.Candlestick(isotime=start, prev_close=1.0)
+        indicator_subsys = mocker.Mock(period_list=[cur_period], current_indicators={})
+        web = interface.web(indicator_subsys, mocker.Mock(), {}, None)
+        client = web.app.test_client()
+
+        response = client.get('/periods/BTC?limit=2')
+        assert [candle['close'] for candle in response.get_json()] == [1, 1.0]
+        etag = response.headers['ETag']
+        assert client.get('/periods/BTC', headers={'If-None-Match': etag}).status_code == 304
+
+        since = (start - datetime.timedelta(minutes=2)).timestamp()
+        response = client.get('/periods/BTC?since=%d' % since, headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert [candle['close'] for candle in json.loads(gzip.decompress(response.data))] == [2, 1, 1.0]
+        assert response.headers['ETag'] != etag
+
+        cur_period.cur_candlestick.close = 1.2
+        assert client.get('/periods/BTC', headers={'If-None-Match': etag}).status_code == 200
+
+    def test_stream_route(self, mocker):
+        indicator_subsys = mocker.Mock(period_list=[], current_indicators={})
+        trade_engine = mocker.Mock(products=[], balances={}, all_open_orders=[], recent_fills=[])
+        web = interface.web(indicator_subsys, trade_engine, {}, None)
+        web.sleep = lambda seconds: None
+        web.publish([])
+
+        response = web.app.test_client().get('/stream/', buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        assert parse_events(next(response.response))[0][1] == 'snapshot'
+        response.close()
+
+
+class TestAsyncWeb(object):
+    def test_routes(self, mocker):
+        start = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        cur_period = period.Period(period_size=60, name='BTC', initialize=False)
+        cur_period.candlesticks.append([start - datetime.timedelta(minutes=1), 1.0, 2.0, 1.5, 1.8, 3.0])
+        cur_period.cur_candlestick = period.Candlestick(isotime=start, prev_close=1.8)
+        indicator_subsys = mocker.Mock(period_list=[cur_period], current_indicators={'BTC': {'close': 1.8}})
+        product = mocker.Mock(product_id='BTC-USD', buy_flag=True)
+        trade_engine = mocker.Mock(products=[product], all_open_orders=[], recent_fills=[])
+        web = interface.web(indicator_subsys, trade_engine, {'web_config': False}, None)
+
+        async def scenario():
+            async_web = interface.AsyncWeb(web, host='127.0.0.1', port=0)
+            site = await async_web.start()
+            url = 'http://127.0.0.1:%d' % site._server.sockets[0].getsockname()[1]
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(url + '/flags/') as response:
+                        assert await response.json() == {'BTC-USD': 'buy'}
+                    async with session.get(url + '/indicators/BTC') as response:
+                        assert await response.json() == {'close': 1.8}
+                    async with session.get(url + '/periods/BTC') as response:
+                        closes = [candle['close'] for candle in await response.json()]
+                        etag = response.headers['ETag']
+                    async with session.get(url + '/periods/BTC', headers={'If-None-Match': etag}) as response:
+                        assert response.status == 304
+                    async with session.get(url + '/stream/') as response:
+                        assert response.content_type == 'text/event-stream'
+                        chunk = await response.content.readuntil(b'\n\n')
+            finally:
+                await async_web.close()
+            return closes, parse_events(chunk)
+        closes, events = engine.run_loop(scenario())
+
+        assert closes == [1.8, 1.8]
+        assert events[0][1] == 'snapshot'
+
+
+class StubDisplayProduct(object):
+    def __init__(self, product_id, buy_flag=False, sell_flag=False):
+        self.product_id = product_id
+        self.buy_flag = buy_flag
+        self.sell_flag = sell_flag
+
+
+class StubDisplayEngine(object):
+    fiat_currency = 'USD'
+
+    def __init__(self):
+        self.balances = {'USD': 100.0, 'BTC': 0.5, 'fiat_equivalent': 200.0}
+        self.products = [StubDisplayProduct('BTC-USD')]
+        self.all_open_orders = []
+
+
+class TestCursesDisplay(object):
+    def make_display(self, mocker):
+        curses = mocker.patch('interface.cursesDisplay.curses')
+        curses.error = Exception
+        curses.color_pair.side_effect = lambda color: color
+        curses.initscr.return_value.getmaxyx.return_value = (40, 120)
+        pads = [mocker.MagicMock(), mocker.MagicMock()]
+        curses.newpad.side_effect = pads
+        # Rendered by hand below
+        display = interface.cursesDisplay(refresh_rate=0.001)
+        display.close()
+        return display, curses, pads[0]
+
+    def make_period(self):
+        cur_period = period.Period(name='BTC60', initialize=False)
+        cur_period.cur_candlestick = period.Candlestick(existing_candlestick=[datetime.datetime(2021, 4, 30), 1, 3, 2, 2.5, 10])
+        return cur_period
+
+    def written(self, pad):
+        return [call[0][2].strip() for call in pad.addstr.call_args_list]
+
+    def test_update_only_marks_dirty(self, mocker):
+        display, curses, pad = self.make_display(mocker)
+        display.update(StubDisplayEngine(), {'BTC60': {}}, [self.make_period()], {'type': 'match'})
+
+        assert display.dirty
+        pad.addstr.assert_not_called()
+        curses.doupdate.assert_not_called()
+
+    def test_renders_only_changes(self, mocker):
+        display, curses, pad = self.make_display(mocker)
+        trade_engine = StubDisplayEngine()
+        period_list = [self.make_period()]
+        display.update(trade_engine, {'BTC60': {}}, period_list, {'type': 'match'})
+        display.render()
+        assert 'USD: 100.00 BTC: 0.50000000' in self.written(pad)
+        assert 'BTC-USD: NONE' in self.written(pad)
+        assert curses.doupdate.call_count == 1
+
+        # Nothing changed, nothing written
+        pad.reset_mock()
+        display.update(trade_engine, {'BTC60': {}}, period_list, {'type': 'match'})
+        display.render()
+        assert pad.addstr.call_count == 0
+
+        # Only the signal row is rewritten, in color
+        trade_engine.products[0].buy_flag = True
+        display.update(trade_engine, {'BTC60': {}}, period_list, {'type': 'match'})
+        display.render()
+        assert self.written(pad) == ['BTC-USD: BUY']
+        assert pad.addstr.call_args[0][3] == 1
+        assert display.frames == 2
+
+    def test_shorter_text_blanks_old(self, mocker):
+        display, curses, pad = self.make_display(mocker)
+        cells = {('pad', 0, 0): ('long text', 0)}
+        assert display.draw(pad, cells, {('pad', 0, 0): ('short', 0), ('pad', 1, 0): ('new', 0)})
+        assert pad.addstr.call_args_list[0][0][2] == 'short    '
+        assert not display.draw(pad, cells, {('pad', 0, 0): ('short', 0), ('pad', 1, 0): ('new', 0)})
+        display.draw(pad, cells, {})
+        assert pad.addstr.call_args[0][2] == '   '
+        assert cells == {}
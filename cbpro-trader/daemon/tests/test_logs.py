@@ -0,0 +1,122 @@
+#
+# test_logs.py
+#
+# Pytest tests on the logs module
+
+import os
+import gzip
+import queue
+import logging
+import logs
+
+
+class Counted(object):
+    # Counts how often the record's message is built
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return 'counted'
+
+
+class TestLogCategory(object):
+    def setup_method(self, method):
+        self.logger = logging.getLogger('test-category-logger')
+        self.logger.setLevel(logging.DEBUG)
+
+    def test_sampling(self):
+        category = logs.LogCategory('trade', 'test-category-logger', every=3)
+        assert [category.enabled() for _ in range(6)] == [False, False, True, False, False, True]
+
+    def test_disabled_without_debug(self):
+        self.logger.setLevel(logging.INFO)
+        category = logs.LogCategory('trade', 'test-category-logger', every=1)
+        assert not category.enabled()
+        assert category.count == 0
+
+    def test_zero_turns_off(self):
+        category = logs.LogCategory('trade', 'test-category-logger', every=0)
+        assert not category.enabled()
+
+    def test_set_sampling(self):
+        logs.set_sampling({'test-category': 5})
+        assert logs.get_category('test-category').every == 5
+        logs.set_sampling({'test-category': 1})
+
+
+class TestDeferredQueueHandler(object):
+    def test_formats_on_listener(self):
+        log_queue = queue.Queue()
+        logger = logging.getLogger('test-deferred-logger')
+        logger.handlers = [logs.DeferredQueueHandler(log_queue)]
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        counted = Counted()
+
+        logger.debug("value %s", counted)
+        assert counted.calls == 0
+        assert log_queue.get_nowait().getMessage() == 'value counted'
+        assert counted.calls == 1
+
+    def test_drops_when_full(self):
+        log_queue = queue.Queue(maxsize=1)
+        handler = logs.DeferredQueueHandler(log_queue)
+        logger = logging.getLogger('test-drop-logger')
+        logger.handlers = [handler]
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+
+        logger.debug("first")
+        logger.debug("second")
+        assert handler.dropped == 1
+        assert log_queue.get_nowait().getMessage() == 'first'
+
+
+class TestRotatingLogFile(object):
+    def test_compressed_rotation(self, tmp_path):
+        filename = str(tmp_path / 'debug.log')
+        handler = logs.RotatingLogFile(filename, max_bytes=100, backups=2)
+        for idx in range(10):
+            handler.emit(logging.makeLogRecord({'msg': 'line %d %s' % (idx, 'x' * 40)}))
+        handler.close()
+
+        assert os.path.exists(filename + '.1.gz')
+        assert not os.path.exists(filename + '.3.gz')
+        with gzip.open(filename + '.1.gz', 'rt') as rotated:
+            assert 'line' in rotated.read()
+
+
+class TestLogSubsystem(object):
+    def setup_method(self, method):
+        self.logger = logging.getLogger('trader-logger')
+        self.error_logger = logging.getLogger('error-logger')
+
+    def teardown_method(self, method):
+        self.subsystem.close()
+        for logger in (self.logger, self.error_logger):
+            logger.handlers = []
+            logger.propagate = True
+        logs.set_sampling({'trade': 1, 'candle': 1, 'heartbeat': 1})
+
+    def test_routes_loggers(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.subsystem = logs.LogSubsystem({'logging': True, 'frontend': 'none', 'log_sample': {'trade': 2}})
+        self.logger.debug("trader %d", 1)
+        self.error_logger.error("failed %d", 2)
+        self.subsystem.close()
+
+        assert open('debug.log').read() == 'trader 1\n'
+        assert open('error.log').read() == 'failed 2\n'
+        assert logs.get_category('trade').every == 2
+
+    def test_quiet_without_handlers(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.subsystem = logs.LogSubsystem({'logging': False, 'frontend': 'none'})
+        counted = Counted()
+
+        assert not logs.get_category('candle').enabled()
+        self.logger.debug("value %s", counted)
+        self.subsystem.close()
+        assert counted.calls == 0
+        assert not os.path.exists('debug.log')
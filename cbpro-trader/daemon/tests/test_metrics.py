@@ -0,0 +1,79 @@
+#
+# test_metrics.py
+#
+# Pytest tests on the metrics module
+
+import metrics
+import trade
+import time
+
+
+class TestLatencyHistogram(object):
+    def test_percentiles(self):
+        histogram = metrics.LatencyHistogram()
+        for micros in range(1, 1001):
+            histogram.record(micros / 1000000)
+
+        summary = histogram.summary()
+        assert summary['count'] == 1000
+        assert summary['max'] == 1000
+        assert 500 <= summary['p50'] <= 500 * 1.13
+        assert 990 <= summary['p99'] <= 1000
+
+    def test_empty(self):
+        assert metrics.LatencyHistogram().summary()['p99'] == 0
+
+
+class TestMetricsSubsystem(object):
+    def test_timed_records_stage(self):
+        subsystem = metrics.MetricsSubsystem()
+        timed_sum = subsystem.timed('sum', sum)
+
+        assert timed_sum([1, 2]) == 3
+        assert subsystem.snapshot()['stages']['sum']['count'] == 1
+
+    def test_timed_disabled_returns_function(self):
+        subsystem = metrics.MetricsSubsystem(enabled=False)
+        assert subsystem.timed('sum', sum) is sum
+
+    def test_sequence_gaps(self):
+        subsystem = metrics.MetricsSubsystem()
+        for sequence in [1, 2, 5, 5, 6]:
+            subsystem.message_received({'type': 'open', 'product_id': 'BTC-USD', 'sequence': sequence}, 0)
+        subsystem.message_received({'type': 'heartbeat', 'product_id': 'BTC-USD', 'sequence': 6}, 3)
+
+        snapshot = subsystem.snapshot()
+        assert snapshot['sequence_gaps'] == 1
+        assert snapshot['missing_messages'] == 2
+        assert snapshot['out_of_order'] == 1
+        assert snapshot['max_queue_depth'] == 3
+
+    def test_trade_id_gaps_without_full_channel(self):
+        subsystem = metrics.MetricsSubsystem(sequence_field='trade_id')
+        for sequence, trade_id in [(10, 1), (20, 2), (45, 4)]:
+            subsystem.message_received({'type': 'match', 'product_id': 'BTC-USD', 'sequence': sequence,
+                                        'trade_id': trade_id}, 0)
+        subsystem.message_received({'type': 'ticker', 'product_id': 'BTC-USD', 'sequence': 90}, 0)
+
+        snapshot = subsystem.snapshot()
+        assert snapshot['sequence_gaps'] == 1
+        assert snapshot['missing_messages'] == 1
+
+    def test_lag_from_event_time(self):
+        subsystem = metrics.MetricsSubsystem()
+        event = trade.decode_message({"type": "match", "trade_id": 10, "sequence": 50, "side": "sell",
+                                      "size": "1", "price": "1", "product_id": "BTC-USD",
+                                      "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - 2))})
+        subsystem.message_received(event, 0)
+
+        assert subsystem.snapshot()['stages']['lag']['max'] >= 1000000
+
+    def test_summary_resets_interval(self):
+        subsystem = metrics.MetricsSubsystem(summary_interval=0)
+        subsystem.record('stage', 0.001)
+        subsystem.maybe_log_summary()
+        subsystem.maybe_log_summary()
+
+        snapshot = subsystem.snapshot()
+        assert snapshot['stages']['stage']['count'] == 1
+        assert snapshot['last_interval']['stage']['count'] == 0
@@ -124,8 +124,8 @@ class TestPeriod(object):
         assert test_period.name == "BTC15"
         assert test_period.product == "BTC-USD"
         assert test_period.verbose_heartbeat is False
-        assert isinstance(test_period.candlesticks, type(np.array([])))
-        np.testing.assert_array_equal(test_period.candlesticks, np.array([]))
+        assert isinstance(test_period.candlesticks, period.CandleBuffer)
+        assert len(test_period.candlesticks) == 0
 
     def test_init__initalize_true(self, mocker):
         mocker.patch("cbpro.PublicClient.get_product_historic_rates", return_value=self.fake_hist_data)
@@ -137,8 +137,290 @@ class TestPeriod(object):
         assert test_period.product == "ETH-USD"
         assert test_period.verbose_heartbeat is False
 
-        assert isinstance(test_period.candlesticks, type(np.array([])))
+        assert isinstance(test_period.candlesticks, period.CandleBuffer)
         assert len(test_period.candlesticks) == len(self.fake_hist_data) - 1
         assert isinstance(test_period.cur_candlestick, period.Candlestick)
         assert test_period.cur_candlestick_start == self.start_time
         assert isinstance(test_period.candlesticks[0], type(np.array([])))
+
+    def test_process_trade__closes_candlestick(self, mocker):
+        mocker.patch("cbpro.PublicClient.get_product_historic_rates", return_value=self.fake_hist_data)
+        test_period = period.Period(period_size=300, name="ETH5", product="ETH-USD", initialize=True)
+        trade_time = test_period.cur_candlestick.time + datetime.timedelta(minutes=6)
+        match = trade.decode_message({"type": "match", "trade_id": 10, "sequence": 50, "side": "sell",
+                                      "size": "2.5", "price": "140.5", "product_id": "ETH-USD",
+                                      "time": trade_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")})
+        test_period.process_trade(match)
+
+        assert len(test_period.candlesticks) == len(self.fake_hist_data)
+        assert test_period.cur_candlestick.close == 140.5
+        assert test_period.cur_candlestick.volume == 2.5
+
+
+class TestCandleBuffer(object):
+    def setup_class(self):
+        self.start_time = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        self.rows = [[self.start_time + datetime.timedelta(minutes=i), 100.0 + i, 110.0 + i,
+                      105.0 + i, 106.0 + i, 10.0 * i] for i in range(7)]
+
+    def test_append_and_views(self):
+        buffer = period.CandleBuffer(capacity=10)
+        buffer.extend(self.rows[:3])
+
+        assert len(buffer) == 3
+        np.testing.assert_array_equal(buffer.closes, [106.0, 107.0, 108.0])
+        np.testing.assert_array_equal(buffer.times, [int(row[0].timestamp()) for row in self.rows[:3]])
+        assert buffer.closes.dtype == np.float64
+        assert buffer.times.dtype == np.int64
+
+    def test_wraps_at_capacity_with_contiguous_views(self):
+        buffer = period.CandleBuffer(capacity=4)
+        for row in self.rows:
+            buffer.append(row)
+
+        assert len(buffer) == 4
+        assert buffer.appended == 7
+        np.testing.assert_array_equal(buffer.lows, [103.0, 104.0, 105.0, 106.0])
+        np.testing.assert_array_equal(buffer.volumes, [30.0, 40.0, 50.0, 60.0])
+        assert buffer.closes.flags['C_CONTIGUOUS']
+        assert buffer.closes.base is not None
+
+    def test_getitem_returns_row(self):
+        buffer = period.CandleBuffer(capacity=4)
+        buffer.extend(self.rows)
+
+        row = buffer[-1]
+        assert isinstance(row, type(np.array([])))
+        assert row[0] == self.rows[-1][0]
+        assert list(row[1:]) == self.rows[-1][1:]
+        assert buffer[0][0] == self.rows[3][0]
+
+    def test_snapshot_copies_aligned_columns(self):
+        buffer = period.CandleBuffer(capacity=4)
+        buffer.extend(self.rows)
+
+        times, lows, highs, opens, closes, volumes = buffer.snapshot()
+        buffer.append(self.rows[0])
+        assert len(times) == 4
+        np.testing.assert_array_equal(lows, [103.0, 104.0, 105.0, 106.0])
+        np.testing.assert_array_equal(volumes, [30.0, 40.0, 50.0, 60.0])
+        assert times[-1] == int(self.rows[-1][0].timestamp())
+
+    def test_pop_and_replace(self):
+        buffer = period.CandleBuffer(capacity=4)
+        buffer.extend(self.rows)
+
+        popped = buffer.pop()
+        assert popped[0] == self.rows[-1][0]
+        assert len(buffer) == 3
+        np.testing.assert_array_equal(buffer.closes, [109.0, 110.0, 111.0])
+
+        buffer.replace(-1, [self.rows[5][0], 1.0, 2.0, 3.0, 4.0, 5.0])
+        np.testing.assert_array_equal(buffer.closes, [109.0, 110.0, 4.0])
+        assert buffer.revision == 2
+
+        buffer.append(self.rows[6])
+        np.testing.assert_array_equal(buffer.closes, [109.0, 110.0, 4.0, 112.0])
+
+
+class TestCandleCache(object):
+    def setup_method(self):
+        self.requests = []
+
+    def fetch(self, product, granularity, start, end):
+        # Fake CBPRO history: a candle every granularity seconds, close == time
+        self.requests.append((product, granularity, start, end))
+        times = np.arange(start // granularity * granularity, end + 1, granularity)
+        candles = np.zeros(len(times), dtype=period.CANDLE_DTYPE)
+        candles['time'] = times
+        for column in ('low', 'high', 'open', 'close'):
+            candles[column] = times
+        candles['volume'] = 1.0
+        return candles
+
+    def test_fetches_only_missing_tail(self, tmp_path):
+        cache = period.CandleCache(str(tmp_path), fresh_seconds=0)
+        candles = cache.get_candles('BTC-USD', 300, 30000, 60000, self.fetch)
+        assert candles['time'][0] == 30000
+        assert candles['time'][-1] == 60000
+        assert self.requests[-1] == ('BTC-USD', 300, 30000, 60000)
+
+        candles = cache.get_candles('BTC-USD', 300, 33000, 63000, self.fetch)
+        assert self.requests[-1] == ('BTC-USD', 300, 60000 - 10 * 300, 63000)
+        assert candles['time'][0] == 33000
+        assert candles['time'][-1] == 63000
+        assert np.all(np.diff(candles['time']) == 300)
+
+    def test_fresh_cache_is_served_from_disk(self, tmp_path):
+        cache = period.CandleCache(str(tmp_path))
+        cache.get_candles('BTC-USD', 60, 6000, 12000, self.fetch)
+        cache.get_candles('BTC-USD', 60, 6000, 12000, self.fetch)
+        assert len(self.requests) == 1
+        assert len(cache.read('BTC-USD', 60)) == 101
+
+    def test_stale_cache_is_replaced(self, tmp_path):
+        cache = period.CandleCache(str(tmp_path), fresh_seconds=0)
+        cache.get_candles('BTC-USD', 60, 6000, 12000, self.fetch)
+        candles = cache.get_candles('BTC-USD', 60, 600000, 612000, self.fetch)
+        assert self.requests[-1] == ('BTC-USD', 60, 600000, 612000)
+        assert cache.read('BTC-USD', 60)['time'][0] == 600000
+        assert len(candles) == 201
+
+    def test_derives_coarser_granularity_from_base(self, tmp_path):
+        cache = period.CandleCache(str(tmp_path), fresh_seconds=0)
+        cache.get_candles('BTC-USD', 60, 6000, 24000, self.fetch)
+        candles = cache.get_candles('BTC-USD', 900, 9000, 24060, self.fetch)
+
+        assert self.requests[-1][1] == 60
+        assert not (tmp_path / 'BTC-USD-900.candles').exists()
+        np.testing.assert_array_equal(candles['time'], np.arange(9000, 24001, 900))
+        assert candles['open'][0] == 9000
+        assert candles['close'][0] == 9840
+        assert candles['high'][0] == 9840
+        assert candles['volume'][0] == 15
+
+    def test_period_uses_cache(self, tmp_path, mocker):
+        cache = period.CandleCache(str(tmp_path))
+        historic_rates = mocker.patch("cbpro.PublicClient.get_product_historic_rates",
+                                      return_value=[[1560, 1.0, 3.0, 2.0, 2.5, 10.0], [1500, 1.0, 2.0, 1.0, 1.5, 5.0]])
+        mocker.patch("time.time", return_value=1600)
+        mocker.patch("time.sleep")
+        test_period = period.Period(period_size=60, product="BTC-USD", initialize=False, candle_cache=cache)
+        hist_data = test_period.get_historical_data(num_periods=2)
+
+        assert historic_rates.call_count == 1
+        assert hist_data[0][0].timestamp() == 1500
+        assert hist_data[-1][0].timestamp() == 1560
+        assert list(cache.read('BTC-USD', 60)['close']) == [1.5, 2.5]
+
+
+class TestAggregatedPeriod(object):
+    def make_periods(self, mocker):
+        start = datetime.datetime(2021, 4, 30, 20, 0, tzinfo=datetime.timezone.utc)
+        base = period.Period(period_size=60, name='BTC1', initialize=False)
+        base.cur_candlestick = period.Candlestick(isotime=start, prev_close=100.0)
+        base.cur_candlestick_start = start
+        base.cur_candlestick_epoch = start.timestamp()
+        mocker.patch.object(period.AggregatedPeriod, 'get_historical_data', return_value=np.array([]))
+        view = period.AggregatedPeriod(base, period_size=300, name='BTC5')
+        return base, view, start
+
+    def trade(self, trade_time, price, size=1.0):
+        return trade.decode_message({"type": "match", "trade_id": 1, "sequence": 1, "side": "buy",
+                                     "size": str(size), "price": str(price), "product_id": "BTC-USD",
+                                     "time": trade_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")})
+
+    def test_rolls_up_base_candles(self, mocker):
+        base, view, start = self.make_periods(mocker)
+        prices = [101, 99, 104, 102, 98, 103, 105]
+        for minute, price in enumerate(prices):
+            base.process_trade(self.trade(start + datetime.timedelta(minutes=minute, seconds=10), price))
+
+        assert len(view.candlesticks) == 1
+        assert view.candlesticks.times[0] == start.timestamp()
+        np.testing.assert_array_equal(view.candlesticks.closes, [98.0])
+        np.testing.assert_array_equal(view.candlesticks.highs, [104.0])
+        np.testing.assert_array_equal(view.candlesticks.lows, [98.0])
+        np.testing.assert_array_equal(view.candlesticks.volumes, [5.0])
+
+        # Live candle merges the closed base candle of this bucket with the live one
+        assert view.cur_candlestick.time.timestamp() == start.timestamp() + 300
+        # Base candles open at the previous close
+        assert view.cur_candlestick.open == 98
+        assert view.cur_candlestick.high == 105
+        assert view.cur_candlestick.low == 98
+        assert view.cur_candlestick.close == 105
+        assert view.cur_candlestick.volume == 2
+
+    def test_views_get_no_messages(self, mocker):
+        import engine
+        base, view, start = self.make_periods(mocker)
+        dispatch, product_periods = engine.build_dispatch({}, [base, view])
+
+        assert len(dispatch[('BTC-USD', 'match')]) == 1
+        assert product_periods['BTC-USD'] == [base, view]
+
+    def test_reaggregate_after_history_patch(self, mocker):
+        base, view, start = self.make_periods(mocker)
+        for minute in range(6):
+            base.process_trade(self.trade(start + datetime.timedelta(minutes=minute, seconds=10), 100 + minute))
+        base.candlesticks.replace(2, [start + datetime.timedelta(minutes=2), 90.0, 110.0, 100.0, 102.0, 1.0])
+        view.reaggregate(start.timestamp())
+
+        np.testing.assert_array_equal(view.candlesticks.highs, [110.0])
+        np.testing.assert_array_equal(view.candlesticks.lows, [90.0])
+
+    def test_create_periods(self, mocker):
+        mocker.patch.object(period.Period, 'initialize')
+        mocker.patch.object(period.AggregatedPeriod, 'initialize')
+        configs = [{'name': 'BTC4', 'product': 'BTC-USD', 'length': 4},
+                   {'name': 'BTC2', 'product': 'BTC-USD', 'length': 2},
+                   {'name': 'BTC7', 'product': 'BTC-USD', 'length': 7},
+                   {'name': 'ETH1', 'product': 'ETH-USD', 'length': 1}]
+        periods = period.create_periods(configs, aggregate=True)
+
+        assert [cur_period.name for cur_period in periods] == ['BTC4', 'BTC2', 'BTC7', 'ETH1']
+        assert periods[0].base_period is periods[1]
+        assert periods[1].base_period is None
+        assert periods[2].base_period is None
+        assert periods[1].views == [periods[0]]
+        assert all(cur_period.base_period is None for cur_period in period.create_periods(configs))
+
+
+class TestMetaPeriod(object):
+    def setup_method(self, method):
+        # Newest first like the historic rates API. ETH-USD has no candle at 120
+        self.history = {'LTC-USD': [[180, 99, 102, 100, 101, 4], [120, 98, 101, 99, 100, 3],
+                                    [60, 97, 100, 98, 99, 2], [0, 96, 99, 97, 98, 1]],
+                        'ETH-USD': [[180, 49, 51, 50, 50.5, 2], [60, 48, 50, 49, 49.5, 1]]}
+
+    def make_meta_period(self, mocker, initialize=True):
+        mocker.patch.object(period.Period, 'request_interval', 0)
+        client = mocker.Mock()
+        client.get_product_historic_rates.side_effect = lambda product, **kwargs: self.history[product]
+        return period.MetaPeriod(period_size=60, name='LTCETH', product='LTC-ETH', initialize=initialize,
+                                 cbpro_client=client), client
+
+    def make_trade(self, product_id, price, size, trade_id):
+        return trade.decode_message({"type": "match", "trade_id": trade_id, "sequence": trade_id, "side": "buy",
+                                     "size": str(size), "price": str(price), "product_id": product_id,
+                                     "time": "1970-01-01T00:03:30.000000Z"})
+
+    def test_synthetic_candles_join_on_time(self):
+        base = np.array(self.history['LTC-USD'][::-1], dtype=float)
+        quoted = np.array(self.history['ETH-USD'][::-1], dtype=float)
+        candles = period.synthetic_candles(base, quoted)
+
+        # Starts once both legs have traded, the missing ETH-USD candle holds its close
+        assert candles[:, 0].tolist() == [60, 120, 180]
+        assert candles[:, 4].tolist() == [99 / 49.5, 100 / 49.5, 101 / 50.5]
+        assert candles[1, 5] == 3
+        assert candles[2, 5] == 4 + 2 / (101 / 50.5)
+        assert (candles[:, 1] <= np.minimum(candles[:, 3], candles[:, 4])).all()
+        assert (candles[:, 2] >= np.maximum(candles[:, 3], candles[:, 4])).all()
+
+    def test_synthetic_candles_empty_leg(self):
+        assert len(period.synthetic_candles(np.empty((0, 6)), np.ones((2, 6)))) == 0
+
+    def test_honours_initialize(self, mocker):
+        meta_period, client = self.make_meta_period(mocker, initialize=False)
+        assert client.get_product_historic_rates.call_count == 0
+        assert meta_period.get_product_ids() == ['LTC-USD', 'ETH-USD']
+
+    def test_any_cross_pair(self):
+        assert period.get_meta_legs('MATIC-BTC', 'EUR') == ('MATIC-EUR', 'BTC-EUR')
+
+    def test_history_and_trades(self, mocker):
+        meta_period, client = self.make_meta_period(mocker)
+        assert meta_period.candlesticks.times.tolist() == [60, 120]
+        assert meta_period.cur_candlestick.close == 101 / 50.5
+
+        # Each leg moves the synthetic price, sizes are in LTC
+        meta_period.process_trade(self.make_trade('LTC-USD', 110, 2, 1))
+        assert meta_period.cur_candlestick.close == 110 / 50.5
+        assert meta_period.cur_candlestick.volume == 5 + 2
+        meta_period.process_trade(self.make_trade('ETH-USD', 55, 1, 2))
+        assert meta_period.cur_candlestick.close == 2.0
+        assert meta_period.cur_candlestick.volume == 5 + 2 + 0.5
+        meta_period.process_trade(self.make_trade('BTC-USD', 1, 1, 3))
+        assert meta_period.cur_candlestick.close == 2.0
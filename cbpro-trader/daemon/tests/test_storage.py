@@ -0,0 +1,134 @@
+#
+# test_storage.py
+#
+# Pytest tests on the storage module
+
+import storage
+import period
+import numpy as np
+from unittest import mock
+
+
+class TestMongoConnection(object):
+    def make_connection(self, mocker, **kwargs):
+        mocker.patch("storage.MongoConnection.MongoClient")
+        mc = storage.MongoConnection("mongodb://localhost", **kwargs)
+        return mc, mc.db
+
+    def test_indicator_log_is_batched(self, mocker):
+        mc, db = self.make_connection(mocker, flush_interval=60, batch_size=2)
+        mc.indicator_log({'close': 1.0}, True, False)
+        mc.indicator_log({'close': 1.0}, True, False)
+        mc.indicator_log({'close': 2.0}, True, False)
+        mc.close()
+
+        requests = db['indicator_log'].bulk_write.call_args[0][0]
+        assert len(requests) == 2
+        assert mc.writer.get_stats()['written'] == 2
+        db['fills_log'].create_index.assert_called_once_with('trade_id', unique=True)
+
+    def test_fills_are_upserted_once(self, mocker):
+        mc, db = self.make_connection(mocker, flush_interval=60)
+        fills = [{'trade_id': 1, 'price': '1.0'}, {'trade_id': 2, 'price': '2.0'}]
+        mc.fills_log(fills)
+        mc.fills_log(fills)
+        mc.close()
+
+        requests = db['fills_log'].bulk_write.call_args[0][0]
+        assert len(requests) == 2
+        assert requests[0]._filter == {'trade_id': 1}
+        assert requests[0]._doc['$setOnInsert']['price'] == '1.0'
+        assert 'log_time' in requests[0]._doc['$setOnInsert']
+        assert 'log_time' not in fills[0]
+
+    def test_logged_trade_ids_are_capped(self, mocker):
+        mc, db = self.make_connection(mocker, flush_interval=60)
+        mc.max_logged_trade_ids = 2
+        mc.fills_log([{'trade_id': trade_id} for trade_id in range(5)])
+        mc.close()
+
+        assert list(mc.logged_trade_ids) == [3, 4]
+
+    def test_full_queue_drops(self, mocker):
+        # Writer thread is not started so nothing drains the queue
+        mocker.patch("threading.Thread.start")
+        writer = storage.MongoWriter(mock.MagicMock(), str, max_queue=1)
+        writer.insert('indicator_log', {'close': 1.0})
+        writer.insert('indicator_log', {'close': 2.0})
+
+        assert writer.get_stats()['pending'] == 1
+        assert writer.get_stats()['dropped'] == 1
+
+
+class TestTradeJournal(object):
+    def make_period(self, times, name='BTC60', product='BTC-USD'):
+        cur_period = period.Period(period_size=60, name=name, product=product, initialize=False)
+        closes = np.arange(len(times), dtype='f8') + 100
+        cur_period.candlesticks.load(np.array(times), closes - 1, closes + 1, closes, closes, np.ones(len(times)))
+        return cur_period
+
+    def test_candles_round_trip(self, tmp_path):
+        # Two candles either side of midnight UTC
+        times = [86400 - 120, 86400 - 60, 86400, 86400 + 60]
+        journal = storage.TradeJournal(str(tmp_path))
+        journal.record_candles(self.make_period(times))
+        journal.close()
+
+        reader = storage.JournalReader(str(tmp_path))
+        assert reader.products() == ['BTC-USD']
+        assert reader.days('BTC-USD') == ['1970-01-01', '1970-01-02']
+        assert reader.names('BTC-USD', 'candles') == ['BTC60']
+        assert isinstance(reader.read('BTC-USD', 'candles', 'BTC60', start_day='1970-01-02'), np.memmap)
+        candles = reader.read_candles('BTC-USD', 'BTC60')
+        assert candles['time'].tolist() == times
+        assert candles['close'].tolist() == [100, 101, 102, 103]
+
+    def test_history_is_journaled_once(self, tmp_path):
+        journal = storage.TradeJournal(str(tmp_path))
+        journal.record_candles(self.make_period([60, 120]))
+        journal.close()
+        # A restart loads overlapping history
+        journal = storage.TradeJournal(str(tmp_path))
+        cur_period = self.make_period([60, 120, 180])
+        journal.record_candles(cur_period)
+        journal.record_candles(cur_period)
+        journal.close()
+
+        candles = storage.JournalReader(str(tmp_path)).read('BTC-USD', 'candles', 'BTC60')
+        assert candles['time'].tolist() == [60, 120, 180]
+
+    def test_indicator_columns_change(self, tmp_path):
+        journal = storage.TradeJournal(str(tmp_path), clock=iter([10, 20]).__next__)
+        journal.record_indicators('BTC-USD', 'BTC60', {'close': 1.0, 'sma': 2.0, 'bep': lambda price: price * 2})
+        journal.record_indicators('BTC-USD', 'BTC60', {'close': 1.0, 'sma': 2.0, 'bep': lambda price: price * 2})
+        journal.record_indicators('BTC-USD', 'BTC60', {'close': 3.0})
+        journal.close()
+
+        indicators = storage.JournalReader(str(tmp_path)).read('BTC-USD', 'indicators', 'BTC60')
+        assert indicators['time'].tolist() == [10, 20]
+        assert indicators['bep'][0] == 2.0
+        assert indicators['close'].tolist() == [1.0, 3.0]
+        assert np.isnan(indicators['sma'][1])
+
+    def test_decisions_and_partial_record(self, tmp_path):
+        journal = storage.TradeJournal(str(tmp_path), clock=lambda: 60)
+        journal.record_decision('BTC-USD', 'trades', 100, True, False, action=storage.ACTION_BUY)
+        journal.close()
+        path = tmp_path / 'BTC-USD' / '1970-01-01' / 'decisions-trades-0.bin'
+        # Killed while writing a record
+        with open(str(path), 'ab') as segment_file:
+            segment_file.write(b'\x00' * 3)
+        assert len(storage.JournalReader(str(tmp_path)).read('BTC-USD', 'decisions', 'trades')) == 1
+
+        journal = storage.TradeJournal(str(tmp_path), clock=lambda: 120)
+        journal.record_decision('BTC-USD', 'trades', 101, False, True, sell_point=99)
+        journal.close()
+        decisions = storage.JournalReader(str(tmp_path)).read('BTC-USD', 'decisions', 'trades')
+        assert decisions['price'].tolist() == [100, 101]
+        assert decisions['action'].tolist() == [storage.ACTION_BUY, storage.ACTION_NONE]
+        assert decisions['sell_flag'].tolist() == [False, True]
+
+    def test_missing(self, tmp_path):
+        reader = storage.JournalReader(str(tmp_path / 'none'))
+        assert reader.products() == []
+        assert len(reader.read('BTC-USD', 'candles', 'BTC60')) == 0
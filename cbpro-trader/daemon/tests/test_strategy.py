@@ -0,0 +1,78 @@
+#
+# test_strategy.py
+#
+# Pytest tests on the strategy module
+
+import numpy as np
+import pytest
+import strategy
+
+
+class TestRule(object):
+    def test_scalars_and_arrays(self):
+        rule = strategy.Rule('close >= bband_lower_1 and ceil(bep) < ceil(bband_upper_1)')
+        assert rule.names == {'close', 'bband_lower_1', 'bep', 'bband_upper_1'}
+        assert rule.evaluate({'close': 100.0, 'bband_lower_1': 99.0, 'bep': 101.0, 'bband_upper_1': 102.5})
+        assert not rule.evaluate({'close': 100.0, 'bband_lower_1': 101.0, 'bep': 101.0, 'bband_upper_1': 102.5})
+        result = rule.evaluate({'close': np.array([100.0, 100.0, 100.0]), 'bband_lower_1': 99.0,
+                                'bep': np.array([101.0, 102.5, 101.0]), 'bband_upper_1': np.array([102.5, 102.5, 100.5])})
+        assert result.tolist() == [True, False, False]
+
+    def test_boolean_operators(self):
+        rule = strategy.Rule('not (a > 1 or b > 1) and -a < 0')
+        assert rule.evaluate({'a': np.array([0.5, 2.0, 0.5, -1.0]), 'b': np.array([0.5, 0.5, 2.0, 0.0])}).tolist() == \
+            [True, False, False, False]
+
+    def test_chained_comparison(self):
+        rule = strategy.Rule('lower < close <= upper')
+        assert rule.evaluate({'lower': 1.0, 'close': np.array([0.5, 1.5, 2.0, 2.5]), 'upper': 2.0}).tolist() == \
+            [False, True, True, False]
+
+    def test_functions(self):
+        rule = strategy.Rule('max(a, b) - min(a, b) > abs(c) + floor(d) * 2 / 4')
+        assert rule.evaluate({'a': 5.0, 'b': 1.0, 'c': -1.0, 'd': 2.5})
+        assert not rule.evaluate({'a': 2.0, 'b': 1.0, 'c': -1.0, 'd': 2.5})
+
+    def test_nan_comparisons_are_false(self):
+        rule = strategy.Rule('close < last_buy_price or close >= last_buy_price')
+        assert not rule.evaluate({'close': 1.0, 'last_buy_price': np.nan})
+
+    @pytest.mark.parametrize('expression', ["__import__('os')", 'close.real > 0', 'close[0] > 0',
+                                            "close > 'a'", 'lambda: 0', 'open(close)', 'close ** 2 > 0',
+                                            'close in sma', 'close >'])
+    def test_rejects_expressions(self, expression):
+        with pytest.raises(ValueError):
+            strategy.Rule(expression)
+
+
+class TestStrategy(object):
+    def setup_method(self, method):
+        self.strategy = strategy.Strategy('close > sma', 'close < sma or close > sell_point')
+
+    def test_defaults(self):
+        default = strategy.Strategy.from_config(None)
+        assert default.buy.expression == strategy.DEFAULT_RULES['buy']
+        custom = strategy.Strategy.from_config({'sell': 'close > sell_point'})
+        assert custom.buy.expression == strategy.DEFAULT_RULES['buy']
+        assert custom.sell.expression == 'close > sell_point'
+        assert custom.names == ['bband_lower_1', 'bband_upper_1', 'bep', 'close', 'sell_point']
+
+    def test_every_period_buys(self):
+        rows = [{'close': 10.0, 'sma': 9.0, 'sell_point': 20.0}, {'close': 10.0, 'sma': 9.5, 'sell_point': 20.0}]
+        assert self.strategy.decide(rows) == (True, False)
+        rows[1]['sma'] = 10.5
+        assert self.strategy.decide(rows) == (False, True)
+
+    def test_any_period_sells(self):
+        rows = [{'close': 10.0, 'sma': 10.0, 'sell_point': 20.0}, {'close': 10.0, 'sma': 10.5, 'sell_point': 20.0}]
+        assert self.strategy.decide(rows) == (False, True)
+
+    def test_missing_values(self):
+        # A period without an indicator yet neither buys nor sells on it
+        assert self.strategy.decide([{'close': 10.0, 'sma': None, 'sell_point': 20.0}]) == (False, False)
+        assert self.strategy.decide([]) == (False, False)
+
+    def test_evaluate_over_time(self):
+        buy, sell = self.strategy.evaluate({'close': np.array([1.0, 2.0, 3.0]), 'sma': 2.0, 'sell_point': 2.5})
+        assert buy.tolist() == [False, False, True]
+        assert sell.tolist() == [True, False, False]
@@ -0,0 +1,59 @@
+#
+# test_trade.py
+#
+# Pytest tests on the trade module
+
+import trade
+import datetime
+import calendar
+import dateutil.parser
+
+
+class TestDecoder(object):
+    def setup_class(self):
+        self.match = {"type": "match", "trade_id": 10, "sequence": 50, "side": "sell",
+                      "size": "5.23512", "price": "400.23", "product_id": "BTC-USD",
+                      "time": "2014-11-07T08:19:27.028459Z"}
+        self.heartbeat = {"type": "heartbeat", "sequence": 90, "last_trade_id": 20,
+                          "product_id": "BTC-USD", "time": "2014-11-07T08:19:28.464459Z"}
+
+    def test_parse_iso_time_matches_dateutil(self):
+        for isotime in ["2014-11-07T08:19:27.028459Z", "2020-02-29T23:59:59Z",
+                        "2021-04-30T20:14:34.1Z", "2021-04-30T20:14:34.123+00:00"]:
+            expected = dateutil.parser.parse(isotime)
+            assert trade.parse_iso_time(isotime) == (calendar.timegm(expected.utctimetuple()), expected.microsecond)
+
+    def test_decode_match(self):
+        event = trade.decode_message(self.match)
+
+        assert isinstance(event, trade.Trade)
+        assert event.type == 'match'
+        assert event.product_id == 'BTC-USD'
+        assert event.sequence == 50
+        assert event.side == 'sell'
+        assert event.price == 400.23
+        assert event.size == 5.23512
+        assert event.epoch == 1415348367
+        assert event.usec == 28459
+        assert event.time == datetime.datetime(2014, 11, 7, 8, 19, 27, 28459, tzinfo=datetime.timezone.utc)
+        assert event.get('type') == 'match'
+
+    def test_decode_heartbeat(self):
+        event = trade.decode_message(self.heartbeat)
+
+        assert isinstance(event, trade.Heartbeat)
+        assert event.last_trade_id == 20
+        assert event.timestamp == 1415348368.464459
+
+    def test_other_messages_pass_through(self):
+        msg = {"type": "open", "sequence": 10, "product_id": "BTC-USD"}
+        assert trade.decode_message(msg) is msg
+
+    def test_derive(self):
+        event = trade.decode_message(self.match)
+        derived = event.derive('LTC-ETH', 0.05, 1.5)
+
+        assert derived.product_id == 'LTC-ETH'
+        assert derived.price == 0.05
+        assert derived.size == 1.5
+        assert derived.epoch == event.epoch
@@ -0,0 +1,13 @@
+from .Trade import Trade
+from .Heartbeat import Heartbeat
+
+
+def decode_message(msg):
+    # Matches and heartbeats are decoded once into typed events, everything
+    # else (order book updates, subscriptions) is passed through untouched
+    msg_type = msg.get('type')
+    if msg_type == 'match':
+        return Trade(msg)
+    elif msg_type == 'heartbeat':
+        return Heartbeat(msg)
+    return msg
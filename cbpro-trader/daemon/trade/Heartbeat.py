@@ -0,0 +1,20 @@
+from .isotime import parse_iso_time
+
+
+class Heartbeat:
+    __slots__ = ('product_id', 'sequence', 'last_trade_id', 'epoch', 'usec', 'raw')
+    type = 'heartbeat'
+
+    def __init__(self, msg):
+        self.product_id = msg.get('product_id')
+        self.sequence = msg.get('sequence')
+        self.last_trade_id = msg.get('last_trade_id')
+        self.epoch, self.usec = parse_iso_time(msg.get('time'))
+        self.raw = msg
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    @property
+    def timestamp(self):
+        return self.epoch + self.usec / 1000000
@@ -1,16 +1,53 @@
-import dateutil.parser
+import datetime
 import logging
+from .isotime import parse_iso_time
+
+logger = logging.getLogger('trader-logger')
 
 
 class Trade:
+    __slots__ = ('product_id', 'sequence', 'trade_id', 'side', 'price', 'size', 'epoch', 'usec', 'raw')
+    type = 'match'
+
     def __init__(self, msg):
-        self.seq = int(msg.get('sequence'))
+        self.product_id = msg.get('product_id')
+        self.sequence = int(msg.get('sequence'))
         self.trade_id = int(msg.get('trade_id'))
-        self.time = dateutil.parser.parse(msg.get('time'))
+        self.side = msg.get('side')
         self.price = float(msg.get('price'))
-        self.volume = float(msg.get('size'))
-        self.logger = logging.getLogger('trader-logger')
+        self.size = float(msg.get('size'))
+        self.epoch, self.usec = parse_iso_time(msg.get('time'))
+        # Original message, for consumers that need the remaining fields
+        self.raw = msg
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    @property
+    def volume(self):
+        return self.size
+
+    @property
+    def timestamp(self):
+        return self.epoch + self.usec / 1000000
+
+    @property
+    def time(self):
+        return datetime.datetime.fromtimestamp(self.epoch, datetime.timezone.utc).replace(microsecond=self.usec)
+
+    def derive(self, product_id, price, size):
+        # Copy of this trade for a synthetic product, sharing time and sequence
+        derived = Trade.__new__(Trade)
+        derived.product_id = product_id
+        derived.sequence = self.sequence
+        derived.trade_id = self.trade_id
+        derived.side = self.side
+        derived.price = price
+        derived.size = size
+        derived.epoch = self.epoch
+        derived.usec = self.usec
+        derived.raw = self.raw
+        return derived
 
     def print_trade(self):
-        self.logger.debug("[TRADE] Trade ID: %d Price: %f Volume: %f" %
-                          (self.trade_id, self.price, self.volume))
\ No newline at end of file
+        logger.debug("[TRADE] Trade ID: %d Price: %f Volume: %f", self.trade_id, self.price, self.volume)
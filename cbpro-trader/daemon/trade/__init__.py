@@ -1 +1,4 @@
-from .Trade import Trade
\ No newline at end of file
+from .Trade import Trade
+from .Heartbeat import Heartbeat
+from .isotime import parse_iso_time
+from .Decoder import decode_message
\ No newline at end of file
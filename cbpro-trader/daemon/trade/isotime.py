@@ -0,0 +1,30 @@
+import calendar
+import datetime
+import dateutil.parser
+
+# Epoch of midnight for recently seen dates, the feed only spans a few days
+_day_epochs = {}
+
+
+def parse_iso_time(isotime):
+    # Returns (epoch seconds, microseconds) as ints.
+    # Fast path for the fixed format used by the websocket feed, e.g.
+    # 2018-11-29T05:21:06.123456Z or 2018-11-29T05:21:06Z
+    if len(isotime) >= 20 and isotime[10] == 'T' and isotime[-1] == 'Z' and isotime[19] in '.Z':
+        day = isotime[:10]
+        day_epoch = _day_epochs.get(day)
+        if day_epoch is None:
+            if len(_day_epochs) > 64:
+                _day_epochs.clear()
+            day_epoch = calendar.timegm((int(day[:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0))
+            _day_epochs[day] = day_epoch
+        epoch = day_epoch + int(isotime[11:13]) * 3600 + int(isotime[14:16]) * 60 + int(isotime[17:19])
+        if isotime[19] == '.':
+            return epoch, int((isotime[20:-1] + '000000')[:6])
+        return epoch, 0
+
+    parsed = dateutil.parser.parse(isotime)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    epoch = calendar.timegm(parsed.utctimetuple())
+    return epoch, parsed.microsecond
@@ -37,6 +37,11 @@ export const updateCandlesticks = candlesticks => ({
     candlesticks
 })
 
+export const updateCandle = candle => ({
+    type: 'UPDATE_CANDLE',
+    candle
+})
+
 export const updateIndicators = indicators => ({
     type: 'UPDATE_INDICATORS',
     indicators
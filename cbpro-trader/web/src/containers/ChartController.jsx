@@ -1,6 +1,6 @@
 import React, { Component } from 'react'
 import { connect } from 'react-redux'
-import { addPeriod, changeActivePeriod, updateCandlesticks, updateIndicators, updateFlags, updateOrders, updateBalances } from '../actions'
+import { addPeriod, changeActivePeriod, updateCandlesticks, updateCandle, updateIndicators, updateFlags, updateOrders, updateBalances } from '../actions'
 import CollapseButton from '../components/CollapseButton'
 import SidebarContainer from '../containers/SidebarContainer'
 import ChartContainer from '../containers/ChartContainer'
@@ -8,11 +8,13 @@ import ChartContainer from '../containers/ChartContainer'
 class ChartController extends Component {
     constructor() {
         super();
-        this.SERVER = process.env.REACT_APP_SERVER || ''; 
+        this.SERVER = process.env.REACT_APP_SERVER || '';
 
         this.state = {sidebarCollapsed: false};
+        // Latest indicators of every period, merged from the stream
+        this.indicators = {};
     }
-    
+
     componentDidMount() {
         fetch(this.SERVER + "/periods/")
             .then(response => {
@@ -23,14 +25,23 @@ class ChartController extends Component {
                     (idx === 0) && this.props.changeActivePeriod(period_name);
                     return this.props.addPeriod(period_name);
                 })
-                
+
             })
-            .then(
-                setInterval(() => this.update(), 1000)
-            )
+            .then(() => this.subscribe())
+    }
+
+    componentDidUpdate(prevProps) {
+        if (this.props.active_period !== prevProps.active_period) {
+            this.fetchCandlesticks()
+            this.props.updateIndicators(this.indicators[this.props.active_period] || {})
+        }
+    }
+
+    componentWillUnmount() {
+        this.events && this.events.close()
     }
 
-    update() {
+    fetchCandlesticks() {
         if (this.props.active_period) {
             fetch(this.SERVER + "/periods/" + this.props.active_period)
                 .then(response => {
@@ -39,51 +50,48 @@ class ChartController extends Component {
                 .then(myJson => {
                     this.props.updateCandlesticks(myJson)
                 })
-            if (this.props.primary_section === "balances") {
-                fetch(this.SERVER + "/balances/")
-                    .then(response => {
-                        return response.json()
-                    })
-                    .then(myJson => {
-                        this.props.updateBalances(myJson)
-                    })
-            } 
-            switch(this.props.secondary_section) {
-                case "details":
-                    fetch(this.SERVER + "/indicators/" + this.props.active_period)
-                        .then(response => {
-                            return response.json()
-                        })
-                        .then(myJson => {
-                            this.props.updateIndicators(myJson)
-                        })
-                    break;
-                case "flags":
-                    fetch(this.SERVER + "/flags/")
-                        .then(response => {
-                            return response.json()
-                        })
-                        .then(myJson => {
-                            this.props.updateFlags(myJson)
-                        })
-                    break;
-                case "orders":
-                    fetch(this.SERVER + "/orders/")
-                        .then(response => {
-                            return response.json()
-                        })
-                        .then(myJson => {
-                            this.props.updateOrders(myJson)
-                        })
-                    break;
-                default:
-                    break;
-            }
         }
     }
 
+    subscribe() {
+        // The server sends a snapshot, then only what changed. EventSource
+        // reconnects by itself and resumes from the last event it saw.
+        this.events = new EventSource(this.SERVER + "/stream/")
+        this.events.addEventListener('snapshot', event => {
+            const snapshot = JSON.parse(event.data)
+            Object.keys(snapshot.periods || {}).forEach(period_name => {
+                this.indicators[period_name] = snapshot.periods[period_name].indicators
+            })
+            this.props.updateIndicators(this.indicators[this.props.active_period] || {})
+            snapshot.flags && this.props.updateFlags(snapshot.flags)
+            snapshot.balances && this.props.updateBalances(snapshot.balances)
+            snapshot.orders && this.props.updateOrders(snapshot.orders)
+            this.fetchCandlesticks()
+        })
+        this.events.addEventListener('candle', event => {
+            const data = JSON.parse(event.data)
+            if (data.period === this.props.active_period) {
+                this.props.updateCandle(data.candle)
+            }
+        })
+        this.events.addEventListener('reset', event => {
+            if (JSON.parse(event.data).period === this.props.active_period) {
+                this.fetchCandlesticks()
+            }
+        })
+        this.events.addEventListener('indicators', event => {
+            const data = JSON.parse(event.data)
+            this.indicators[data.period] = {...this.indicators[data.period], ...data.indicators}
+            if (data.period === this.props.active_period) {
+                this.props.updateIndicators(this.indicators[data.period])
+            }
+        })
+        this.events.addEventListener('flags', event => this.props.updateFlags(JSON.parse(event.data)))
+        this.events.addEventListener('balances', event => this.props.updateBalances(JSON.parse(event.data)))
+        this.events.addEventListener('orders', event => this.props.updateOrders(JSON.parse(event.data)))
+    }
+
     render() {
-        this.update();
         return (
             <div className={this.state.sidebarCollapsed ? "collapsed" : ""} id="chart-controller">
                 <ChartContainer />
@@ -99,15 +107,16 @@ const mapStateToProps = state => ({
     primary_section: state.sidebar.primary_section,
     secondary_section: state.sidebar.secondary_section
   })
-  
+
 const mapDispatchToProps = dispatch => ({
     addPeriod: period_name => dispatch(addPeriod(period_name)),
     changeActivePeriod: period_name => dispatch(changeActivePeriod(period_name)),
     updateCandlesticks: candlesticks => dispatch(updateCandlesticks(candlesticks)),
+    updateCandle: candle => dispatch(updateCandle(candle)),
     updateIndicators: indicators => dispatch(updateIndicators(indicators)),
     updateFlags: flags => dispatch(updateFlags(flags)),
     updateOrders: orders => dispatch(updateOrders(orders)),
     updateBalances: balances => dispatch(updateBalances(balances))
 })
 
-export default connect(mapStateToProps, mapDispatchToProps)(ChartController);
\ No newline at end of file
+export default connect(mapStateToProps, mapDispatchToProps)(ChartController);
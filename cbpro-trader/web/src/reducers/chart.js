@@ -20,6 +20,24 @@ const chart = (state = {period_list: [], candlesticks: [], indicators: []}, acti
                 ...state,
                 candlesticks: action.candlesticks
             }
+        case 'UPDATE_CANDLE': {
+            // Replaces the live candle, or appends when a new candle started
+            const candlesticks = state.candlesticks
+            const last = candlesticks[candlesticks.length - 1]
+            if (last && last.time === action.candle.time) {
+                return {
+                    ...state,
+                    candlesticks: [...candlesticks.slice(0, -1), action.candle]
+                }
+            }
+            if (last && last.time > action.candle.time) {
+                return state
+            }
+            return {
+                ...state,
+                candlesticks: [...candlesticks, action.candle]
+            }
+        }
         default:
             return state
     }